@@ -16,8 +16,10 @@
 
 
 -- get_schema_drop
+DROP table "names_fts";
 DROP table "names_to_taxonconcepts";
 DROP table "tc_relationships";
+DROP table "tc_ancestry";
 DROP table "taxon_concepts";
 DROP table "taxonomies";
 DROP table "name_spellings";
@@ -55,7 +57,10 @@ CREATE TABLE "citations" (
 CREATE TABLE "names" (
    name_id     integer PRIMARY KEY	,
    namestr     text			,
-   citation_id integer REFERENCES citations (citation_id) ON DELETE SET NULL
+   citation_id integer REFERENCES citations (citation_id) ON DELETE SET NULL,
+   namestr_soundex        text	,
+   namestr_dmetaphone     text	,
+   namestr_dmetaphone_alt text
 )   ;
 CREATE TABLE "name_spellings" (
    name_id integer REFERENCES names (name_id) ON DELETE CASCADE,
@@ -103,6 +108,16 @@ CREATE TABLE "names_to_taxonconcepts" (
    authordisp_prefix text DEFAULT '' ,
    authordisp_postfix text DEFAULT ''
 )   ;
+-- A closure table for the taxon concept tree.  Contains one row for every (ancestor,
+-- descendant) pair of taxon concepts, where distance is the number of parent links
+-- between them.  Each taxon concept is also paired with itself at distance 0.  This
+-- allows all ancestors or all descendants of a taxon concept to be retrieved with a
+-- single indexed query.
+CREATE TABLE "tc_ancestry" (
+   ancestor_id   integer REFERENCES taxon_concepts (tc_id) ON DELETE CASCADE,
+   descendant_id integer REFERENCES taxon_concepts (tc_id) ON DELETE CASCADE,
+   distance      integer
+)   ;
 CREATE TABLE "tc_relationships" (
    master_tc_id integer REFERENCES taxon_concepts (tc_id) ON DELETE CASCADE,
    alt_tc_id integer REFERENCES taxon_concepts (tc_id) ON DELETE CASCADE   ,
@@ -139,9 +154,12 @@ INSERT INTO citations
 INSERT INTO taxon_concepts
     (tc_id, parent_id, taxonomy_id, rank_id, depth, sort_order)
     VALUES (1, 0, 1, 0, 0, 0);
+INSERT INTO tc_ancestry
+    (ancestor_id, descendant_id, distance)
+    VALUES (1, 1, 0);
 INSERT INTO names
-    (name_id, namestr, citation_id)
-    VALUES (1, 'Eukaryota', 2);
+    (name_id, namestr, citation_id, namestr_soundex, namestr_dmetaphone, namestr_dmetaphone_alt)
+    VALUES (1, 'Eukaryota', 2, 'E263', 'AKRT', 'AKRT');
 INSERT INTO names_to_taxonconcepts
     (tc_id, name_id, validity, authordisp_prefix, authordisp_postfix)
     VALUES (1, 1, 'valid', '', '');
@@ -160,3 +178,51 @@ CREATE INDEX names_to_taxonconcepts_validity_idx ON names_to_taxonconcepts (vali
 CREATE INDEX names_to_taxonconcepts_tcid_nameid_idx ON names_to_taxonconcepts (tc_id, name_id);
 CREATE INDEX names_to_taxonconcepts_nameid_idx ON names_to_taxonconcepts (name_id);
 
+-- Create indexes for finding the children of a taxon concept and for finding taxon
+-- concepts by taxonomy and rank.
+CREATE INDEX taxon_concepts_parentid_taxoid_idx ON taxon_concepts (parent_id, taxonomy_id);
+CREATE INDEX taxon_concepts_taxoid_rankid_idx ON taxon_concepts (taxonomy_id, rank_id);
+
+-- Create indexes for the columns used to match existing citations.
+CREATE INDEX citations_doi_idx ON citations (doi);
+CREATE INDEX citations_url_idx ON citations (url);
+CREATE INDEX citations_citationstr_idx ON citations (citationstr);
+
+-- Create indexes for retrieving all ancestors or all descendants of a taxon concept.
+CREATE INDEX tc_ancestry_ancestor_idx ON tc_ancestry (ancestor_id, distance);
+CREATE INDEX tc_ancestry_descendant_idx ON tc_ancestry (descendant_id, distance);
+
+-- Create a full-text index of all name strings for name searches, along with the
+-- triggers that keep it in sync with the "names" table.  The index uses the trigram
+-- tokenizer, so it supports substring and prefix searches.  This block requires SQLite
+-- 3.34 or later, compiled with FTS5.  With older versions of SQLite, leave it out; name
+-- searches then use the "names" table directly, and the taxonomy library creates the
+-- index the first time the database is opened with a version of SQLite that supports
+-- it.
+CREATE VIRTUAL TABLE names_fts
+    USING fts5(namestr, content='names', content_rowid='name_id', tokenize='trigram');
+CREATE TRIGGER names_fts_insert AFTER INSERT ON names BEGIN
+    INSERT INTO names_fts (rowid, namestr) VALUES (new.name_id, new.namestr);
+END;
+CREATE TRIGGER names_fts_delete AFTER DELETE ON names BEGIN
+    INSERT INTO names_fts (names_fts, rowid, namestr) VALUES ('delete', old.name_id, old.namestr);
+END;
+CREATE TRIGGER names_fts_update AFTER UPDATE OF name_id, namestr ON names BEGIN
+    INSERT INTO names_fts (names_fts, rowid, namestr) VALUES ('delete', old.name_id, old.namestr);
+    INSERT INTO names_fts (rowid, namestr) VALUES (new.name_id, new.namestr);
+END;
+INSERT INTO names_fts (names_fts) VALUES ('rebuild');
+
+-- Create indexes of the Soundex and Double Metaphone keys of the name strings.  The
+-- keys are calculated by the taxonomy library (see utilities/taxolib/namematch.py)
+-- when it adds names to the database, so names that are added by other tools will
+-- not have keys unless the tools also calculate them.
+CREATE INDEX names_soundex_idx ON names (namestr_soundex);
+CREATE INDEX names_dmetaphone_idx ON names (namestr_dmetaphone);
+CREATE INDEX names_dmetaphone_alt_idx ON names (namestr_dmetaphone_alt);
+
+
+-- Record the schema version.  This must match the number of schema updates defined
+-- in utilities/taxolib/taxodatabase.py, which are used to upgrade existing databases.
+PRAGMA user_version = 4;
+
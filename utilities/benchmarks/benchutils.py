@@ -0,0 +1,271 @@
+"""
+Common code for the benchmark programs: creating taxonomy databases from the schema
+file, generating large synthetic taxonomies, and timing code.
+"""
+
+import os.path as path
+import sys
+import gc
+import types
+import sqlite3
+import csv
+import timeit
+# A hack for now to get the local package to import.
+sys.path.append(path.join(path.dirname(path.abspath(__file__)), '..'))
+from taxolib import namematch
+
+
+# The location of the schema directory, relative to this file.
+SCHEMA_DIR = path.join(path.dirname(path.abspath(__file__)), '..', '..', 'schema')
+
+# Rank IDs used for the synthetic taxonomies (from the "animals" rank system).
+CLASS_RANK = 50
+ORDER_RANK = 70
+FAMILY_RANK = 100
+GENUS_RANK = 120
+SPECIES_RANK = 130
+
+
+class BenchTimer:
+    """
+    A minimal wall-clock timer that can be used as a context manager.  The elapsed
+    time (in seconds) of the most recently timed block is available as the value of
+    the "elapsed" attribute.
+    """
+    def __init__(self):
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self.stime = timeit.default_timer()
+
+        return self
+
+    def __exit__(self, etype, evalue, etraceback):
+        self.elapsed = timeit.default_timer() - self.stime
+
+
+def deepSizeOf(root, exclude=()):
+    """
+    Returns the total size, in bytes, of an object and all objects that are reachable
+    from it, counting each object once.  Classes, modules, and functions are not
+    counted, nor are any objects that are reachable only through the objects in
+    exclude (for example, a shared RankTable).
+    """
+    seen = set(id(obj) for obj in exclude)
+    skiptypes = (type, types.ClassType, types.ModuleType, types.FunctionType)
+
+    total = 0
+    stack = [root]
+    while len(stack) > 0:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, skiptypes):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        stack.extend(gc.get_referents(obj))
+
+    return total
+
+def createDatabase(dbfile):
+    """
+    Creates a new taxonomy database by running the SQLite schema creation script.
+    The ".import" commands in the script, which normally must be run from the SQLite
+    command shell, are emulated.  Returns a cursor for the new database.
+    """
+    conn = sqlite3.connect(dbfile)
+    namematch.registerFunctions(conn)
+    dbcur = conn.cursor()
+
+    with open(path.join(SCHEMA_DIR, 'create_tables-sqlite.sql')) as fin:
+        sqlstr = fin.read().decode('utf-8')
+
+    # Split the script at each shell command, run the SQL between shell commands, and
+    # emulate the ".import" commands.
+    sqlbuf = []
+    for line in sqlstr.split('\n'):
+        if line.startswith('DROP '):
+            continue
+        elif line.startswith('.'):
+            dbcur.executescript('\n'.join(sqlbuf))
+            sqlbuf = []
+            parts = line.split()
+            if parts[0] == '.import':
+                _importCSV(dbcur, path.join(SCHEMA_DIR, '..', parts[1]), parts[2])
+        else:
+            sqlbuf.append(line)
+    dbcur.executescript('\n'.join(sqlbuf))
+    conn.commit()
+
+    return dbcur
+
+def _importCSV(dbcur, csvfile, tablename):
+    with open(csvfile, 'rU') as fin:
+        rows = [row for row in csv.reader(fin)]
+
+    query = 'INSERT INTO {0} VALUES ({1})'.format(tablename, ', '.join(['?'] * len(rows[0])))
+    dbcur.executemany(query, rows)
+
+def _getNextID(dbcur, tablename, colname):
+    dbcur.execute('SELECT max({0}) FROM {1}'.format(colname, tablename))
+    res = dbcur.fetchone()
+
+    return 1 if res[0] == None else res[0] + 1
+
+# Adds the tc_ancestry rows for a new taxon concept given (tc_id, tc_id, tc_id, parent_id).
+_ANCESTRY_QUERY = """INSERT INTO tc_ancestry (ancestor_id, descendant_id, distance)
+    SELECT ?, ?, 0
+    UNION ALL
+    SELECT ancestor_id, ?, distance + 1 FROM tc_ancestry WHERE descendant_id=?"""
+
+def addBackboneTaxon(dbcur, parent_id, rank_id, depth, namestr):
+    """
+    Adds a single taxon concept and its name to the backbone taxonomy.  Returns the
+    new tc_id.
+    """
+    dbcur.execute("""INSERT INTO taxon_concepts (parent_id, taxonomy_id, rank_id, depth)
+        VALUES (?, 1, ?, ?)""", (parent_id, rank_id, depth))
+    tc_id = dbcur.lastrowid
+    dbcur.execute(_ANCESTRY_QUERY, (tc_id, tc_id, tc_id, parent_id))
+    dbcur.execute("""INSERT INTO names (namestr, namestr_soundex, namestr_dmetaphone,
+        namestr_dmetaphone_alt) VALUES (?, ?, ?, ?)""", (namestr,) + namematch.getPhoneticKeys(namestr))
+    dbcur.execute("""INSERT INTO names_to_taxonconcepts (tc_id, name_id, validity)
+        VALUES (?, ?, 'valid')""", (tc_id, dbcur.lastrowid))
+    dbcur.connection.commit()
+
+    return tc_id
+
+def generateTaxonomy(dbcur, taxonomy_id, numtaxa, root_tc_id, rootdepth, prefix='',
+        branching=(40, 20, 25), numcitations=5000):
+    """
+    Generates a synthetic taxonomy with approximately numtaxa taxon concepts and adds it
+    to the database.  The taxonomy consists of orders, families, genera, and species,
+    attached as children of the existing taxon concept root_tc_id.  The first three
+    values of branching give the number of orders, families per order, and genera per
+    family; the number of species per genus is chosen to reach numtaxa.  Species names
+    are given author citations drawn from a pool of numcitations citations.  The
+    optional prefix is prepended to all higher taxa names.
+    """
+    norders, nfamilies, ngenera = branching
+    nhigher = norders * (1 + nfamilies * (1 + ngenera))
+    nspecies = max(1, (numtaxa - nhigher) / (norders * nfamilies * ngenera))
+
+    dbcur.execute("""INSERT INTO taxonomies (taxonomy_id, name, ismaster, root_tc_id, citation_id)
+        VALUES (?, ?, 0, ?, 1)""", (taxonomy_id, 'Benchmark taxonomy ' + str(taxonomy_id), root_tc_id))
+
+    tc_id = _getNextID(dbcur, 'taxon_concepts', 'tc_id')
+    name_id = _getNextID(dbcur, 'names', 'name_id')
+    cite_id = _getNextID(dbcur, 'citations', 'citation_id')
+
+    # Create the citation pool.
+    citerows = []
+    for cnt in range(numcitations):
+        authordisp = 'Author{0} {1}'.format(cnt, 1750 + cnt % 250)
+        citerows.append((cite_id + cnt, authordisp + '. A synthetic publication.', authordisp))
+    dbcur.executemany("""INSERT INTO citations (citation_id, citationstr, url, doi, authordisplay)
+        VALUES (?, ?, '', '', ?)""", citerows)
+
+    tcrows = []
+    namerows = []
+    nttcrows = []
+
+    def addTaxon(parent_id, rank_id, depth, namestr, citation_id=None):
+        tcrows.append((tc_id + len(tcrows), parent_id, taxonomy_id, rank_id, depth))
+        namerows.append((name_id + len(namerows), namestr, citation_id) + namematch.getPhoneticKeys(namestr))
+        nttcrows.append((tcrows[-1][0], namerows[-1][0]))
+
+        return tcrows[-1][0]
+
+    def flush():
+        dbcur.executemany("""INSERT INTO taxon_concepts (tc_id, parent_id, taxonomy_id, rank_id, depth)
+            VALUES (?, ?, ?, ?, ?)""", tcrows)
+        dbcur.executemany(_ANCESTRY_QUERY, [(row[0], row[0], row[0], row[1]) for row in tcrows])
+        dbcur.executemany("""INSERT INTO names (name_id, namestr, citation_id, namestr_soundex,
+            namestr_dmetaphone, namestr_dmetaphone_alt) VALUES (?, ?, ?, ?, ?, ?)""", namerows)
+        dbcur.executemany("""INSERT INTO names_to_taxonconcepts (tc_id, name_id, validity)
+            VALUES (?, ?, 'valid')""", nttcrows)
+
+    cnt = 0
+    for ocnt in range(norders):
+        o_id = addTaxon(root_tc_id, ORDER_RANK, rootdepth + 1, '{0}Order{1}'.format(prefix, ocnt))
+        for fcnt in range(nfamilies):
+            f_id = addTaxon(o_id, FAMILY_RANK, rootdepth + 2,
+                    '{0}Family{1}o{2}'.format(prefix, fcnt, ocnt))
+            for gcnt in range(ngenera):
+                gname = '{0}Genus{1}f{2}o{3}'.format(prefix, gcnt, fcnt, ocnt)
+                g_id = addTaxon(f_id, GENUS_RANK, rootdepth + 3, gname)
+                for scnt in range(nspecies):
+                    addTaxon(g_id, SPECIES_RANK, rootdepth + 4, '{0} species{1}'.format(gname, scnt),
+                            cite_id + cnt % numcitations)
+                    cnt += 1
+
+        # Write the rows in batches to limit memory use.
+        flush()
+        tc_id += len(tcrows)
+        name_id += len(namerows)
+        del tcrows[:], namerows[:], nttcrows[:]
+
+    dbcur.connection.commit()
+
+    return cnt + nhigher
+
+def generateCSVTaxonomy(csvfile, conffile, numrows, branching=(10, 20, 50), taxonomy_id=2):
+    """
+    Generates a synthetic CSV taxonomy file with numrows species rows, along with a
+    taxonomy configuration file for parsing it.  The taxonomy consists of orders,
+    families, genera, and species, rooted at the class Aves.  The three values of
+    branching give the number of orders, families per order, and genera per family; the
+    number of species per genus is chosen to reach numrows.  Genus names are parsed from
+    the species names, and every species has an author string and every fifth species
+    has a synonym.
+    """
+    norders, nfamilies, ngenera = branching
+    nspecies = max(1, numrows / (norders * nfamilies * ngenera))
+
+    with open(csvfile, 'w') as fout:
+        writer = csv.writer(fout)
+        writer.writerow(('Order', 'Family', 'Species', 'Author', 'Synonyms'))
+        cnt = 0
+        for scnt in range(nspecies + 1):
+            for ocnt in range(norders):
+                for fcnt in range(nfamilies):
+                    for gcnt in range(ngenera):
+                        if cnt >= numrows:
+                            break
+                        gname = 'Genus{0}f{1}o{2}'.format(gcnt, fcnt, ocnt)
+                        synonym = 'Altgenus{0} species{1}'.format(gcnt, scnt) if scnt % 5 == 0 else ''
+                        writer.writerow(('Order' + str(ocnt), 'Family{0}o{1}'.format(fcnt, ocnt),
+                            '{0} species{1}'.format(gname, scnt),
+                            'Author{0}, {1}'.format(cnt % 1000, 1750 + cnt % 250), synonym))
+                        cnt += 1
+
+    with open(conffile, 'w') as fout:
+        fout.write("""[main]
+inputcsv = {0}
+ranksys = 1
+
+[taxonomy]
+taxonomyid = {1}
+name = Synthetic benchmark taxonomy
+ismaster = False
+
+[citation]
+citationstr = A synthetic taxonomy for benchmarking.
+authordisplay = Benchmark
+nameauthorcol = Author
+
+[synonyms]
+colname = Synonyms
+
+[root]
+rank = Class
+name = Aves
+taxonomyid = 1
+
+[rank_mappings]
+Order = Order
+Family = Family
+_ParseGenus = Genus
+Species = Species
+""".format(path.abspath(csvfile), taxonomy_id))
+
+    return cnt
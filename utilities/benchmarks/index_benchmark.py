@@ -0,0 +1,135 @@
+#!/usr/bin/python
+
+# Measures taxonomy load and persist times on a large, generated taxonomy database
+# before and after the schema update that adds indexes for parent/child lookups,
+# taxon concept lookups, and citation matching (schema version 1).
+
+import sys
+import os
+import sqlite3
+import benchutils
+from argparse import ArgumentParser
+# A hack for now to get the local package to import.
+sys.path.append('../')
+from taxolib import taxodatabase
+from taxolib import namematch
+from taxolib.taxacomponents import RankTable, Taxon, Citation
+from taxolib.taxonomy import Taxonomy
+
+
+argp = ArgumentParser(description='Benchmarks taxonomy load and persist operations on a generated \
+database before and after adding the indexes from schema version 1.  The database is generated the \
+first time the program is run and re-used afterwards.')
+argp.add_argument('-f', '--dbfile', help='the benchmark database file ("index_benchmark.sqlite" by default)')
+argp.add_argument('-n', '--numtaxa', type=int, help='the number of taxon concepts to generate (1,000,000 by default)')
+argp.add_argument('-l', '--loadtaxa', type=int, help='the number of taxa to load with the per-taxon loader (200 by default)')
+argp.add_argument('-p', '--persisttaxa', type=int, help='the number of new taxa to persist (500 by default)')
+argp.set_defaults(dbfile='index_benchmark.sqlite', numtaxa=1000000, loadtaxa=200, persisttaxa=500)
+args = argp.parse_args()
+
+# The indexes added by schema version 1.
+V1_INDEXES = ['taxon_concepts_parentid_taxoid_idx', 'taxon_concepts_taxoid_rankid_idx',
+        'citations_doi_idx', 'citations_url_idx', 'citations_citationstr_idx']
+
+timer = benchutils.BenchTimer()
+
+if not(os.path.exists(args.dbfile)):
+    print 'Generating a taxonomy database with', args.numtaxa, 'taxon concepts...'
+    with timer:
+        dbcur = benchutils.createDatabase(args.dbfile)
+        an_id = benchutils.addBackboneTaxon(dbcur, 1, 10, 1, 'Animalia')
+        ch_id = benchutils.addBackboneTaxon(dbcur, an_id, 30, 2, 'Chordata')
+        av_id = benchutils.addBackboneTaxon(dbcur, ch_id, 50, 3, 'Aves')
+        # Use one citation for every 10 species so that citation lookups are realistic.
+        total = benchutils.generateTaxonomy(dbcur, 2, args.numtaxa, av_id, 3,
+                numcitations=max(args.numtaxa / 10, 1))
+    print 'Generated', total, 'taxon concepts in', timer.elapsed, 's.\n'
+
+# Connect directly rather than with taxodatabase.getDBCursor() so that the schema is
+# not automatically upgraded.
+conn = sqlite3.connect(args.dbfile)
+namematch.registerFunctions(conn)
+dbcur = conn.cursor()
+
+# Make sure all other schema updates have been applied, then remove the version 1
+# indexes to get the "before" state.
+taxodatabase.upgradeSchema(dbcur)
+for indexname in V1_INDEXES:
+    dbcur.execute('DROP INDEX IF EXISTS ' + indexname)
+dbcur.connection.commit()
+
+ranktable = RankTable.getCached(dbcur)
+
+# Each run persists a new taxonomy with a different taxonomy ID.
+dbcur.execute('SELECT max(taxonomy_id) FROM taxonomies')
+next_taxo_id = dbcur.fetchone()[0] + 1
+
+# Get a sample of existing citation strings so that persisted names must be matched
+# against the citations table.
+dbcur.execute("""SELECT citationstr, authordisplay FROM citations
+    WHERE citationstr!='' ORDER BY citation_id DESC LIMIT ?""", (args.persisttaxa,))
+sample_cites = dbcur.fetchall()
+
+def buildNewTree(taxonomy_id):
+    """
+    Builds a new tree of Taxon objects rooted at the existing class Aves.
+    """
+    root = Taxon(taxonomy_id, benchutils.CLASS_RANK, ranktable, 3, 'Aves', 1, True)
+    order = root.createChild(benchutils.ORDER_RANK, 'NewOrder' + str(taxonomy_id))
+    family = order.createChild(benchutils.FAMILY_RANK, 'NewFamily' + str(taxonomy_id))
+    genus = None
+    for cnt in range(args.persisttaxa):
+        if cnt % 20 == 0:
+            genus = family.createChild(benchutils.GENUS_RANK, 'Newgenus{0}t{1}'.format(cnt, taxonomy_id))
+        species = genus.createChild(benchutils.SPECIES_RANK, '{0} species{1}'.format(genus.name.namestr, cnt))
+        citestr, authordisp = sample_cites[cnt % len(sample_cites)]
+        species.name.setCitation(Citation(citestr, authordisp))
+
+    return root
+
+def runBenchmarks():
+    """
+    Runs all benchmark operations and returns a list of (description, time) tuples.
+    """
+    global next_taxo_id
+    results = []
+
+    with timer:
+        taxonomy = Taxonomy(2)
+        taxonomy.loadFromDB(dbcur, args.loadtaxa)
+    results.append(('Per-taxon load of ' + str(args.loadtaxa) + ' taxa', timer.elapsed))
+
+    with timer:
+        taxonomy = Taxonomy(2)
+        taxonomy.loadFromDB(dbcur, maxdepth=2, bulk=True)
+    results.append(('Bulk load of orders and families', timer.elapsed))
+
+    with timer:
+        for child in taxonomy.roottaxon.children[0].children:
+            child.existsInDB(dbcur)
+    results.append(('existsInDB() for ' + str(len(taxonomy.roottaxon.children[0].children))
+        + ' families', timer.elapsed))
+
+    newroot = buildNewTree(next_taxo_id)
+    with timer:
+        newroot.persist(dbcur, 0)
+    results.append(('Per-taxon persist of ' + str(args.persisttaxa) + ' new species', timer.elapsed))
+    next_taxo_id += 1
+
+    return results
+
+print 'Running benchmarks without the version 1 indexes...'
+before = runBenchmarks()
+
+print 'Re-creating the version 1 indexes...'
+with timer:
+    dbcur.executescript(taxodatabase.SCHEMA_UPDATES[0])
+print 'Index creation took', timer.elapsed, 's.'
+
+print 'Running benchmarks with the version 1 indexes...'
+after = runBenchmarks()
+
+print '\n{0:<45}{1:>12}{2:>12}{3:>10}'.format('Operation', 'Before (s)', 'After (s)', 'Speedup')
+for (desc, btime), (desc, atime) in zip(before, after):
+    print '{0:<45}{1:>12.4f}{2:>12.4f}{3:>9.1f}x'.format(desc, btime, atime, btime / max(atime, 1e-9))
+print
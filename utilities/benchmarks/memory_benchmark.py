@@ -0,0 +1,79 @@
+#!/usr/bin/python
+
+# Measures the memory used by trees of Taxon objects loaded from a generated taxonomy
+# database and parsed from a generated CSV taxonomy file.
+
+import sys
+import os
+import benchutils
+from argparse import ArgumentParser
+# A hack for now to get the local package to import.
+sys.path.append('../')
+from taxolib import taxodatabase
+from taxolib.taxacomponents import RankTable
+from taxolib.taxonomy import Taxonomy
+from taxolib.taxoconfig import TaxonomyConfig
+from taxolib.csvtaxonomy import CSVTaxonomyParser
+
+
+argp = ArgumentParser(description='Reports the memory used per taxon by taxa trees that are \
+loaded from a generated taxonomy database and parsed from a generated CSV taxonomy file.  The \
+database is generated the first time the program is run and re-used afterwards.')
+argp.add_argument('-n', '--numtaxa', type=int, help='the number of taxon concepts to generate (200,000 by default)')
+argp.add_argument('-c', '--numcitations', type=int, help='the number of distinct name citations (1,000 by default)')
+argp.set_defaults(numtaxa=200000, numcitations=1000)
+args = argp.parse_args()
+
+DBFILE = 'memory_benchmark.sqlite'
+CSVFILE = 'memory_benchmark.csv'
+CONFFILE = 'memory_benchmark.conf'
+
+if not(os.path.exists(DBFILE)):
+    print 'Generating a taxonomy database with', args.numtaxa, 'taxon concepts...'
+    dbcur = benchutils.createDatabase(DBFILE)
+    an_id = benchutils.addBackboneTaxon(dbcur, 1, 10, 1, 'Animalia')
+    ch_id = benchutils.addBackboneTaxon(dbcur, an_id, 30, 2, 'Chordata')
+    av_id = benchutils.addBackboneTaxon(dbcur, ch_id, 50, 3, 'Aves')
+    benchutils.generateTaxonomy(dbcur, 2, args.numtaxa, av_id, 3, numcitations=args.numcitations)
+
+dbcur = taxodatabase.getDBCursor(DBFILE)
+ranktable = RankTable.getCached(dbcur)
+
+def countObjects(root):
+    """
+    Returns the number of taxa in a taxa tree and the number of distinct Citation
+    objects used by the names in the tree.
+    """
+    numtaxa = 0
+    citations = set()
+    stack = [root]
+    while len(stack) > 0:
+        taxon = stack.pop()
+        numtaxa += 1
+        for name in taxon.namelist.names:
+            if name.citation != None:
+                citations.add(id(name.citation))
+        stack.extend(taxon.children)
+
+    return (numtaxa, len(citations))
+
+def report(desc, root):
+    numtaxa, numcitations = countObjects(root)
+    size = benchutils.deepSizeOf(root, (ranktable,))
+    print '{0:<25}{1:>10}{2:>12}{3:>14}{4:>14.1f}'.format(desc, numtaxa, numcitations,
+            size / 1024, float(size) / numtaxa)
+
+print '\n{0:<25}{1:>10}{2:>12}{3:>14}{4:>14}'.format('Taxa tree', 'Taxa', 'Citations',
+        'Total (KiB)', 'Bytes/taxon')
+
+taxonomy = Taxonomy(2)
+taxonomy.loadFromDB(dbcur, bulk=True)
+report('Loaded from database', taxonomy.roottaxon)
+taxonomy = None
+
+benchutils.generateCSVTaxonomy(CSVFILE, CONFFILE, args.numtaxa)
+taxoconfig = TaxonomyConfig()
+taxoconfig.read(CONFFILE)
+root = CSVTaxonomyParser().parseCSV(taxoconfig, dbcur)
+report('Parsed from CSV file', root)
+print
@@ -0,0 +1,93 @@
+#!/usr/bin/python
+
+# Measures CSV taxonomy parsing times on a large, generated CSV taxonomy file using the
+# hash-indexed child taxon lookups of Taxon.findChild() and, for comparison, using the
+# original linear search of each taxon's list of children.
+
+import sys
+import os
+import benchutils
+from argparse import ArgumentParser
+# A hack for now to get the local package to import.
+sys.path.append('../')
+from taxolib import taxodatabase
+from taxolib.taxacomponents import Taxon
+from taxolib.taxoconfig import TaxonomyConfig
+from taxolib.csvtaxonomy import CSVTaxonomyParser
+
+
+argp = ArgumentParser(description='Benchmarks parsing of a generated CSV taxonomy file with indexed \
+and linear child taxon lookups.  The CSV file is regenerated each time the program is run.  Because \
+linear lookups scale quadratically with the number of children per taxon, the linear lookups are only \
+timed on the first rows of the CSV file.')
+argp.add_argument('-r', '--numrows', type=int, help='the number of CSV rows to generate (500,000 by default)')
+argp.add_argument('-l', '--linearrows', type=int, help='the number of CSV rows to parse with linear lookups (50,000 by default; 0 disables linear lookups)')
+argp.add_argument('-g', '--genera', type=int, help='the number of genera per family (1,000 by default)')
+argp.set_defaults(numrows=500000, linearrows=50000, genera=1000)
+args = argp.parse_args()
+
+DBFILE = 'parse_benchmark.sqlite'
+CSVFILE = 'parse_benchmark.csv'
+CONFFILE = 'parse_benchmark.conf'
+SUBSETCSVFILE = 'parse_benchmark_subset.csv'
+SUBSETCONFFILE = 'parse_benchmark_subset.conf'
+
+timer = benchutils.BenchTimer()
+
+if not(os.path.exists(DBFILE)):
+    benchutils.createDatabase(DBFILE)
+
+print 'Generating a CSV taxonomy file with', args.numrows, 'rows...'
+benchutils.generateCSVTaxonomy(CSVFILE, CONFFILE, args.numrows, (2, 5, args.genera))
+if args.linearrows > 0:
+    benchutils.generateCSVTaxonomy(SUBSETCSVFILE, SUBSETCONFFILE, args.linearrows,
+            (2, 5, args.genera))
+
+dbcur = taxodatabase.getDBCursor(DBFILE)
+
+def linearFindChild(self, rank_id, namestr):
+    """
+    The original implementation of Taxon.findChild(), which searches the list of child
+    taxa sequentially.
+    """
+    for child in self.children:
+        if child.rank_id == rank_id and child.name.namestr == namestr:
+            return child
+
+    return None
+
+def parse(conffile):
+    """
+    Parses the CSV taxonomy file for the given configuration file and returns the
+    elapsed time, the number of rows, and the number of taxa.
+    """
+    taxoconfig = TaxonomyConfig()
+    taxoconfig.read(conffile)
+    taxoparser = CSVTaxonomyParser()
+    with timer:
+        taxoparser.parseCSV(taxoconfig, dbcur)
+
+    return (timer.elapsed,) + taxoparser.getStats()
+
+results = []
+
+indexedFindChild = Taxon.findChild
+if args.linearrows > 0:
+    print 'Parsing', args.linearrows, 'rows with indexed lookups...'
+    results.append(('Indexed lookups',) + parse(SUBSETCONFFILE))
+    print 'Parsing', args.linearrows, 'rows with linear lookups...'
+    Taxon.findChild = linearFindChild
+    results.append(('Linear lookups',) + parse(SUBSETCONFFILE))
+    Taxon.findChild = indexedFindChild
+
+print 'Parsing', args.numrows, 'rows with indexed lookups...'
+results.append(('Indexed lookups',) + parse(CONFFILE))
+
+print '\n{0:<20}{1:>10}{2:>10}{3:>12}{4:>14}'.format('Method', 'Rows', 'Taxa', 'Time (s)', 'Rows/s')
+for desc, elapsed, totalrows, totaltaxa in results:
+    print '{0:<20}{1:>10}{2:>10}{3:>12.3f}{4:>14.0f}'.format(desc, totalrows, totaltaxa, elapsed,
+            totalrows / max(elapsed, 1e-9))
+if args.linearrows > 0:
+    print '\nSpeedup of indexed lookups for the first', args.linearrows, 'rows: {0:.1f}x'.format(
+            results[1][1] / max(results[0][1], 1e-9))
+print
@@ -0,0 +1,321 @@
+#!/usr/bin/python
+
+# Measures name citation resolution times with sequential and concurrent lookups.  Rather
+# than querying the real Web services, the resolvers are pointed at a local stand-in HTTP
+# server that emulates the Zoobank and Catalog of Life APIs with a fixed response latency
+# and occasional failed requests, so the results are repeatable.  The genus and species
+# names are repeated in each family of the test taxonomy, so the benchmark also measures
+# how many requests planned resolution saves by sending each unique query only once.
+# Also measures the time to resolve the same names again using cached responses from a
+# previous run, and the time to resolve them with set-based matching against a local
+# snapshot database that contains the same data as the stand-in server.
+
+import sys
+import os
+import json
+import time
+import threading
+import urllib
+import urlparse
+import csv
+import benchutils
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+from argparse import ArgumentParser
+# A hack for now to get the local package to import.
+sys.path.append('../')
+from taxolib import taxodatabase
+from taxolib.taxacomponents import RankTable, Taxon
+from taxolib.nameresolve import ZoobankNamesResolver, CoLNamesResolver
+from taxolib.responsecache import ResponseCache
+from taxolib.httptransport import HTTPTransport
+from taxolib import snapshotresolve
+
+
+argp = ArgumentParser(description='Benchmarks sequential and concurrent name citation resolution \
+against a local stand-in for the Zoobank and Catalog of Life Web services and verifies that both \
+produce the same citation data.')
+argp.add_argument('-f', '--families', type=int, help='the number of families, each with the same \
+genera and species (2 by default)')
+argp.add_argument('-g', '--genera', type=int, help='the number of genera per family (40 by default)')
+argp.add_argument('-s', '--species', type=int, help='the number of species per genus (10 by default)')
+argp.add_argument('-l', '--latency', type=float, help='the response latency of the stand-in server, \
+in seconds (0.02 by default)')
+argp.add_argument('-w', '--workers', type=int, help='the number of concurrent lookups (8 by default)')
+argp.add_argument('-r', '--maxrate', type=float, help='the maximum number of requests per second \
+(0 [=no limit] by default)')
+argp.set_defaults(families=2, genera=40, species=10, latency=0.02, workers=8, maxrate=0)
+args = argp.parse_args()
+
+DBFILE = 'resolve_benchmark.sqlite'
+CACHEFILE = 'resolve_benchmark_cache.sqlite'
+SNAPSHOTFILE = 'resolve_benchmark_snapshot.sqlite'
+COLFILE = 'resolve_benchmark_col.txt'
+ZBACTSFILE = 'resolve_benchmark_zbacts.csv'
+ZBREFSFILE = 'resolve_benchmark_zbrefs.csv'
+
+
+def getZoobankActs(namestr):
+    """
+    Returns the stand-in Zoobank nomenclatural acts for a name string, or None if the
+    name is unknown.
+    """
+    if namestr.startswith('Genus') and int(namestr.split(' ')[0][5:]) % 5 == 0:
+        return None
+    if ' ' in namestr:
+        genus, epithet = namestr.split(' ', 1)
+        return [{ 'cleanprotonym': genus + ' ' + epithet + ' Smith, 1900', 'namestring': epithet,
+            'rankgroup': 'Species', 'OriginalReferenceUUID': 'ref-' + epithet }]
+    else:
+        rank = 'Family' if namestr.endswith('idae') else 'Genus'
+        return [{ 'cleanprotonym': namestr + ' Jones, 1850', 'namestring': namestr,
+            'rankgroup': rank, 'OriginalReferenceUUID': '' }]
+
+def getZoobankReference(refid):
+    """
+    Returns the stand-in Zoobank full citation string for a reference UUID.
+    """
+    return 'Author ' + refid + '. A description.'
+
+# The stand-in Catalog of Life author string for every species.
+COL_AUTHOR = '(Smith, 1900)'
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Answers Zoobank and Catalog of Life API requests.  Every fifth genus is unknown to
+    "Zoobank", and the first request for every seventh species fails with HTTP error 503.
+    """
+    # Keep connections open between requests.
+    protocol_version = 'HTTP/1.1'
+
+    failed = set()
+    requestcnt = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with self.lock:
+            StandInHandler.requestcnt += 1
+        time.sleep(args.latency)
+        parts = urlparse.urlsplit(self.path)
+
+        if parts.path.startswith('/NomenclaturalActs.json/'):
+            namestr = urllib.unquote(parts.path.rsplit('/', 1)[1]).replace('_', ' ')
+            if self._failOnce(namestr):
+                return
+            self._sendJSON(getZoobankActs(namestr))
+        elif parts.path.startswith('/References.json/'):
+            refid = urllib.unquote(parts.path.rsplit('/', 1)[1])
+            self._sendJSON([{ 'value': getZoobankReference(refid) }])
+        elif parts.path.startswith('/col/webservice'):
+            namestr = urlparse.parse_qs(parts.query)['name'][0]
+            if self._failOnce('col:' + namestr):
+                return
+            self._sendResponse(self._getCoLResults(namestr), 'text/xml')
+        else:
+            self.send_error(404)
+
+    def _failOnce(self, key):
+        if 'species' not in key or int(key.rsplit('species', 1)[1]) % 7 != 0:
+            return False
+
+        with self.lock:
+            if key in self.failed:
+                return False
+            self.failed.add(key)
+
+        self.send_error(503)
+        return True
+
+    def _getCoLResults(self, namestr):
+        return ('<results><result><name>' + namestr + '</name><rank>Species</rank>'
+            + '<classification><taxon><name>Animalia</name></taxon></classification>'
+            + '<author>' + COL_AUTHOR + '</author></result></results>')
+
+    def _sendJSON(self, data):
+        if data == None:
+            self.send_error(404)
+        else:
+            self._sendResponse(json.dumps(data), 'application/json')
+
+    def _sendResponse(self, body, ctype):
+        self.send_response(200)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+server = StandInServer(('127.0.0.1', 0), StandInHandler)
+serverthread = threading.Thread(target=server.serve_forever)
+serverthread.daemon = True
+serverthread.start()
+baseurl = 'http://127.0.0.1:' + str(server.server_address[1]) + '/'
+
+if not(os.path.exists(DBFILE)):
+    benchutils.createDatabase(DBFILE)
+dbcur = taxodatabase.getDBCursor(DBFILE)
+ranktable = RankTable.getCached(dbcur)
+
+def buildTree():
+    """
+    Builds a taxa tree with a single order and args.families families, which all contain
+    args.genera genera with the same names.
+    """
+    root = Taxon(2, benchutils.ORDER_RANK, ranktable, 0, 'Testiformes')
+    for fcnt in range(args.families):
+        family = root.createChild(benchutils.FAMILY_RANK, 'Test' + str(fcnt) + 'idae')
+        for gcnt in range(args.genera):
+            genus = family.createChild(benchutils.GENUS_RANK, 'Genus' + str(gcnt))
+            for scnt in range(args.species):
+                genus.createChild(benchutils.SPECIES_RANK, 'Genus' + str(gcnt) + ' species' + str(scnt))
+
+    return root
+
+def getCitations(root):
+    """
+    Returns a list of the citation data of every taxon in a taxa tree, in tree order.
+    """
+    citations = []
+    stack = [root]
+    while len(stack) > 0:
+        taxon = stack.pop()
+        citation = taxon.name.getCitation()
+        if citation != None:
+            citations.append((taxon.name.namestr, citation.citestr, citation.authordisp,
+                taxon.getUseParens()))
+        else:
+            citations.append((taxon.name.namestr,))
+        stack.extend(reversed(taxon.children))
+
+    return citations
+
+def writeSnapshotFiles(root):
+    """
+    Writes the stand-in server's data for all unique names in a taxa tree to a Catalog of
+    Life taxa file and Zoobank acts and references files, in the formats that are read by
+    import_snapshot.py.
+    """
+    written = set()
+    with open(COLFILE, 'wb') as colout, open(ZBACTSFILE, 'wb') as actsout, \
+            open(ZBREFSFILE, 'wb') as refsout:
+        colout.write('\t'.join(('taxonID', 'acceptedNameUsageID', 'taxonRank', 'scientificName',
+            'scientificNameAuthorship', 'kingdom')) + '\n')
+        actswriter = csv.writer(actsout)
+        actswriter.writerow(('cleanprotonym', 'namestring', 'rankgroup', 'OriginalReferenceUUID'))
+        refswriter = csv.writer(refsout)
+        refswriter.writerow(('ReferenceUUID', 'value'))
+
+        stack = [root]
+        while len(stack) > 0:
+            taxon = stack.pop()
+            stack.extend(taxon.children)
+            namestr = taxon.name.namestr
+            if namestr in written:
+                continue
+            written.add(namestr)
+
+            if taxon.getRankString() == 'Species':
+                colout.write('\t'.join((namestr, '', 'species', namestr + ' ' + COL_AUTHOR,
+                    COL_AUTHOR, 'Animalia')) + '\n')
+
+            acts = getZoobankActs(namestr)
+            if acts != None:
+                for act in acts:
+                    actswriter.writerow((act['cleanprotonym'], act['namestring'], act['rankgroup'],
+                        act['OriginalReferenceUUID']))
+                    if act['OriginalReferenceUUID'] != '':
+                        refswriter.writerow((act['OriginalReferenceUUID'],
+                            getZoobankReference(act['OriginalReferenceUUID'])))
+
+def resolve(workers, cache=None, snapcur=None, planned=False):
+    """
+    Resolves a new taxa tree with both resolvers using the given number of concurrent
+    lookups and, optionally, a response cache and planned resolution.  If snapcur is not
+    None, the snapshot resolvers are used instead.  Returns the elapsed time, the number of requests, the
+    number of requests that re-used an open connection, and the citation data.
+    """
+    transport = HTTPTransport(max(workers, 4))
+    if snapcur != None:
+        resolvers = snapshotresolve.getSnapshotResolversList(snapcur)
+    else:
+        resolvers = [CoLNamesResolver(), ZoobankNamesResolver()]
+    for resolver in resolvers:
+        resolver.setTransport(transport)
+        resolver.zoobank_name_url = baseurl + 'NomenclaturalActs.json/'
+        resolver.zoobank_ref_url = baseurl + 'References.json/'
+        resolver.col_url = baseurl + 'col/webservice?'
+        resolver.retrydelay = 0.5
+        resolver.setConcurrency(workers, args.maxrate)
+        resolver.setResponseCache(cache)
+        resolver.setPlanning(planned)
+
+    root = buildTree()
+    StandInHandler.failed.clear()
+    StandInHandler.requestcnt = 0
+
+    # Hide the resolvers' progress messages.
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        with timer:
+            for resolver in resolvers:
+                resolver.resolve(dbcur, root)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    transport.close()
+
+    return timer.elapsed, StandInHandler.requestcnt, transport.getStats()[2], getCitations(root)
+
+timer = benchutils.BenchTimer()
+numtaxa = 1 + args.families * (1 + args.genera * (args.species + 1))
+
+results = []
+
+print 'Resolving', numtaxa, 'taxa sequentially...'
+results.append(('Sequential',) + resolve(1))
+print 'Resolving', numtaxa, 'taxa with', args.workers, 'concurrent lookups...'
+results.append((str(args.workers) + ' concurrent lookups',) + resolve(args.workers))
+print 'Resolving', numtaxa, 'taxa with planned lookups...'
+results.append(('Planned',) + resolve(1, planned=True))
+print 'Resolving', numtaxa, 'taxa with planned lookups and', args.workers, 'concurrent queries...'
+results.append(('Planned, ' + str(args.workers) + ' concurrent',) + resolve(args.workers, planned=True))
+
+print 'Resolving', numtaxa, 'taxa twice with a new response cache...'
+if os.path.exists(CACHEFILE):
+    os.remove(CACHEFILE)
+cache = ResponseCache(CACHEFILE)
+resolve(1, cache)
+results.append(('Cached responses',) + resolve(1, cache))
+
+print 'Importing the stand-in data into a local snapshot database...'
+writeSnapshotFiles(buildTree())
+if os.path.exists(SNAPSHOTFILE):
+    os.remove(SNAPSHOTFILE)
+snapcur = snapshotresolve.getSnapshotCursor(SNAPSHOTFILE)
+snapshotresolve.importCoLTaxa(snapcur, COLFILE)
+snapshotresolve.importZoobankActs(snapcur, ZBACTSFILE, ZBREFSFILE)
+print 'Resolving', numtaxa, 'taxa with the local snapshot...'
+results.append(('Local snapshot',) + resolve(1, snapcur=snapcur))
+
+print '\n{0:<24}{1:>10}{2:>10}{3:>12}{4:>12}'.format('Method', 'Requests', 'Reused', 'Time (s)',
+        'Taxa/s')
+for desc, elapsed, requests, reused, citations in results:
+    print '{0:<24}{1:>10}{2:>10}{3:>12.3f}{4:>12.1f}'.format(desc, requests, reused, elapsed,
+            numtaxa / elapsed)
+
+print '\nSpeedup of concurrent lookups: {0:.1f}x'.format(results[0][1] / max(results[1][1], 1e-9))
+if all(result[4] == results[0][4] for result in results):
+    print 'The citation data from all methods are identical.\n'
+else:
+    print 'ERROR: the citation data from the methods differ.\n'
+    sys.exit(1)
@@ -0,0 +1,100 @@
+#!/usr/bin/python
+
+# Measures the time to search for taxa by name on a large, generated taxonomy database
+# with the full-text (trigram) name index from schema version 3 and, for comparison,
+# with LIKE queries that scan the names table.
+
+import sys
+import os
+import benchutils
+from argparse import ArgumentParser
+# A hack for now to get the local package to import.
+sys.path.append('../')
+from taxolib import taxodatabase
+from taxolib import taxacomponents
+from taxolib.taxacomponents import RankTable, Taxon
+
+
+argp = ArgumentParser(description='Benchmarks name searches with Taxon.find() on a generated \
+database, with and without the full-text name index.  The database is generated the first time \
+the program is run and re-used afterwards.')
+argp.add_argument('-f', '--dbfile', help='the benchmark database file ("search_benchmark.sqlite" by default)')
+argp.add_argument('-n', '--numtaxa', type=int, help='the number of taxon concepts to generate (2,000,000 by default)')
+argp.add_argument('-l', '--limit', type=int, help='the maximum number of taxa to return for each search \
+(20 by default)')
+argp.add_argument('-r', '--repeats', type=int, help='the number of times to run each search (3 by default)')
+argp.set_defaults(dbfile='search_benchmark.sqlite', numtaxa=2000000, limit=20, repeats=3)
+args = argp.parse_args()
+
+timer = benchutils.BenchTimer()
+
+if not(os.path.exists(args.dbfile)):
+    print 'Generating a taxonomy database with', args.numtaxa, 'taxon concepts...'
+    with timer:
+        dbcur = benchutils.createDatabase(args.dbfile)
+        an_id = benchutils.addBackboneTaxon(dbcur, 1, 10, 1, 'Animalia')
+        ch_id = benchutils.addBackboneTaxon(dbcur, an_id, 30, 2, 'Chordata')
+        av_id = benchutils.addBackboneTaxon(dbcur, ch_id, 50, 3, 'Aves')
+        total = benchutils.generateTaxonomy(dbcur, 2, args.numtaxa, av_id, 3)
+    print 'Generated', total, 'taxon concepts in', timer.elapsed, 's.\n'
+
+dbcur = taxodatabase.getDBCursor(args.dbfile)
+if not(taxodatabase.hasNameSearchIndex(dbcur)):
+    exit('\nError: The database does not have a full-text name index.  The index requires \
+SQLite 3.34 or later.\n')
+ranktable = RankTable.getCached(dbcur)
+
+dbcur.execute('SELECT count(*) FROM names')
+print 'The database contains', dbcur.fetchone()[0], 'names.\n'
+
+# The searches to run, as (search mode, search string) pairs.
+SEARCHES = [
+    (Taxon.SEARCH_LIKE, 'Genus12f3o4 species5'),
+    (Taxon.SEARCH_LIKE, 'genus12f3o4%'),
+    (Taxon.SEARCH_TOKEN, 'species17'),
+    (Taxon.SEARCH_PREFIX, 'Genus12f3o'),
+    (Taxon.SEARCH_SUBSTRING, 'f3o4 species2'),
+    (Taxon.SEARCH_SUBSTRING, 'o39 spec')
+]
+
+indexedSearch = taxacomponents.hasNameSearchIndex
+
+def runSearches(useindex):
+    """
+    Runs all searches, with or without the full-text name index, and returns a list of
+    (time, tc_ids) tuples.  The time is the best time of args.repeats runs.
+    """
+    if useindex:
+        taxacomponents.hasNameSearchIndex = indexedSearch
+    else:
+        taxacomponents.hasNameSearchIndex = lambda dbcur: False
+
+    results = []
+    for mode, searchstr in SEARCHES:
+        times = []
+        for cnt in range(args.repeats):
+            with timer:
+                taxa = Taxon.find(dbcur, searchstr, ranktable, mode=mode, limit=args.limit)
+            times.append(timer.elapsed)
+        results.append((min(times), [taxon.tc_id for taxon in taxa]))
+
+    taxacomponents.hasNameSearchIndex = indexedSearch
+
+    return results
+
+print 'Running searches that scan the names table...'
+before = runSearches(False)
+print 'Running searches with the full-text name index...'
+after = runSearches(True)
+
+print '\n{0:<10}{1:<24}{2:>8}{3:>12}{4:>12}{5:>10}'.format('Mode', 'Search string', 'Taxa',
+        'Scan (s)', 'Index (s)', 'Speedup')
+for (mode, searchstr), (btime, bids), (atime, aids) in zip(SEARCHES, before, after):
+    print '{0:<10}{1:<24}{2:>8}{3:>12.4f}{4:>12.4f}{5:>9.1f}x'.format(mode, searchstr, len(aids),
+            btime, atime, btime / max(atime, 1e-9))
+
+if all(bids == aids for (btime, bids), (atime, aids) in zip(before, after)):
+    print '\nThe results of both search methods are identical.\n'
+else:
+    print '\nERROR: the results of the search methods differ.\n'
+    sys.exit(1)
@@ -31,7 +31,7 @@ except ConfigError as e:
 taxonomy = Taxonomy(args.taxonomy_id)
 print 'Loading taxonomy from the database...'
 try:
-    taxonomy.loadFromDB(pgcur, args.numtaxa, args.maxdepth)
+    taxonomy.loadFromDB(pgcur, args.numtaxa, args.maxdepth, bulk=True)
 except TaxonomyError as e:
     exit('\n' + str(e) + '\n')
 print 'done.\n'
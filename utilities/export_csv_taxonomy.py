@@ -27,7 +27,7 @@ except ConfigError as e:
 # Attempt to load the taxonomy from the database.
 taxonomy = Taxonomy(args.taxonomy_id)
 try:
-    taxonomy.loadFromDB(pgcur, args.numtaxa, args.maxdepth)
+    taxonomy.loadFromDB(pgcur, args.numtaxa, args.maxdepth, bulk=True)
 except TaxonomyError as e:
     exit('\n' + str(e) + '\n')
 
@@ -1,4 +1,11 @@
 from abc import ABCMeta, abstractmethod
+import itertools
+import multiprocessing
+import sqlite3
+import trigramindex
+import deletionindex
+import trieindex
+from taxolib import namematch
 
 
 class Matcher:
@@ -13,6 +20,9 @@ class Matcher:
         name and column name to use as the search "dictionary", and a cursor
         object to use for database queries.
         """
+        # Set the default number of search strings to process at once in matchMany().
+        self.batchsize = 100
+
         self.setDBTableInfo(dbtablename, dbcolname)
         self.setDBCursor(dbcursor)
 
@@ -30,6 +40,111 @@ class Matcher:
         """
         self.dbcursor = dbcursor
 
+    def replaceDBCursor(self, dbcursor):
+        """
+        Sets a new database cursor object for the same database.  Unlike
+        setDBCursor(), this does not discard any in-memory index of the dictionary.
+        """
+        self.dbcursor = dbcursor
+
+    def loadIndexes(self):
+        """
+        Loads or builds any in-memory index of the dictionary that the matcher uses,
+        so that it is ready before searching.  Matchers that search the database
+        directly have nothing to load.
+        """
+        pass
+
+    def _getKeyColumn(self, keyname):
+        """
+        Returns the name of the column of the dictionary table that contains the
+        precomputed keyname keys (e.g., "soundex") of the dictionary strings, or None if
+        the table does not have such a column.  Key columns are named by adding "_" and
+        the key name to the dictionary column name (e.g., "namestr_soundex").
+        """
+        colname = self.dbcol + '_' + keyname
+        self.dbcursor.execute('PRAGMA table_info({0})'.format(self.dbtable))
+        if colname in [row[1] for row in self.dbcursor.fetchall()]:
+            return colname
+
+        return None
+
+    def _searchBatchTable(self, querycnt, rows, joincond):
+        """
+        Loads rows of (search string index, value, alternative value) into the
+        temporary "match_batch" table and joins it with the dictionary table using the
+        SQL join condition joincond, in which "q" is the batch table and "n" is the
+        dictionary table.  Returns a list of querycnt lists that contain the dictionary
+        strings found for each search string index.
+        """
+        self.dbcursor.execute("""CREATE TEMP TABLE IF NOT EXISTS match_batch (
+            qid INTEGER, val TEXT, altval TEXT)""")
+        self.dbcursor.execute('DELETE FROM temp.match_batch')
+        self.dbcursor.executemany('INSERT INTO temp.match_batch VALUES (?, ?, ?)', rows)
+
+        # CROSS JOIN makes SQLite use the batch table for the outer loop, so that each
+        # batch value is looked up with an index of the dictionary table.
+        query = """SELECT q.qid, n.{0} FROM temp.match_batch q CROSS JOIN {1} n
+            ON {2}""".format(self.dbcol, self.dbtable, joincond)
+        #print query
+        self.dbcursor.execute(query)
+
+        results = [[] for cnt in range(querycnt)]
+        for qid, result in self.dbcursor:
+            results[qid].append(result)
+
+        return results
+
+    def getBatchSize(self):
+        """
+        Returns the number of search strings that matchMany() processes at once.
+        """
+        return self.batchsize
+
+    def setBatchSize(self, batchsize):
+        """
+        Sets the number of search strings that matchMany() processes at once.  Larger
+        batches mean fewer database queries, but require more memory.
+        """
+        self.batchsize = batchsize
+
+    def matchMany(self, searchstrs):
+        """
+        Searches the valid strings dictionary for each string in an iterable of search
+        strings.  The search strings are processed in batches (see setBatchSize()), and
+        the results are returned by a generator as they become available, as tuples of
+        (search string, list of matching strings), in the same order as the search
+        strings.  The results for each search string are the same as those of match().
+        """
+        return self._iterBatches(searchstrs, self._matchBatch)
+
+    def _iterBatches(self, searchstrs, batchfunc):
+        """
+        Implements batch searches by calling batchfunc with each batch of unique search
+        strings.  batchfunc must return a list of results for each string in the batch,
+        in the same order as the batch.
+        """
+        searchiter = iter(searchstrs)
+        while True:
+            batch = list(itertools.islice(searchiter, self.batchsize))
+            if len(batch) == 0:
+                break
+
+            # Repeated search strings in a batch only need to be searched once.
+            uniquestrs = list(set(batch))
+            batchresults = dict(zip(uniquestrs, batchfunc(uniquestrs)))
+
+            for searchstr in batch:
+                yield (searchstr, list(batchresults[searchstr]))
+
+    def _matchBatch(self, searchstrs):
+        """
+        Returns a list of the results of match() for each string in a list of search
+        strings.  Child classes can override this to search for all of the strings at
+        once.
+        """
+        return [self.match(searchstr) for searchstr in searchstrs]
+
     @abstractmethod
     def match(self, searchstr):
         """
@@ -46,7 +161,7 @@ class ExactMatcher(Matcher):
     """
     def match(self, searchstr):
         query = """SELECT {0} FROM {1} n
-            WHERE n.{0}=%s""".format(self.dbcol, self.dbtable)
+            WHERE n.{0}=?""".format(self.dbcol, self.dbtable)
         #print query
     
         #print self.dbcursor.mogrify(query, (searchstr,))
@@ -55,28 +170,91 @@ class ExactMatcher(Matcher):
     
         return [result[0] for result in results]
 
+    def _matchBatch(self, searchstrs):
+        rows = [(qid, searchstr, None) for qid, searchstr in enumerate(searchstrs)]
+
+        return self._searchBatchTable(len(searchstrs), rows, 'n.{0}=q.val'.format(self.dbcol))
+
 
 class QgramMatcher(Matcher):
     """
     Implements approximate string matching using the q-gram comparison method,
     where q=3 (i.e., trigrams).  By default, a similarity score cutoff of 0.4
-    is used to limit the search result sets.
+    is used to limit the search result sets.  Searches use an in-process trigram
+    index of the dictionary (see trigramindex.py), which is built from the database
+    table the first time it is needed and saved in the database for later use.
+    Trigrams and similarity scores are the same as those of PostgreSQL's pg_trgm
+    extension.
     """
+    # Define "constants" for specifying alternative search engines.
+    ENGINE_POSTINGS = 0
+    ENGINE_CSR = 1
+
     def __init__(self, dbtablename=None, dbcolname=None, dbcursor=None):
         # Set the default similarity score cutoff.
         self.simcutoff = 0.4
 
+        self.engine = QgramMatcher.ENGINE_POSTINGS
+        self.index = None
+
         # Call the superclass initializer.
         Matcher.__init__(self, dbtablename, dbcolname, dbcursor)
 
+    def setDBTableInfo(self, dbtablename, dbcolname):
+        # Call the superclass method.
+        Matcher.setDBTableInfo(self, dbtablename, dbcolname)
+
+        # The trigram index must be re-loaded for the new dictionary.
+        self.index = None
+
     def setDBCursor(self, dbcursor):
         # Call the superclass method.
         Matcher.setDBCursor(self, dbcursor)
 
-        # If we were provided with a cursor instance, be sure that the correct
-        # similarity score threshold is set.
-        if self.dbcursor != None:
-            self.setSimilarityCutoff(self.simcutoff)
+        # The trigram index must be re-loaded from the new database.
+        self.index = None
+
+    def getIndex(self):
+        """
+        Returns the trigram index of the valid strings dictionary, loading or building
+        it if necessary.
+        """
+        if self.index == None:
+            self.index = trigramindex.getIndex(self.dbcursor, self.dbtable, self.dbcol)
+            if self.engine == QgramMatcher.ENGINE_CSR:
+                self.index = trigramindex.CSRTrigramIndex(self.index)
+
+        return self.index
+
+    def setIndex(self, index):
+        """
+        Sets the trigram index to use for searches, instead of an index of the database
+        table.  This makes it possible to search a dictionary that is not in the
+        database.  The index can be either a TrigramIndex or a CSRTrigramIndex.
+        """
+        self.index = index
+
+    def getEngine(self):
+        """
+        Returns the current trigram search engine.  See the documentation for
+        setEngine() for more details.
+        """
+        return self.engine
+
+    def setEngine(self, engine):
+        """
+        Sets the search engine to use for the trigram index.  The options are defined
+        as class "constants".  ENGINE_POSTINGS (the default) searches the postings
+        lists of the TrigramIndex directly.  ENGINE_CSR converts the index to a
+        CSRTrigramIndex, which scores candidates with set operations on whole postings
+        lists and is much faster when there are many candidates (i.e., for low
+        similarity cutoffs).  Both engines return the same results.
+        """
+        self.engine = engine
+        self.index = None
+
+    def loadIndexes(self):
+        self.getIndex()
 
     def getSimilarityCutoff(self):
         """
@@ -93,23 +271,32 @@ class QgramMatcher(Matcher):
         """
         self.simcutoff = similarity_cutoff
 
-        # Set the similarity threshold for the database session.  Note that if we do
-        # not yet have a valid cursor object, this method will be called again when
-        # a cursor object is provided.
-        if self.dbcursor != None:
-            query = 'SELECT set_limit(%s)'
-            self.dbcursor.execute(query, (self.simcutoff,))
+    def matchScored(self, searchstr):
+        """
+        Searches the dictionary in the same way as match(), but returns a list of
+        (string, similarity score) tuples, sorted by descending score.
+        """
+        return self.getIndex().search(searchstr, self.simcutoff)
+
+    def matchScoredMany(self, searchstrs):
+        """
+        Searches the dictionary in the same way as matchMany(), but the results for
+        each search string are lists of (string, similarity score) tuples, as returned
+        by matchScored().
+        """
+        return self._iterBatches(searchstrs, self._matchScoredBatch)
+
+    def _matchScoredBatch(self, searchstrs):
+        # Get the index once for the whole batch.
+        index = self.getIndex()
+
+        return [index.search(searchstr, self.simcutoff) for searchstr in searchstrs]
+
+    def _matchBatch(self, searchstrs):
+        return [[result[0] for result in results] for results in self._matchScoredBatch(searchstrs)]
 
     def match(self, searchstr):
-        query = """SELECT {0}, similarity({0}, %s) FROM {1} n
-            WHERE n.{0} %% %s""".format(self.dbcol, self.dbtable)
-        #print query
-    
-        #print self.dbcursor.mogrify(query, (searchstr, searchstr))
-        self.dbcursor.execute(query, (searchstr, searchstr))
-        results = self.dbcursor.fetchall()
-    
-        return [result[0] for result in results]
+        return [result[0] for result in self.matchScored(searchstr)]
 
 
 class DLMatcher(Matcher):
@@ -120,6 +307,10 @@ class DLMatcher(Matcher):
     # Define "constants" for specifying alternative search algorithms.
     METHOD_FULLNHOOD = 0
     METHOD_WCNHOOD = 1
+    METHOD_DELETIONS = 2
+
+    # The maximum number of parameters to use in a single SQL query.
+    MAX_QUERY_PARAMS = 999
 
     def __init__(self, dbtablename=None, dbcolname=None, dbcursor=None):
         # Generate the default alphabet.
@@ -128,6 +319,8 @@ class DLMatcher(Matcher):
         # Set the default D-L distance limit.
         self.k = 1
 
+        self.delindex = None
+
         # Set the default search algorithm.
         self.setSearchMethod(DLMatcher.METHOD_FULLNHOOD)
 
@@ -147,7 +340,10 @@ class DLMatcher(Matcher):
         are defined as class "constants".  METHOD_FULLNHOOD (the default) uses
         exact SQL string matching to search the full D-L k-neighborhood.
         METHOD_WCNHOOD uses a reduced "wildcard" neighborhood with string pattern
-        matching and is only available for k=1.
+        matching and is only available for k=1.  METHOD_DELETIONS uses an in-memory
+        symmetric deletion index of the dictionary (see deletionindex.py), which is
+        built the first time it is needed, so that only the deletion variants of the
+        search string need to be generated.
         """
         self.searchmethod = method
 
@@ -155,6 +351,37 @@ class DLMatcher(Matcher):
             self.match = self._matchFullNhood
         elif self.searchmethod == DLMatcher.METHOD_WCNHOOD:
             self.match = self._matchWCNhood
+        elif self.searchmethod == DLMatcher.METHOD_DELETIONS:
+            self.match = self._matchDeletions
+
+    def setDBTableInfo(self, dbtablename, dbcolname):
+        # Call the superclass method.
+        Matcher.setDBTableInfo(self, dbtablename, dbcolname)
+
+        # The deletion index must be rebuilt for the new dictionary.
+        self.delindex = None
+
+    def setDBCursor(self, dbcursor):
+        # Call the superclass method.
+        Matcher.setDBCursor(self, dbcursor)
+
+        # The deletion index must be rebuilt from the new database.
+        self.delindex = None
+
+    def getDeletionIndex(self):
+        """
+        Returns the symmetric deletion index of the valid strings dictionary, building
+        it if necessary.  The index is rebuilt if the maximum D-L distance (k) is
+        increased beyond the distance of the current index.
+        """
+        if self.delindex == None or self.delindex.maxdist < self.k:
+            self.delindex = deletionindex.getIndex(self.dbcursor, self.dbtable, self.dbcol, self.k)
+
+        return self.delindex
+
+    def loadIndexes(self):
+        if self.searchmethod == DLMatcher.METHOD_DELETIONS:
+            self.getDeletionIndex()
 
     def getDLDistance(self):
         """
@@ -168,8 +395,8 @@ class DLMatcher(Matcher):
         to consider the strings a match.  Values greater than 1 increase the
         "fuzziness" of the matching, but substantially increase search times.
         Currently, k > 1 is only implemented for full neighborhood matching
-        (METHOD_FULLNHOOD).  If "wildcard" neighborhood matching is used
-        (METHOD_WCNHOOD), k is always 1.
+        (METHOD_FULLNHOOD) and deletion index matching (METHOD_DELETIONS).  If
+        "wildcard" neighborhood matching is used (METHOD_WCNHOOD), k is always 1.
         """
         self.k = distance
 
@@ -395,23 +622,25 @@ class DLMatcher(Matcher):
     def _matchFullNhood(self, searchstr):
         nhood = self.generateNeighborhood(searchstr, self.k)
         #print nhood
- 
-        # This approach uses the IN operator and is very slightly slower than the method below.
+
+        # Search for the neighborhood strings with the IN operator.  SQLite limits the
+        # number of parameters in a query (to 999, in older versions), so large
+        # neighborhoods are searched in chunks.  Duplicate neighborhood strings are
+        # removed first so that a string cannot be found in more than one chunk.
+        if len(nhood) > self.MAX_QUERY_PARAMS:
+            nhood = list(set(nhood))
         # Note: Generating the argument string can be expressed more compactly using the string
         # join() method, but in my testing, implementing it as below is about 22x faster.
-        #argstr = ('%s, ' * (len(nhood) - 1)) + '%s'
-        #query = """SELECT {0} FROM {1} n
-        #    WHERE n.{0} IN ({2})""".format(self.dbcol, self.dbtable, argstr)
-        #print self.dbcursor.mogrify(query, nhood)
-        #self.dbcursor.execute(query, nhood)
+        results = []
+        for start in range(0, len(nhood), self.MAX_QUERY_PARAMS):
+            chunk = nhood[start:start + self.MAX_QUERY_PARAMS]
+            argstr = ('?, ' * (len(chunk) - 1)) + '?'
+            query = """SELECT {0} FROM {1} n
+                WHERE n.{0} IN ({2})""".format(self.dbcol, self.dbtable, argstr)
+            #print query
 
-        # This approaches uses the ANY operator on an array of strings.
-        query = """SELECT {0} FROM {1} n
-            WHERE n.{0}=ANY(%s)""".format(self.dbcol, self.dbtable)
-        #print query
-
-        self.dbcursor.execute(query, (nhood,))
-        results = self.dbcursor.fetchall()
+            self.dbcursor.execute(query, chunk)
+            results.extend(self.dbcursor.fetchall())
     
         return [result[0] for result in results]
 
@@ -430,10 +659,10 @@ class DLMatcher(Matcher):
         # First, build the exact match part of the WHERE clause.
         # Note: Generating the argument string can be expressed more compactly using the string
         # join() method, but in my testing, implementing it as below is about 22x faster.
-        exact_argstr = ('%s, ' * (len(nhood[0]) - 1)) + '%s'
+        exact_argstr = ('?, ' * (len(nhood[0]) - 1)) + '?'
     
         # Then build the wildcard part of the WHERE clause.
-        wc_argstr = ' OR n.namestr LIKE %s' * len(nhood[1])
+        wc_argstr = ' OR n.{0} LIKE ?'.format(self.dbcol) * len(nhood[1])
     
         query = """SELECT {0} FROM {1} n
             WHERE n.{0} IN ({2}){3}""".format(self.dbcol, self.dbtable, exact_argstr, wc_argstr)
@@ -441,12 +670,124 @@ class DLMatcher(Matcher):
     
         arglist = nhood[0]
         arglist.extend(nhood[1])
-        #print self.dbcursor.mogrify(query, arglist)
         self.dbcursor.execute(query, arglist)
         results = self.dbcursor.fetchall()
     
         return [result[0] for result in results]
 
+    def _matchDeletions(self, searchstr):
+        """
+        Performs a Damerau-Levenshtein k-neighborhood search with the symmetric deletion
+        index.  The results are the same as for the full neighborhood search, except
+        that insertions and substitutions are not limited to the 26-letter alphabet.
+        """
+        results = self.getDeletionIndex().search(searchstr, self.k)
+
+        return [result[0] for result in results]
+
+    def _matchBatch(self, searchstrs):
+        """
+        For full neighborhood searches, loads the neighborhoods of all search strings
+        into a temporary table and searches for all of them with a single join.  Other
+        search methods process the search strings one at a time.
+        """
+        if self.searchmethod != DLMatcher.METHOD_FULLNHOOD:
+            return Matcher._matchBatch(self, searchstrs)
+
+        rows = []
+        for qid, searchstr in enumerate(searchstrs):
+            nhood = set(self.generateNeighborhood(searchstr, self.k))
+            rows.extend([(qid, neighbor, None) for neighbor in nhood])
+
+        return self._searchBatchTable(len(searchstrs), rows, 'n.{0}=q.val'.format(self.dbcol))
+
+
+class TrieMatcher(Matcher):
+    """
+    Implements approximate string matching by searching for strings within a
+    specific Damerau-Levenshtein distance (1 by default) of a target string, using an
+    in-memory trie of the dictionary (see trieindex.py).  The trie is built from the
+    database table the first time it is needed, after which searches do not use the
+    database at all.  If an index file is set, the trie is loaded from the file if the
+    file is up to date and is otherwise saved to the file after it is built.
+    """
+    def __init__(self, dbtablename=None, dbcolname=None, dbcursor=None):
+        # Set the default D-L distance limit.
+        self.k = 1
+
+        self.index = None
+        self.indexfile = None
+
+        # Call the superclass initializer.
+        Matcher.__init__(self, dbtablename, dbcolname, dbcursor)
+
+    def setDBTableInfo(self, dbtablename, dbcolname):
+        # Call the superclass method.
+        Matcher.setDBTableInfo(self, dbtablename, dbcolname)
+
+        # The trie must be re-loaded for the new dictionary.
+        self.index = None
+
+    def setDBCursor(self, dbcursor):
+        # Call the superclass method.
+        Matcher.setDBCursor(self, dbcursor)
+
+        # The trie must be re-loaded from the new database.
+        self.index = None
+
+    def getIndexFile(self):
+        """
+        Returns the name of the file used for saving and loading the trie, or None if
+        the trie is not saved.
+        """
+        return self.indexfile
+
+    def setIndexFile(self, filename):
+        """
+        Sets the name of the file used for saving and loading the trie.
+        """
+        self.indexfile = filename
+        self.index = None
+
+    def getIndex(self):
+        """
+        Returns the trie of the valid strings dictionary, loading or building it if
+        necessary.
+        """
+        if self.index == None:
+            self.index = trieindex.getIndex(self.dbcursor, self.dbtable, self.dbcol,
+                    self.indexfile)
+
+        return self.index
+
+    def setIndex(self, index):
+        """
+        Sets the trie to use for searches, instead of a trie of the database table.
+        This makes it possible to search a dictionary that is not in the database.
+        """
+        self.index = index
+
+    def loadIndexes(self):
+        self.getIndex()
+
+    def getDLDistance(self):
+        """
+        Returns the current maximum D-L distance (k) for string matching.
+        """
+        return self.k
+
+    def setDLDistance(self, distance):
+        """
+        Sets the maximum D-L distance (k) between two strings that is required
+        to consider the strings a match.
+        """
+        self.k = distance
+
+    def match(self, searchstr):
+        results = self.getIndex().search(searchstr, self.k)
+
+        return [result[0] for result in results]
+
 
 class HybridMatcher(Matcher):
     """
@@ -483,6 +824,44 @@ class HybridMatcher(Matcher):
         self.qgmatcher.setDBCursor(dbcursor)
         self.dlmatcher.setDBCursor(dbcursor)
 
+    def getDLMatcher(self):
+        """
+        Returns the matcher that is used for D-L searches.
+        """
+        return self.dlmatcher
+
+    def setDLMatcher(self, dlmatcher):
+        """
+        Sets the matcher to use for D-L searches.  This can be any Matcher that
+        searches for strings within a D-L distance of the search string, such as a
+        DLMatcher with a different search method or a TrieMatcher.  The matcher is
+        updated to use the same dictionary and database cursor as the HybridMatcher.
+        """
+        dlmatcher.setDBTableInfo(self.dbtable, self.dbcol)
+        dlmatcher.setDBCursor(self.dbcursor)
+        dlmatcher.setBatchSize(self.batchsize)
+        self.dlmatcher = dlmatcher
+
+    def setBatchSize(self, batchsize):
+        # Call the superclass implementation.
+        Matcher.setBatchSize(self, batchsize)
+
+        # Update the q-gram and DL matchers.
+        self.qgmatcher.setBatchSize(batchsize)
+        self.dlmatcher.setBatchSize(batchsize)
+
+    def replaceDBCursor(self, dbcursor):
+        # Call the superclass implementation.
+        Matcher.replaceDBCursor(self, dbcursor)
+
+        # Update the q-gram and DL matchers.
+        self.qgmatcher.replaceDBCursor(dbcursor)
+        self.dlmatcher.replaceDBCursor(dbcursor)
+
+    def loadIndexes(self):
+        self.qgmatcher.loadIndexes()
+        self.dlmatcher.loadIndexes()
+
     def match(self, searchstr):
         searchlen = len(searchstr)
     
@@ -501,39 +880,318 @@ class HybridMatcher(Matcher):
     
         return results
 
+    def _matchBatch(self, searchstrs):
+        """
+        Runs one batch search with the q-gram matcher and one with the D-L matcher,
+        then merges the results for each search string in the same way as match().
+        """
+        # As in match(), strings longer than lowerlen get a q-gram search, and strings
+        # shorter than upperlen (which is larger than lowerlen) get a D-L search.
+        qgsearchstrs = [searchstr for searchstr in searchstrs if len(searchstr) > self.lowerlen]
+        dlsearchstrs = [searchstr for searchstr in searchstrs if len(searchstr) < self.upperlen]
+        qgresults = dict(self.qgmatcher.matchMany(qgsearchstrs))
+        dlresults = dict(self.dlmatcher.matchMany(dlsearchstrs))
+
+        batchresults = []
+        for searchstr in searchstrs:
+            if searchstr in qgresults:
+                results = qgresults[searchstr]
+                for result in dlresults.get(searchstr, []):
+                    if result not in results:
+                        results.append(result)
+            else:
+                results = dlresults[searchstr]
+
+            batchresults.append(results)
+
+        return batchresults
+
+
+# The matcher used by the worker processes of a ParallelMatcher.  Worker processes are
+# forked from the parent process, so they inherit the matcher, including its
+# in-memory dictionary indexes, without copying or pickling it.
+_workermatcher = None
+
+def _initWorker(dbfile):
+    """
+    Gives the matcher of a newly started worker process its own database connection.
+    A SQLite connection cannot be shared with a forked process.
+    """
+    conn = sqlite3.connect(dbfile)
+    namematch.registerFunctions(conn)
+    _workermatcher.replaceDBCursor(conn.cursor())
+
+def _matchChunk(args):
+    """
+    Runs a batch search of a chunk of search strings in a worker process.  args is a
+    tuple of (batch search method name, list of search strings).  Returns a list of
+    (search string, results) tuples.
+    """
+    methodname, searchstrs = args
+    batchsearch = getattr(_workermatcher, methodname)
+
+    return list(batchsearch(searchstrs))
+
+
+class ParallelMatcher(Matcher):
+    """
+    Runs the batch searches of another matcher (for example, a HybridMatcher) in a
+    pool of worker processes.  The search strings are divided into chunks of the
+    batch size (see setBatchSize()), the chunks are searched by the workers, and the
+    results are returned in the same order as the search strings.  Any in-memory
+    dictionary indexes are loaded before the workers are started and are shared with
+    them through copy-on-write fork(), so this is only available on platforms that
+    support fork().  Each worker opens its own connection to the database file.
+    """
+    def __init__(self, matcher, workers=None):
+        """
+        Initializes the ParallelMatcher with the matcher to run and the number of
+        worker processes.  By default, one worker is used for each CPU.
+        """
+        self.matcher = matcher
+        self.batchsize = matcher.getBatchSize()
+        self.setWorkers(workers)
+
+    def setDBTableInfo(self, dbtablename, dbcolname):
+        self.matcher.setDBTableInfo(dbtablename, dbcolname)
+
+    def setDBCursor(self, dbcursor):
+        self.matcher.setDBCursor(dbcursor)
+
+    def replaceDBCursor(self, dbcursor):
+        self.matcher.replaceDBCursor(dbcursor)
+
+    def loadIndexes(self):
+        self.matcher.loadIndexes()
+
+    def getMatcher(self):
+        """
+        Returns the matcher that is run by the worker processes.
+        """
+        return self.matcher
+
+    def getWorkers(self):
+        """
+        Returns the number of worker processes.
+        """
+        return self.workers
+
+    def setWorkers(self, workers=None):
+        """
+        Sets the number of worker processes.  If workers is None, one worker is used
+        for each CPU.  If workers is 1, searches run in the current process.
+        """
+        if workers == None:
+            workers = multiprocessing.cpu_count()
+
+        self.workers = workers
+
+    def match(self, searchstr):
+        return self.matcher.match(searchstr)
+
+    def matchMany(self, searchstrs):
+        return self._iterParallel(searchstrs, 'matchMany')
+
+    def matchScoredMany(self, searchstrs):
+        """
+        Runs the matchScoredMany() method of the matcher (such as a QgramMatcher) in
+        the worker processes.
+        """
+        return self._iterParallel(searchstrs, 'matchScoredMany')
+
+    def _iterChunks(self, searchstrs, methodname):
+        """
+        Generates the (batch search method name, list of search strings) arguments for
+        each worker task.
+        """
+        searchiter = iter(searchstrs)
+        while True:
+            chunk = list(itertools.islice(searchiter, self.batchsize))
+            if len(chunk) == 0:
+                break
+
+            yield (methodname, chunk)
+
+    def _iterParallel(self, searchstrs, methodname):
+        global _workermatcher
+
+        self.matcher.setBatchSize(self.batchsize)
+        if self.workers == 1:
+            for result in getattr(self.matcher, methodname)(searchstrs):
+                yield result
+            return
+
+        # Load the dictionary indexes before the worker processes are forked so that
+        # they are only loaded once.
+        self.matcher.loadIndexes()
+
+        # Get the name of the database file so that each worker can open its own
+        # connection.
+        self.matcher.dbcursor.execute('PRAGMA database_list')
+        dbfile = [row[2] for row in self.matcher.dbcursor.fetchall() if row[1] == 'main'][0]
+        if dbfile == '':
+            raise ValueError('Parallel matching requires a database file, but the '
+                    + 'matcher is using an in-memory database.')
+
+        _workermatcher = self.matcher
+        pool = multiprocessing.Pool(self.workers, _initWorker, (dbfile,))
+        try:
+            for chunkresults in pool.imap(_matchChunk, self._iterChunks(searchstrs, methodname)):
+                for result in chunkresults:
+                    yield result
+        finally:
+            pool.terminate()
+            pool.join()
+
 
 class SoundexMatcher(Matcher):
     """
     Implements approximate string matching using the classic Soundex phonetic
-    encoding algorithm.
+    encoding algorithm.  If the dictionary table has a column of precomputed Soundex
+    keys (such as the "namestr_soundex" column of the names table), the keys are
+    searched directly, which can use an index.
     """
+    def __init__(self, dbtablename=None, dbcolname=None, dbcursor=None):
+        self.query = None
+
+        # Call the superclass initializer.
+        Matcher.__init__(self, dbtablename, dbcolname, dbcursor)
+
+    def setDBTableInfo(self, dbtablename, dbcolname):
+        # Call the superclass method.
+        Matcher.setDBTableInfo(self, dbtablename, dbcolname)
+
+        self.query = None
+
+    def setDBCursor(self, dbcursor):
+        # Call the superclass method.
+        Matcher.setDBCursor(self, dbcursor)
+
+        self.query = None
+
     def match(self, searchstr):
-        query = """SELECT {0} FROM {1} n
-            WHERE soundex(n.{0})=soundex(%s)""".format(self.dbcol, self.dbtable)
-        #print query
+        if self.query == None:
+            keycol = self._getKeyColumn('soundex')
+            if keycol != None:
+                self.query = """SELECT {0} FROM {1} n
+                    WHERE n.{2}=soundex(?)""".format(self.dbcol, self.dbtable, keycol)
+            else:
+                self.query = """SELECT {0} FROM {1} n
+                    WHERE soundex(n.{0})=soundex(?)""".format(self.dbcol, self.dbtable)
+        #print self.query
     
-        #print self.dbcursor.mogrify(query, (searchstr,))
-        self.dbcursor.execute(query, (searchstr,))
+        self.dbcursor.execute(self.query, (searchstr,))
         results = self.dbcursor.fetchall()
     
         return [result[0] for result in results]
 
+    def _matchBatch(self, searchstrs):
+        """
+        Calculates the Soundex keys of the search strings in Python.  If the dictionary
+        table has a key column, all keys are searched with a single join.  Otherwise,
+        the dictionary table is scanned once for the whole batch.
+        """
+        querykeys = [namematch.soundex(searchstr) for searchstr in searchstrs]
+
+        keycol = self._getKeyColumn('soundex')
+        if keycol != None:
+            rows = [(qid, key, None) for qid, key in enumerate(querykeys)]
+            return self._searchBatchTable(len(searchstrs), rows, 'n.{0}=q.val'.format(keycol))
+
+        keyqids = {}
+        for qid, key in enumerate(querykeys):
+            keyqids.setdefault(key, []).append(qid)
+
+        results = [[] for cnt in range(len(searchstrs))]
+        self.dbcursor.execute('SELECT soundex(n.{0}), n.{0} FROM {1} n'.format(
+                self.dbcol, self.dbtable))
+        for key, result in self.dbcursor:
+            if key != None:
+                for qid in keyqids.get(key, ()):
+                    results[qid].append(result)
+
+        return results
+
 
 class DMetaphoneMatcher(Matcher):
     """
     Implements approximate string matching using Lawrence Philips' Double Metaphone
     phonetic encoding algorithm.  As currently implemented, both Double Metaphone
-    encodings are used, if available.
+    encodings are used, if available.  If the dictionary table has columns of
+    precomputed Double Metaphone keys (such as the "namestr_dmetaphone" and
+    "namestr_dmetaphone_alt" columns of the names table), the keys are searched
+    directly, which can use indexes.
     """
+    def __init__(self, dbtablename=None, dbcolname=None, dbcursor=None):
+        self.query = None
+
+        # Call the superclass initializer.
+        Matcher.__init__(self, dbtablename, dbcolname, dbcursor)
+
+    def setDBTableInfo(self, dbtablename, dbcolname):
+        # Call the superclass method.
+        Matcher.setDBTableInfo(self, dbtablename, dbcolname)
+
+        self.query = None
+
+    def setDBCursor(self, dbcursor):
+        # Call the superclass method.
+        Matcher.setDBCursor(self, dbcursor)
+
+        self.query = None
+
     def match(self, searchstr):
-        query = """SELECT {0} FROM {1} n
-            WHERE dmetaphone(n.{0})=dmetaphone(%s)
-            OR dmetaphone_alt(n.{0})=dmetaphone_alt(%s)""".format(self.dbcol, self.dbtable)
-        #print query
+        if self.query == None:
+            keycol = self._getKeyColumn('dmetaphone')
+            altkeycol = self._getKeyColumn('dmetaphone_alt')
+            if keycol != None and altkeycol != None:
+                self.query = """SELECT {0} FROM {1} n
+                    WHERE n.{2}=dmetaphone(?)
+                    OR n.{3}=dmetaphone_alt(?)""".format(self.dbcol, self.dbtable, keycol, altkeycol)
+            else:
+                self.query = """SELECT {0} FROM {1} n
+                    WHERE dmetaphone(n.{0})=dmetaphone(?)
+                    OR dmetaphone_alt(n.{0})=dmetaphone_alt(?)""".format(self.dbcol, self.dbtable)
+        #print self.query
     
-        #print self.dbcursor.mogrify(query, (searchstr, searchstr))
-        self.dbcursor.execute(query, (searchstr, searchstr))
+        self.dbcursor.execute(self.query, (searchstr, searchstr))
         results = self.dbcursor.fetchall()
     
         return [result[0] for result in results]
 
+    def _matchBatch(self, searchstrs):
+        """
+        Calculates the Double Metaphone keys of the search strings in Python.  If the
+        dictionary table has key columns, all keys are searched with a single join.
+        Otherwise, the dictionary table is scanned once for the whole batch.
+        """
+        querykeys = [(namematch.dmetaphone(searchstr), namematch.dmetaphoneAlt(searchstr))
+                for searchstr in searchstrs]
+
+        keycol = self._getKeyColumn('dmetaphone')
+        altkeycol = self._getKeyColumn('dmetaphone_alt')
+        if keycol != None and altkeycol != None:
+            rows = [(qid, key, altkey) for qid, (key, altkey) in enumerate(querykeys)]
+            return self._searchBatchTable(len(searchstrs), rows,
+                    'n.{0}=q.val OR n.{1}=q.altval'.format(keycol, altkeycol))
+
+        keyqids = {}
+        altkeyqids = {}
+        for qid, (key, altkey) in enumerate(querykeys):
+            keyqids.setdefault(key, []).append(qid)
+            altkeyqids.setdefault(altkey, []).append(qid)
+
+        # As in SQL, null keys never match.
+        keyqids.pop(None, None)
+        altkeyqids.pop(None, None)
+
+        results = [[] for cnt in range(len(searchstrs))]
+        self.dbcursor.execute('SELECT dmetaphone(n.{0}), dmetaphone_alt(n.{0}), n.{0} FROM {1} n'.format(
+                self.dbcol, self.dbtable))
+        for key, altkey, result in self.dbcursor:
+            qids = set(keyqids.get(key, ()))
+            qids.update(altkeyqids.get(altkey, ()))
+            for qid in qids:
+                results[qid].append(result)
+
+        return results
@@ -1,7 +1,13 @@
 
 create table "ftest_genus_names" (
-   gname_id  serial ,
+   gname_id  integer ,
    namestr   text   ,
+   namestr_soundex        text ,
+   namestr_dmetaphone     text ,
+   namestr_dmetaphone_alt text ,
    constraint pk_ftest_genus_names primary key (gname_id)
 )   ;
+create index ftest_genus_names_soundex_idx on ftest_genus_names (namestr_soundex);
+create index ftest_genus_names_dmetaphone_idx on ftest_genus_names (namestr_dmetaphone);
+create index ftest_genus_names_dmetaphone_alt_idx on ftest_genus_names (namestr_dmetaphone_alt);
 
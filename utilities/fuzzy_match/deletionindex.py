@@ -0,0 +1,126 @@
+"""
+Provides an in-memory symmetric deletion index (as used by the SymSpell algorithm) for
+finding all dictionary strings within a given Damerau-Levenshtein distance of a search
+string.  Instead of generating the full D-L neighborhood of the search string, which
+includes every possible insertion and substitution, the index stores every string that
+can be made from a dictionary string by deleting up to k characters.  Two strings within
+distance k of each other always have at least one such deletion variant in common, so a
+search only needs to look up the deletion variants of the search string, and the few
+candidates that are found are then verified by calculating their actual distance.
+"""
+
+from taxolib.namematch import dlDistance
+
+
+def getDeletions(searchstr, maxdist):
+    """
+    Returns the set of all strings that can be made by deleting up to maxdist
+    characters from searchstr, including searchstr itself.
+    """
+    deletions = set([searchstr])
+    level = deletions
+    for cnt in range(maxdist):
+        nextlevel = set()
+        for delstr in level:
+            for pos in range(len(delstr)):
+                nextlevel.add(delstr[:pos] + delstr[pos+1:])
+        deletions |= nextlevel
+        level = nextlevel
+
+    return deletions
+
+
+class DeletionIndex:
+    """
+    A hash table that maps every deletion variant (up to maxdist deletions) of every
+    dictionary string ("term") to the IDs of the terms that produce it.  Comparisons are
+    not case sensitive.  To save memory, a deletion variant that is produced by a single
+    term (by far the most common case) is mapped directly to the term ID rather than to
+    a list of IDs.
+    """
+    def __init__(self, maxdist=1, namestrs=()):
+        self.maxdist = maxdist
+
+        # The dictionary strings and their lower-case forms.
+        self.terms = []
+        self.keys = []
+
+        self.deletions = {}
+
+        self.termids = {}
+        self.addNames(namestrs)
+
+    def __len__(self):
+        return len(self.terms)
+
+    def addNames(self, namestrs):
+        """
+        Adds the strings in an iterable to the index.  Strings that are already in the
+        index are ignored.
+        """
+        for namestr in namestrs:
+            if namestr in self.termids:
+                continue
+
+            term_id = len(self.terms)
+            self.termids[namestr] = term_id
+            self.terms.append(namestr)
+            key = namestr.lower()
+            self.keys.append(key)
+
+            for delstr in getDeletions(key, self.maxdist):
+                entry = self.deletions.get(delstr)
+                if entry == None:
+                    self.deletions[delstr] = term_id
+                elif isinstance(entry, list):
+                    entry.append(term_id)
+                else:
+                    self.deletions[delstr] = [entry, term_id]
+
+    def search(self, searchstr, maxdist=None):
+        """
+        Returns all terms with a Damerau-Levenshtein distance (as calculated by
+        namematch.dlDistance()) of at most maxdist from searchstr, as a list of
+        (term, distance) tuples sorted by distance.  If maxdist is not provided, the
+        maximum distance of the index is used.  maxdist cannot be greater than the
+        maximum distance of the index.
+        """
+        if maxdist == None:
+            maxdist = self.maxdist
+        elif maxdist > self.maxdist:
+            raise ValueError('The maximum distance for searching the deletion index, '
+                    + str(maxdist) + ', is greater than the maximum distance of the index, '
+                    + str(self.maxdist) + '.')
+
+        key = searchstr.lower()
+
+        candidates = set()
+        for delstr in getDeletions(key, maxdist):
+            entry = self.deletions.get(delstr)
+            if entry == None:
+                continue
+            elif isinstance(entry, list):
+                candidates.update(entry)
+            else:
+                candidates.add(entry)
+
+        results = []
+        for term_id in candidates:
+            dist = dlDistance(key, self.keys[term_id], maxdist)
+            if dist <= maxdist:
+                results.append((self.terms[term_id], dist))
+
+        results.sort(key=lambda result: (result[1], result[0]))
+
+        return results
+
+
+def getIndex(dbcur, tablename, colname, maxdist=1):
+    """
+    Builds a deletion index of the unique, non-null values of a column of a database
+    table (for example, the "namestr" column of the "names" table).
+    """
+    dbcur.execute('SELECT DISTINCT {0} FROM {1} WHERE {0} IS NOT NULL ORDER BY {0}'.format(
+            colname, tablename))
+
+    return DeletionIndex(maxdist, (row[0] for row in dbcur.fetchall()))
@@ -3,11 +3,12 @@
 import sys
 import time, timeit
 import csv
+import itertools
 import json
-import approxmatch
 from argparse import ArgumentParser
 # A hack for now to get the local package to import.
 sys.path.append('../')
+import approxmatch
 from taxolib import taxodatabase, taxoconfig
 from taxolib.csvtaxonomy import UnicodeDictReader
 
@@ -21,22 +22,6 @@ qminscore = 1
 qmaxscore = qsumscore = 0
 qminpair = None
 
-def qgramMatch(pgcur, searchstr):
-    """
-    Searches for an approximate string match using trigram matching.  Returns
-    a list of all candidate matches that exceed the similarity score threshold.
-    Each item of the list is a tuple containing the candidate string and the
-    similarity score.
-    """
-    query = """SELECT namestr, similarity(namestr, %s)
-        FROM {0} n WHERE n.namestr %% %s""".format(args.table)
-
-    #print pgcur.mogrify(query, (searchstr, searchstr))
-    pgcur.execute(query, (searchstr, searchstr))
-    results = pgcur.fetchall()
-
-    return results
-
 def processQgramResults(searchres, searchstr, correctstr):
     """
     Updates quantities used for calculating descriptive statistics of trigram
@@ -110,32 +95,59 @@ def processResults(searchres, correctstr):
 
     return correctmatch
 
-def processCSVFile(reader, matcher, calcstats=True, writer=None):
+def getSearchName(row):
+    """
+    Returns the incorrect name string from an input CSV row with the correct character casing.
+    """
+    return row['Genus'][0].upper() + row['Genus'][1:].lower()
+
+def iterBatchResults(reader, matcher, scored):
+    """
+    Generates tuples of (input CSV row, search results) using the matcher's batch search API.
+    """
+    rows, searchrows = itertools.tee(reader)
+    searchnames = (getSearchName(row) for row in searchrows)
+
+    if scored:
+        batchresults = matcher.matchScoredMany(searchnames)
+    else:
+        batchresults = matcher.matchMany(searchnames)
+
+    for row, (searchname, results) in itertools.izip(rows, batchresults):
+        yield (row, results)
+
+def processCSVFile(reader, matcher, calcstats=True, writer=None, batchsize=0):
     """
     Processes the input CSV file by reading each row and executing a search for the incorrect
     name using the chosen search method.  If calcstats is True, then the results of each search
     are processed to see if the correct match was found and also calculate other performance
     metrics, such as the false positive count.  If a CSV writer is provided, and calcstats is
-    True, information about failed matches will be written to the output file.  This function
-    returns a tuple containing the total number of rows process and the total number of correct
-    matches, in that order.
+    True, information about failed matches will be written to the output file.  If batchsize is
+    greater than 0, all names are searched with the matcher's batch search API, using batches
+    of batchsize names.  This function returns a tuple containing the total number of rows
+    process and the total number of correct matches, in that order.
     """
     totalcnt = correctcnt = 0
 
+    scored = calcstats and args.method == 'qgram'
+
+    if batchsize > 0:
+        matcher.setBatchSize(batchsize)
+        rowresults = iterBatchResults(reader, matcher, scored)
+    elif scored:
+        rowresults = ((row, matcher.matchScored(getSearchName(row))) for row in reader)
+    else:
+        rowresults = ((row, matcher.match(getSearchName(row))) for row in reader)
+
     # Read each row and attempt an approximate match for each incorrect genus name.
-    for row in reader:
+    for row, results in rowresults:
         totalcnt += 1
         #print 'Incorrect name:', row['Genus']
         #print 'Correct name:', row['standardGenus']
-    
-        # Correct the character casing for the name string.
-        searchname = row['Genus'][0].upper() + row['Genus'][1:].lower()
-    
-        results = matcher.match(searchname)
 
         if calcstats:
             correctmatch = False
-            if False:#method == 'qgram':
+            if args.method == 'qgram':
                 correctmatch = processQgramResults(results, row['Genus'], row['standardGenus'])
             else:
                 correctmatch = processResults(results, row['standardGenus'])
@@ -158,7 +170,7 @@ def printStats(totalcnt, correctcnt, noisecnt, falseposcnt, outformat='text'):
             'mean_rs_size': float(noisecnt) / correctcnt,
             'failcnt': nomatch,
             'falseposcnt': falseposcnt,
-            'falsepospct': float(falseposcnt) / nomatch * 100
+            'falsepospct': float(falseposcnt) / nomatch * 100 if nomatch > 0 else 0.0
             }
     if outformat == 'text':
         print '\n' + str(totalcnt) + ' total incorrect names examined.'
@@ -225,7 +237,7 @@ class CodeTimer:
 
 argp = ArgumentParser(description='Searches for taxa in the taxonomy database by matching the taxon name \
 string.  "%" can be used as a wildcard character in the search string.')
-argp.add_argument('-d', '--dbconf', help='the database configuration file ("database.conf" by default)')
+argp.add_argument('-d', '--dbconf', help='the SQLite database file ("../database.sqlite" by default)')
 argp.add_argument('-t', '--table', help='the database table name ("ftest_genus_names" by default)')
 argp.add_argument('-wf', '--write_failed', help='a file name for writing failed matches in CSV format')
 argp.add_argument('-i', '--timer', action='store_true', help='Enables timer mode.  Timer mode calculates \
@@ -234,14 +246,28 @@ performance statistics will not be displayed.')
 argp.add_argument('-tr', '--timer_runs', type=int, help='The number of complete search runs to execute when \
 running in timer mode.  The best time among all runs is taken as the final run time.  The default is 3.')
 argp.add_argument('-m', '--method', help='the matching method to use ("exact", "qgram", "neighbor", \
-"wcneighbor", "dmetaphone", "soundex", or "hybrid")')
+"wcneighbor", "deletion", "trie", "dmetaphone", "soundex", or "hybrid")')
+argp.add_argument('-k', '--dl_distance', type=int, help='The maximum Damerau-Levenshtein distance to use \
+for the "neighbor", "deletion", and "trie" methods.  The default is 1.')
+argp.add_argument('-hdl', '--hybrid_dl_method', help='The Damerau-Levenshtein matching method to use \
+for the "hybrid" method ("neighbor" [the default], "deletion", or "trie").')
+argp.add_argument('-tf', '--trie_file', help='A file for saving and loading the dictionary trie used by \
+the "trie" method.  If not provided, the trie is rebuilt from the database for every run.')
+argp.add_argument('-b', '--batch_size', type=int, help='If greater than 0, names are searched in \
+batches of this size with the batch search API instead of one at a time.  The default is 0.')
+argp.add_argument('-w', '--workers', type=int, help='The number of worker processes to use for \
+searching.  If greater than 1, names are searched in batches (100 names by default; see \
+--batch_size) in parallel.  The default is 1.')
 argp.add_argument('-qgt', '--qgram_threshold', type=float, help='The similarity threshold to use for \
 qgram-based matching.  The default is 0.3.')
+argp.add_argument('-qge', '--qgram_engine', help='The trigram search engine to use for qgram-based \
+matching, either "postings" [the default] or "csr".')
 argp.add_argument('-fo', '--output_format', help='The format for reporting results, either "text" \
 [the default] or "json".')
 argp.add_argument('csv_file', help='the input CSV file')
-argp.set_defaults(dbconf='../database.conf', table='ftest_genus_names', write_failed='', timer_runs=3,
-        method='qgram', qgram_threshold=0.3, output_format='text')
+argp.set_defaults(dbconf='../database.sqlite', table='ftest_genus_names', write_failed='', timer_runs=3,
+        method='qgram', qgram_threshold=0.3, dl_distance=1, hybrid_dl_method='neighbor', trie_file=None,
+        batch_size=0, workers=1, qgram_engine='postings', output_format='text')
 args = argp.parse_args()
 
 # Get a cursor for the taxonomy database.
@@ -260,20 +286,45 @@ if args.method == 'qgram':
     matcher = approxmatch.QgramMatcher(args.table, 'namestr', pgcur)
     # Set the qgram matching similarity threshold.
     matcher.setSimilarityCutoff(args.qgram_threshold)
+    if args.qgram_engine == 'csr':
+        matcher.setEngine(approxmatch.QgramMatcher.ENGINE_CSR)
 elif args.method == 'exact':
     matcher = approxmatch.ExactMatcher(args.table, 'namestr', pgcur)
 elif args.method == 'neighbor':
     matcher = approxmatch.DLMatcher(args.table, 'namestr', pgcur)
+    matcher.setDLDistance(args.dl_distance)
 elif args.method == 'wcneighbor':
     matcher = approxmatch.DLMatcher(args.table, 'namestr', pgcur)
     matcher.setSearchMethod(approxmatch.DLMatcher.METHOD_WCNHOOD)
+elif args.method == 'deletion':
+    matcher = approxmatch.DLMatcher(args.table, 'namestr', pgcur)
+    matcher.setSearchMethod(approxmatch.DLMatcher.METHOD_DELETIONS)
+    matcher.setDLDistance(args.dl_distance)
+elif args.method == 'trie':
+    matcher = approxmatch.TrieMatcher(args.table, 'namestr', pgcur)
+    matcher.setIndexFile(args.trie_file)
+    matcher.setDLDistance(args.dl_distance)
 elif args.method == 'hybrid':
     matcher = approxmatch.HybridMatcher(args.table, 'namestr', pgcur)
+    if args.hybrid_dl_method == 'deletion':
+        dlmatcher = approxmatch.DLMatcher()
+        dlmatcher.setSearchMethod(approxmatch.DLMatcher.METHOD_DELETIONS)
+        matcher.setDLMatcher(dlmatcher)
+    elif args.hybrid_dl_method == 'trie':
+        dlmatcher = approxmatch.TrieMatcher()
+        dlmatcher.setIndexFile(args.trie_file)
+        matcher.setDLMatcher(dlmatcher)
 elif args.method == 'soundex':
     matcher = approxmatch.SoundexMatcher(args.table, 'namestr', pgcur)
 elif args.method == 'dmetaphone':
     matcher = approxmatch.DMetaphoneMatcher(args.table, 'namestr', pgcur)
 
+# Run the searches in parallel, if requested.  Parallel searches always use batches.
+if args.workers > 1:
+    matcher = approxmatch.ParallelMatcher(matcher, args.workers)
+    if args.batch_size < 1:
+        args.batch_size = 100
+
 if not(args.timer):
     # Run the test searches in non-timer mode.
 
@@ -289,7 +340,7 @@ if not(args.timer):
     reader = UnicodeDictReader(fin)
 
     # Process the input file by executing a search for each input row.
-    totalcnt, correctcnt = processCSVFile(reader, matcher, writer=writer)
+    totalcnt, correctcnt = processCSVFile(reader, matcher, writer=writer, batchsize=args.batch_size)
 
     # Print the results.
     printStats(totalcnt, correctcnt, noisecnt, falseposcnt, args.output_format)
@@ -298,6 +349,10 @@ else:
 
     timer = CodeTimer()
 
+    # Run one search before timing so that any in-memory dictionary index is already
+    # built or loaded.
+    matcher.match('Test')
+
     for cnt in range(args.timer_runs):
         print 'Timing run ' + str(cnt + 1) + ' of ' + str(args.timer_runs) + '...'
 
@@ -307,7 +362,7 @@ else:
 
         # Calculate the time required to process all test cases.
         with timer:
-            totalcnt = processCSVFile(reader, matcher, calcstats=False)[0]
+            totalcnt = processCSVFile(reader, matcher, calcstats=False, batchsize=args.batch_size)[0]
 
         fin.close()
 
@@ -319,11 +374,12 @@ else:
     print 'Mean elapsed processor time:', timer.getMeanPTime(), 's\n'
     smtpquery = timer.getMinWCTime() / totalcnt
     amtpquery = timer.getMeanWCTime() / totalcnt
-    tunit = 's'
+    unit = 's'
     if smtpquery < 0.1:
         smtpquery *= 1000
         amtpquery *= 1000
         unit = 'ms'
     print 'Shortest mean time per query (mean query time for fastest test):', smtpquery, unit
     print 'Average mean time per query (mean query time across all tests):', amtpquery, unit, '\n'
+    print 'Best throughput:', totalcnt / timer.getMinWCTime(), 'queries/s\n'
 
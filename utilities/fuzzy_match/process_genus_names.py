@@ -8,12 +8,12 @@ from taxolib.csvtaxonomy import UnicodeDictReader
 from argparse import ArgumentParser
 
 
-argp = ArgumentParser(description='Loads a list of valid genus names from a CSV file into a PostgreSQL database table.')
-argp.add_argument('-d', '--dbconf', help='the database configuration file ("../database.conf" by default)')
+argp = ArgumentParser(description='Loads a list of valid genus names from a CSV file into a database table.')
+argp.add_argument('-d', '--dbconf', help='the SQLite database file ("../database.sqlite" by default)')
 argp.add_argument('-t', '--table', help='the database table name ("ftest_genus_names" by default)')
 #argp.add_argument('-s', '--nosynonyms', action='store_true', help='do not synonyms for taxa names')
 argp.add_argument('csv_file', help='the input CSV file')
-argp.set_defaults(dbconf='../database.conf', table='ftest_genus_names')
+argp.set_defaults(dbconf='../database.sqlite', table='ftest_genus_names')
 args = argp.parse_args()
 
 # Get a cursor for the taxonomy database.
@@ -23,7 +23,7 @@ except ConfigError as e:
     exit('\n' + str(e) + '\n')
 
 # Empty the table.
-pgcur.execute('TRUNCATE TABLE {0}'.format(args.table))
+pgcur.execute('DELETE FROM {0}'.format(args.table))
 
 # Open the CSV file.
 fin = open(args.csv_file, 'rU')
@@ -40,9 +40,14 @@ for row in reader:
 print '\nFound', len(genera), 'unique genus names in', cnt, 'CSV file rows.\n'
 
 # Insert the rows into the database.
-query = 'INSERT INTO {0} (namestr) VALUES (%s)'.format(args.table)
+query = 'INSERT INTO {0} (namestr) VALUES (?)'.format(args.table)
 for gname in genera:
     pgcur.execute(query, (gname,))
 
+# Calculate the phonetic keys of the names.
+pgcur.execute("""UPDATE {0} SET namestr_soundex=soundex(namestr),
+    namestr_dmetaphone=dmetaphone(namestr), namestr_dmetaphone_alt=dmetaphone_alt(namestr)""".format(
+        args.table))
+
 pgcur.connection.commit()
 
@@ -1,16 +1,27 @@
 #!/usr/bin/python
 
-import json
+import sys
 import csv
-import subprocess
+import itertools
 from argparse import ArgumentParser
+# A hack for now to get the local package to import.
+sys.path.append('../')
+import approxmatch
+from thresholdsweep import ThresholdSweep
+from taxolib import taxodatabase, taxoconfig
+from taxolib.csvtaxonomy import UnicodeDictReader
 
 
 argp = ArgumentParser(description='Profiles the performance of qgram approximate string matching for \
-different values of the minimum similarity threshold.')
+different values of the minimum similarity threshold.  Each name is searched only once, at the lowest \
+threshold, and the statistics for all thresholds are calculated from the scores of the results.')
 argp.add_argument('-o', '--fileout', required=True, help='an output CSV file name')
+argp.add_argument('-d', '--dbconf', help='the SQLite database file ("../database.sqlite" by default)')
+argp.add_argument('-t', '--table', help='the database table name ("ftest_genus_names" by default)')
+argp.add_argument('-e', '--engine', help='the trigram search engine to use, either "postings" or \
+"csr" [the default]')
 argp.add_argument('csv_file', help='the input CSV file')
-argp.set_defaults()
+argp.set_defaults(dbconf='../database.sqlite', table='ftest_genus_names', engine='csr')
 args = argp.parse_args()
 
 # Define the similarity threshold values to test.
@@ -24,20 +35,37 @@ testvals = [test_min + interval * cnt for cnt in range(test_steps - 1)]
 testvals.append(test_max)
 #print testvals
 
-# Open and initialize the output CSV file.
+# Get a cursor for the taxonomy database.
+try:
+    pgcur = taxodatabase.getDBCursor(args.dbconf)
+except taxoconfig.ConfigError as e:
+    exit('\n' + str(e) + '\n')
+
+# Search at the lowest threshold so that the results include those of every threshold.
+matcher = approxmatch.QgramMatcher(args.table, 'namestr', pgcur)
+matcher.setSimilarityCutoff(min(testvals))
+if args.engine == 'csr':
+    matcher.setEngine(approxmatch.QgramMatcher.ENGINE_CSR)
+
+# Open the input CSV file.
+fin = open(args.csv_file, 'rU')
+rows, searchrows = itertools.tee(UnicodeDictReader(fin))
+
+# Correct the character casing for the search name strings.
+searchnames = (row['Genus'][0].upper() + row['Genus'][1:].lower() for row in searchrows)
+
+sweep = ThresholdSweep(testvals)
+for row, (searchname, results) in itertools.izip(rows, matcher.matchScoredMany(searchnames)):
+    sweep.addResults(results, row['standardGenus'])
+
+fin.close()
+
+# Write the results to the output CSV file.
 fout = open(args.fileout, 'wb')
 writer = csv.writer(fout)
 writer.writerow(('simthreshold', 'correctpct', 'falsepospct', 'mean_rs_size'))
 
-for testval in testvals:
-    command = './fuzzy_test.py --method qgram --qgram_threshold {0} --output_format json {1}'
-    command = command.format(testval, args.csv_file)
-
-    print command
-    resstr = subprocess.check_output(command, shell=True)
-    res = json.loads(resstr)
-
-    writer.writerow((testval, res['correctpct'], res['falsepospct'], res['mean_rs_size']))
+for res in sweep.getStats():
+    writer.writerow((res['simthreshold'], res['correctpct'], res['falsepospct'], res['mean_rs_size']))
 
 fout.close()
-
@@ -0,0 +1,55 @@
+#!/usr/bin/python
+
+"""
+Tests the saving and re-use of trigram indexes in a SQLite database.  Run this file
+from the fuzzy_match directory.
+"""
+
+import sys
+import sqlite3
+import unittest
+# A hack for now to get the local package to import.
+sys.path.append('../')
+import trigramindex
+
+
+class TestGetIndex(unittest.TestCase):
+    def setUp(self):
+        self.dbcur = sqlite3.connect(':memory:').cursor()
+        self.dbcur.execute('CREATE TABLE names (name_id INTEGER PRIMARY KEY, namestr TEXT)')
+        self.dbcur.executemany('INSERT INTO names (namestr) VALUES (?)',
+                ((namestr,) for namestr in ('Aquila', 'Buteo', 'Circus', 'Falco')))
+
+    def test_reuse(self):
+        trigramindex.getIndex(self.dbcur, 'names', 'namestr')
+        self.dbcur.execute("UPDATE trigram_terms SET namestr='Marker' WHERE namestr='Buteo'")
+
+        # The table has not changed, so the saved (and altered) index should be loaded.
+        index = trigramindex.getIndex(self.dbcur, 'names', 'namestr')
+        self.assertEqual([result[0] for result in index.search('Buteo', 0.5)], ['Marker'])
+
+    def test_rename(self):
+        index = trigramindex.getIndex(self.dbcur, 'names', 'namestr')
+        self.assertEqual([result[0] for result in index.search('Buteo', 0.5)], ['Buteo'])
+
+        # Renaming a name does not change the number of rows or the largest row ID.
+        self.dbcur.execute("UPDATE names SET namestr='Milvus' WHERE namestr='Buteo'")
+
+        index = trigramindex.getIndex(self.dbcur, 'names', 'namestr')
+        self.assertEqual(index.search('Buteo', 0.5), [])
+        self.assertEqual([result[0] for result in index.search('Milvus', 0.5)], ['Milvus'])
+
+    def test_delete_and_insert(self):
+        trigramindex.getIndex(self.dbcur, 'names', 'namestr')
+
+        # Replace the first row with a new row that has the same row ID.
+        self.dbcur.execute('DELETE FROM names WHERE name_id=1')
+        self.dbcur.execute("INSERT INTO names (name_id, namestr) VALUES (1, 'Pernis')")
+
+        index = trigramindex.getIndex(self.dbcur, 'names', 'namestr')
+        self.assertEqual(index.search('Aquila', 0.5), [])
+        self.assertEqual([result[0] for result in index.search('Pernis', 0.5)], ['Pernis'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+"""
+Calculates matching performance statistics for a range of similarity thresholds from
+a single set of scored search results.  Raising a matcher's similarity threshold only
+removes results with lower scores, so the results of a search at the lowest threshold
+contain the results for every higher threshold.  This works with any matcher that
+returns (string, score) tuples with higher scores for better matches, such as
+QgramMatcher.matchScoredMany().  The statistics are the same as those reported by
+fuzzy_test.py.
+"""
+
+import bisect
+
+
+class ThresholdSweep:
+    """
+    Accumulates the scores of the results of each search and calculates the
+    performance statistics for each of a list of similarity thresholds.
+    """
+    def __init__(self, thresholds):
+        self.thresholds = list(thresholds)
+
+        # For each search, the sorted scores of all results and the score of the
+        # correct string (or None if the correct string was not found).
+        self.allscores = []
+        self.correctscores = []
+
+    def addResults(self, results, correctstr):
+        """
+        Adds the scored results, as a list of (string, score) tuples, of a search for
+        which correctstr is the correct match.
+        """
+        correctscore = None
+        for result in results:
+            if result[0] == correctstr:
+                correctscore = result[1]
+
+        self.allscores.append(sorted([result[1] for result in results]))
+        self.correctscores.append(correctscore)
+
+    def getStats(self):
+        """
+        Returns a list of the statistics for each threshold, as dictionaries with the
+        keys "simthreshold", "totalcnt", "correctcnt", "correctpct", "mean_rs_size",
+        "failcnt", "falseposcnt", and "falsepospct".
+        """
+        totalcnt = len(self.allscores)
+
+        allstats = []
+        for threshold in self.thresholds:
+            correctcnt = noisecnt = falseposcnt = 0
+            for scores, correctscore in zip(self.allscores, self.correctscores):
+                rescnt = len(scores) - bisect.bisect_left(scores, threshold)
+                if correctscore != None and correctscore >= threshold:
+                    correctcnt += 1
+                    noisecnt += rescnt
+                elif rescnt > 0:
+                    falseposcnt += 1
+
+            nomatch = totalcnt - correctcnt
+            allstats.append({
+                'simthreshold': threshold,
+                'totalcnt': totalcnt,
+                'correctcnt': correctcnt,
+                'correctpct': float(correctcnt) / totalcnt * 100 if totalcnt > 0 else 0.0,
+                'mean_rs_size': float(noisecnt) / correctcnt if correctcnt > 0 else 0.0,
+                'failcnt': nomatch,
+                'falseposcnt': falseposcnt,
+                'falsepospct': float(falseposcnt) / nomatch * 100 if nomatch > 0 else 0.0
+            })
+
+        return allstats
@@ -0,0 +1,186 @@
+"""
+Provides an in-memory trie of dictionary strings that can be searched for all strings
+within a given Damerau-Levenshtein distance of a search string.  The search walks the
+trie while calculating one row of the distance matrix for each trie node, which
+simulates a Levenshtein automaton for the search string: a branch of the trie is
+abandoned as soon as every entry of its current row exceeds the maximum distance, so a
+search only visits the small part of the trie that is near the search string.  A trie
+can be saved to and loaded from a file with pickle, which is much faster than
+re-building it from the database.
+"""
+
+import os.path
+import cPickle as pickle
+from taxolib.taxodatabase import getColumnFingerprint
+
+
+# The key of a trie node that contains the terms that end at the node.  This cannot be
+# confused with the keys for child nodes, which are single characters.
+TERMS_KEY = ''
+
+
+class TrieIndex:
+    """
+    A trie of the lower-case forms of the dictionary strings ("terms").  Each node is
+    a dictionary that maps characters to child nodes, plus the list of terms that end
+    at the node, if any.  Comparisons are not case sensitive.  The source attribute can
+    be used to record where the terms came from (see getIndex()).
+    """
+    def __init__(self, namestrs=()):
+        self.root = {}
+        self.termcnt = 0
+        self.source = None
+
+        self.addNames(namestrs)
+
+    def __len__(self):
+        return self.termcnt
+
+    def addNames(self, namestrs):
+        """
+        Adds the strings in an iterable to the trie.  Strings that are already in the
+        trie are ignored.
+        """
+        for namestr in namestrs:
+            node = self.root
+            for char in namestr.lower():
+                child = node.get(char)
+                if child == None:
+                    child = {}
+                    node[char] = child
+                node = child
+
+            terms = node.setdefault(TERMS_KEY, [])
+            if namestr not in terms:
+                terms.append(namestr)
+                self.termcnt += 1
+
+    def search(self, searchstr, maxdist=1):
+        """
+        Returns all terms with a Damerau-Levenshtein distance of at most maxdist from
+        searchstr, as a list of (term, distance) tuples sorted by distance.  Distances
+        are the same as those calculated by namematch.dlDistance() (i.e., the
+        unrestricted D-L distance, using the Lowrance-Wagner algorithm).
+        """
+        key = searchstr.lower()
+        keylen = len(key)
+
+        # The rows of the distance matrix for the current trie path, including the
+        # extra row of "infinite" distances used for transpositions (see
+        # namematch.dlDistance()).
+        maxval = keylen + 1000
+        rows = [[maxval] * (keylen + 2), [maxval] + range(keylen + 1)]
+
+        results = []
+        if keylen <= maxdist:
+            for term in self.root.get(TERMS_KEY, ()):
+                results.append((term, keylen))
+
+        self._searchNode(self.root, key, maxdist, rows, {}, results)
+
+        results.sort(key=lambda result: (result[1], result[0]))
+
+        return results
+
+    def _searchNode(self, node, key, maxdist, rows, lastrows, results):
+        """
+        Recursively searches the children of a trie node.  The last element of rows is
+        the distance matrix row for the node itself, and lastrows maps each character
+        to the last row (depth) on the current trie path where it occurred.
+        """
+        keylen = len(key)
+        depth = len(rows) - 1
+        prevrow = rows[-1]
+
+        # Only the entries of the row that are within maxdist of the diagonal need to be
+        # calculated.  All other entries, and any entries that are greater than maxdist,
+        # are stored as maxdist + 1, which does not change any distance <= maxdist.
+        cap = maxdist + 1
+        startpos = max(1, depth - maxdist)
+        endpos = min(keylen, depth + maxdist)
+
+        for char, child in node.iteritems():
+            if char == TERMS_KEY:
+                continue
+
+            row = [prevrow[0]] + [cap] * (keylen + 1)
+            rowmin = row[1] = min(depth, cap)
+            lastcol = key.rfind(char, 0, startpos - 1) + 1
+            for pos in range(startpos, endpos + 1):
+                keychar = key[pos - 1]
+                trow = lastrows.get(keychar, 0)
+                tcol = lastcol
+                if char == keychar:
+                    cost = 0
+                    lastcol = pos
+                else:
+                    cost = 1
+
+                dist = min(prevrow[pos] + cost, row[pos] + 1, prevrow[pos + 1] + 1,
+                        rows[trow][tcol] + (depth - trow - 1) + 1 + (pos - tcol - 1), cap)
+                row[pos + 1] = dist
+                if dist < rowmin:
+                    rowmin = dist
+
+            # If every entry of the row exceeds maxdist, no term below this node can
+            # be within maxdist of the search string.
+            if rowmin > maxdist:
+                continue
+
+            if row[-1] <= maxdist and TERMS_KEY in child:
+                for term in child[TERMS_KEY]:
+                    results.append((term, row[-1]))
+
+            prevlast = lastrows.get(char)
+            lastrows[char] = depth
+            rows.append(row)
+
+            self._searchNode(child, key, maxdist, rows, lastrows, results)
+
+            rows.pop()
+            if prevlast == None:
+                del lastrows[char]
+            else:
+                lastrows[char] = prevlast
+
+    def save(self, filename):
+        """
+        Saves the trie to a file.
+        """
+        with open(filename, 'wb') as fout:
+            pickle.dump(self, fout, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(filename):
+        """
+        Loads a trie that was saved with save().
+        """
+        with open(filename, 'rb') as fin:
+            return pickle.load(fin)
+
+
+def getIndex(dbcur, tablename, colname, filename=None):
+    """
+    Returns a trie of the unique, non-null values of a column of a database table (for
+    example, the "namestr" column of the "names" table).  If a file name is provided,
+    and the file contains a trie of the same table and column that was built when the
+    column had the same contents as it does now (see
+    taxodatabase.getColumnFingerprint()), the trie is loaded from the file.  Otherwise,
+    a new trie is built from the table and, if a file name was provided, saved to the
+    file.
+    """
+    source = (tablename, colname, getColumnFingerprint(dbcur, tablename, colname))
+
+    if filename != None and os.path.exists(filename):
+        index = TrieIndex.load(filename)
+        if index.source == source:
+            return index
+
+    dbcur.execute('SELECT DISTINCT {0} FROM {1} WHERE {0} IS NOT NULL'.format(colname, tablename))
+    index = TrieIndex(row[0] for row in dbcur.fetchall())
+    index.source = source
+
+    if filename != None:
+        index.save(filename)
+
+    return index
@@ -0,0 +1,356 @@
+"""
+Provides an in-process trigram (q-gram, q=3) inverted index for approximate string
+matching that does not require PostgreSQL's pg_trgm extension.  Trigrams are
+extracted and similarity scores are calculated in the same way as by pg_trgm (see
+taxolib/namematch.py), so that similarity thresholds tuned with pg_trgm give the same
+result sets.  An index can be saved to and loaded from side tables in a SQLite
+database.  CSRTrigramIndex provides an alternative, array-based search engine for the
+same index.
+"""
+
+import math
+import bisect
+import itertools
+from array import array
+from taxolib.namematch import getTrigrams, calcTrigramSimilarity
+from taxolib.taxodatabase import getColumnFingerprint
+
+
+# The default similarity threshold, which is the same as pg_trgm's default.
+DEFAULT_THRESHOLD = 0.3
+
+# The type code for the arrays of term IDs in the postings lists.
+POSTINGS_TYPECODE = 'I'
+
+
+class TrigramIndex:
+    """
+    An inverted index that maps each trigram to a postings list of the IDs of the
+    dictionary strings ("terms") that contain it.  Each postings list is an array of
+    term IDs in ascending order.  Searches only examine the postings lists of the
+    search string's trigrams, and candidate terms are pruned by count filtering: a
+    term can only reach the similarity threshold if it shares a minimum number of
+    trigrams with the search string, so only the shortest postings lists need to be
+    read in full to find all candidates.
+    """
+    def __init__(self, namestrs=()):
+        # The dictionary strings and the number of unique trigrams of each.
+        self.terms = []
+        self.trgmcnts = array(POSTINGS_TYPECODE)
+
+        # Maps each trigram to an array of term IDs.
+        self.postings = {}
+
+        self.termids = {}
+        self.addNames(namestrs)
+
+    def __len__(self):
+        return len(self.terms)
+
+    def addNames(self, namestrs):
+        """
+        Adds the strings in an iterable to the index.  Strings that are already in the
+        index are ignored.
+        """
+        for namestr in namestrs:
+            if namestr in self.termids:
+                continue
+
+            term_id = len(self.terms)
+            self.termids[namestr] = term_id
+            self.terms.append(namestr)
+
+            trigrams = getTrigrams(namestr)
+            self.trgmcnts.append(len(trigrams))
+            for trigram in trigrams:
+                if trigram in self.postings:
+                    self.postings[trigram].append(term_id)
+                else:
+                    self.postings[trigram] = array(POSTINGS_TYPECODE, (term_id,))
+
+    def search(self, searchstr, threshold=DEFAULT_THRESHOLD):
+        """
+        Returns all terms that have a similarity score with searchstr of at least
+        threshold, as a list of (term, score) tuples.  The list is sorted by descending
+        score.  This is equivalent to a pg_trgm search with the "%" operator after
+        set_limit(threshold).
+        """
+        trigrams = getTrigrams(searchstr)
+        qlen = len(trigrams)
+        if qlen == 0:
+            return []
+
+        if threshold > 0:
+            # A term with n trigrams that shares c trigrams with the search string has a
+            # similarity score of c / (qlen + n - c), which is at most c / qlen, so every
+            # match must share at least mincnt trigrams with the search string.  (The
+            # small offset guards against rounding errors.)
+            mincnt = max(int(math.ceil(threshold * qlen - 1e-6)), 1)
+            if mincnt > qlen:
+                return []
+
+            # Any term that shares at least mincnt trigrams with the search string must
+            # occur in at least one of any (qlen - mincnt + 1) of its postings lists, so
+            # the candidates are collected from the shortest lists, and the remaining
+            # lists are only probed for the candidates' term IDs.
+            plists = sorted([self.postings.get(trigram, ()) for trigram in trigrams], key=len)
+            splitpos = qlen - mincnt + 1
+
+            counts = {}
+            for plist in plists[:splitpos]:
+                for term_id in plist:
+                    counts[term_id] = counts.get(term_id, 0) + 1
+
+            for plist in plists[splitpos:]:
+                plen = len(plist)
+                for term_id in counts:
+                    pos = bisect.bisect_left(plist, term_id)
+                    if pos < plen and plist[pos] == term_id:
+                        counts[term_id] += 1
+        else:
+            # With a threshold of 0, every term is a match.
+            counts = dict.fromkeys(range(len(self.terms)), 0)
+            for trigram in trigrams:
+                for term_id in self.postings.get(trigram, ()):
+                    counts[term_id] += 1
+
+        results = []
+        for term_id, sharedcnt in counts.iteritems():
+            score = calcTrigramSimilarity(sharedcnt, qlen, self.trgmcnts[term_id])
+            if score >= threshold:
+                results.append((self.terms[term_id], score))
+
+        results.sort(key=lambda result: (-result[1], result[0]))
+
+        return results
+
+    def save(self, dbcur, indexname, fingerprint=None):
+        """
+        Saves the index to side tables in a SQLite database, replacing any index
+        previously saved with the same name.  The optional fingerprint of the source
+        column (see taxodatabase.getColumnFingerprint()) is stored with the index so
+        that getIndex() can tell whether the index is out of date.
+        """
+        _createIndexTables(dbcur)
+
+        dbcur.execute('DELETE FROM trigram_indexes WHERE indexname=?', (indexname,))
+        dbcur.execute('DELETE FROM trigram_terms WHERE indexname=?', (indexname,))
+        dbcur.execute('DELETE FROM trigram_postings WHERE indexname=?', (indexname,))
+
+        dbcur.execute('INSERT INTO trigram_indexes (indexname, fingerprint) VALUES (?, ?)',
+                (indexname, fingerprint))
+        termrows = ((indexname, term_id, self.terms[term_id], self.trgmcnts[term_id])
+                for term_id in range(len(self.terms)))
+        dbcur.executemany('INSERT INTO trigram_terms (indexname, term_id, namestr, trgmcnt) VALUES (?, ?, ?, ?)',
+                termrows)
+        postingrows = ((indexname, trigram, buffer(plist.tostring()))
+                for trigram, plist in self.postings.iteritems())
+        dbcur.executemany('INSERT INTO trigram_postings (indexname, trigram, term_ids) VALUES (?, ?, ?)',
+                postingrows)
+
+        dbcur.connection.commit()
+
+    @staticmethod
+    def load(dbcur, indexname):
+        """
+        Loads an index that was saved to a SQLite database with save().  Returns None if
+        the database does not contain an index with the given name.
+        """
+        _createIndexTables(dbcur)
+
+        dbcur.execute('SELECT count(*) FROM trigram_indexes WHERE indexname=?', (indexname,))
+        if dbcur.fetchone()[0] == 0:
+            return None
+
+        index = TrigramIndex()
+
+        dbcur.execute("""SELECT namestr, trgmcnt FROM trigram_terms
+            WHERE indexname=? ORDER BY term_id""", (indexname,))
+        for namestr, trgmcnt in dbcur:
+            index.termids[namestr] = len(index.terms)
+            index.terms.append(namestr)
+            index.trgmcnts.append(trgmcnt)
+
+        dbcur.execute('SELECT trigram, term_ids FROM trigram_postings WHERE indexname=?', (indexname,))
+        for trigram, term_ids in dbcur:
+            plist = array(POSTINGS_TYPECODE)
+            plist.fromstring(str(term_ids))
+            index.postings[trigram] = plist
+
+        return index
+
+
+class CSRTrigramIndex:
+    """
+    An alternative search engine for a TrigramIndex that is faster for large candidate
+    sets (i.e., low similarity thresholds).  The dictionary is encoded once in
+    compressed sparse row (CSR) form: each trigram is assigned an integer ID, and the
+    postings lists of all trigrams are stored end-to-end in a single array of term IDs,
+    with a second array of the offset of each trigram's list.  Term IDs are assigned in
+    order of trigram count and then term, so the terms with a given number of trigrams
+    always form a contiguous range of IDs.
+
+    A search counts shared trigrams with set operations on whole postings lists rather
+    than by looping over term IDs in Python: after each postings list is processed,
+    levels[k] is the set of terms found in at least k of the lists so far.  All terms
+    with the same shared trigram count and trigram count have the same similarity
+    score, so scores are only calculated once for each such group, and the groups are
+    located by binary search of the sorted term IDs.  Results are the same as those of
+    TrigramIndex.search().
+    """
+    def __init__(self, index):
+        """
+        Builds the CSR form of a TrigramIndex.
+        """
+        order = sorted(range(len(index.terms)),
+                key=lambda term_id: (index.trgmcnts[term_id], index.terms[term_id]))
+        newids = array(POSTINGS_TYPECODE, [0]) * len(order)
+        for newid, term_id in enumerate(order):
+            newids[term_id] = newid
+
+        self.terms = [index.terms[term_id] for term_id in order]
+        self.trgmcnts = array(POSTINGS_TYPECODE, [index.trgmcnts[term_id] for term_id in order])
+
+        # lenstarts[n] is the first term ID of the terms with n or more trigrams.
+        maxcnt = max(self.trgmcnts) if len(self.trgmcnts) > 0 else 0
+        self.lenstarts = array(POSTINGS_TYPECODE,
+                [bisect.bisect_left(self.trgmcnts, cnt) for cnt in range(maxcnt + 2)])
+
+        self.trigramids = {}
+        self.offsets = array(POSTINGS_TYPECODE, [0])
+        self.postings = array(POSTINGS_TYPECODE)
+        for trigram, plist in index.postings.iteritems():
+            self.trigramids[trigram] = len(self.trigramids)
+            self.postings.extend(sorted([newids[term_id] for term_id in plist]))
+            self.offsets.append(len(self.postings))
+
+    def __len__(self):
+        return len(self.terms)
+
+    def getPostings(self, trigram):
+        """
+        Returns the postings list of a trigram as an array of term IDs.
+        """
+        trigram_id = self.trigramids.get(trigram)
+        if trigram_id == None:
+            return array(POSTINGS_TYPECODE)
+
+        return self.postings[self.offsets[trigram_id]:self.offsets[trigram_id + 1]]
+
+    def search(self, searchstr, threshold=DEFAULT_THRESHOLD):
+        """
+        Returns all terms that have a similarity score with searchstr of at least
+        threshold, as a list of (term, score) tuples.  The list is sorted by descending
+        score and then by term, as for TrigramIndex.search().
+        """
+        trigrams = getTrigrams(searchstr)
+        qlen = len(trigrams)
+        if qlen == 0:
+            return []
+
+        # Use count filtering, as for TrigramIndex.search(): only the shortest
+        # (qlen - mincnt + 1) postings lists can add new candidates.
+        if threshold > 0:
+            mincnt = max(int(math.ceil(threshold * qlen - 1e-6)), 1)
+            if mincnt > qlen:
+                return []
+        else:
+            mincnt = 0
+        plists = sorted([self.getPostings(trigram) for trigram in trigrams], key=len)
+        splitpos = qlen - mincnt + 1
+
+        levels = [None, set()]
+        for pos, plist in enumerate(plists):
+            if pos < splitpos:
+                pset = set(plist)
+            else:
+                # Only the current candidates need to be counted.
+                pset = levels[1].intersection(plist)
+            levels.append(set())
+            for cnt in range(pos, 0, -1):
+                levels[cnt + 1] |= levels[cnt] & pset
+            if pos < splitpos:
+                levels[1] |= pset
+
+        # Group the matching terms by score.
+        scoregroups = {}
+        for sharedcnt in range(max(mincnt, 1), qlen + 1):
+            self._addScoreGroups(scoregroups, sorted(levels[sharedcnt] - levels[sharedcnt + 1]),
+                    sharedcnt, qlen, threshold)
+        if mincnt == 0:
+            # With a threshold of 0, terms that share no trigrams are also matches.
+            self._addScoreGroups(scoregroups, sorted(set(range(len(self.terms))) - levels[1]),
+                    0, qlen, threshold)
+
+        results = []
+        for score in sorted(scoregroups, reverse=True):
+            groupterms = [self.terms[term_id] for term_id in scoregroups[score]]
+            groupterms.sort()
+            results.extend(itertools.izip(groupterms, itertools.repeat(score)))
+
+        return results
+
+    def _addScoreGroups(self, scoregroups, term_ids, sharedcnt, qlen, threshold):
+        """
+        Adds the IDs in a sorted list of term IDs that share sharedcnt trigrams with
+        the search string to the lists of matching term IDs for each similarity score.
+        """
+        start = 0
+        while start < len(term_ids):
+            trgmcnt = self.trgmcnts[term_ids[start]]
+            score = calcTrigramSimilarity(sharedcnt, qlen, trgmcnt)
+            if score < threshold:
+                # Scores only decrease as the trigram count increases.
+                break
+
+            end = bisect.bisect_left(term_ids, self.lenstarts[trgmcnt + 1], start)
+            scoregroups.setdefault(score, []).extend(term_ids[start:end])
+            start = end
+
+
+def _createIndexTables(dbcur):
+    """
+    Creates the side tables for saved trigram indexes, if they do not already exist.
+    """
+    dbcur.executescript("""
+        CREATE TABLE IF NOT EXISTS trigram_indexes (
+            indexname TEXT PRIMARY KEY,
+            fingerprint TEXT
+        );
+        CREATE TABLE IF NOT EXISTS trigram_terms (
+            indexname TEXT NOT NULL,
+            term_id INTEGER NOT NULL,
+            namestr TEXT NOT NULL,
+            trgmcnt INTEGER NOT NULL,
+            PRIMARY KEY (indexname, term_id)
+        );
+        CREATE TABLE IF NOT EXISTS trigram_postings (
+            indexname TEXT NOT NULL,
+            trigram TEXT NOT NULL,
+            term_ids BLOB NOT NULL,
+            PRIMARY KEY (indexname, trigram)
+        );""")
+
+def getIndex(dbcur, tablename, colname):
+    """
+    Returns a trigram index of the unique, non-null values of a column of a SQLite
+    database table (for example, the "namestr" column of the "names" table).  If an
+    index of the column was previously saved in the database, and the column has not
+    changed since (see taxodatabase.getColumnFingerprint()), the saved index is loaded.
+    Otherwise, a new index is built from the table and saved for later use.
+    """
+    indexname = tablename + '.' + colname
+    fingerprint = getColumnFingerprint(dbcur, tablename, colname)
+
+    _createIndexTables(dbcur)
+    dbcur.execute('SELECT fingerprint FROM trigram_indexes WHERE indexname=?', (indexname,))
+    saved = dbcur.fetchone()
+    if saved != None and saved[0] == fingerprint:
+        index = TrigramIndex.load(dbcur, indexname)
+    else:
+        dbcur.execute('SELECT DISTINCT {0} FROM {1} WHERE {0} IS NOT NULL ORDER BY {0}'.format(
+                colname, tablename))
+        index = TrigramIndex(row[0] for row in dbcur.fetchall())
+        index.save(dbcur, indexname, fingerprint)
+
+    return index
@@ -5,15 +5,15 @@
 # instantiate a matcher object, and 1 to actually perform the match.
 
 import sys
-import approxmatch
 # A hack for now to get the local taxonomy package to import.
 sys.path.append('../')
+import approxmatch
 from taxolib import taxodatabase, taxoconfig
 
 
 # Get a cursor for the taxonomy database.
 try:
-    pgcur = taxodatabase.getDBCursor('../database.conf')
+    pgcur = taxodatabase.getDBCursor('../database.sqlite')
 except taxoconfig.ConfigError as e:
     exit('\n' + str(e) + '\n')
 
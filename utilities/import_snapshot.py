@@ -0,0 +1,45 @@
+#!/usr/bin/python
+
+import sys
+import os.path
+from taxolib import snapshotresolve
+from argparse import ArgumentParser
+
+
+argp = ArgumentParser(description='Imports Catalog of Life and Zoobank name data into a local \
+snapshot database, which load_taxonomy.py can use for name citation resolution instead of the \
+Web services (see its -n option).  Catalog of Life names are read from the taxa file ("taxa.txt") \
+of a Catalog of Life Darwin Core archive.  Zoobank nomenclatural acts and references are read \
+from CSV files with the same fields as the results of the Zoobank API.  Importing data for one \
+source replaces any data that were previously imported for that source.')
+argp.add_argument('-d', '--snapshot', help='the snapshot database file ("snapshot.sqlite" by default)')
+argp.add_argument('--col', help='a Catalog of Life Darwin Core archive taxa file')
+argp.add_argument('--zoobank', help='a CSV file of Zoobank nomenclatural acts, with the columns \
+"cleanprotonym", "namestring", "rankgroup", and "OriginalReferenceUUID"')
+argp.add_argument('--zoobankrefs', help='a CSV file of Zoobank references, with the columns \
+"ReferenceUUID" and "value"')
+argp.set_defaults(snapshot='snapshot.sqlite', col=None, zoobank=None, zoobankrefs=None)
+args = argp.parse_args()
+
+if args.col == None and args.zoobank == None:
+    exit('\nError: Please provide a Catalog of Life taxa file, a Zoobank acts file, or both.\n')
+if args.zoobankrefs != None and args.zoobank == None:
+    exit('\nError: A Zoobank references file can only be imported along with a Zoobank acts file.\n')
+
+for filename in (args.col, args.zoobank, args.zoobankrefs):
+    if filename != None and not(os.path.exists(filename)):
+        exit('\nError: The input file ' + filename + ' could not be found.\n')
+
+snapcur = snapshotresolve.getSnapshotCursor(args.snapshot)
+
+if args.col != None:
+    print 'Importing Catalog of Life names from ' + args.col + '...'
+    snapshotresolve.importCoLTaxa(snapcur, args.col)
+    snapcur.execute('SELECT count(*) FROM col_names')
+    print 'done;', snapcur.fetchone()[0], 'names imported.'
+
+if args.zoobank != None:
+    print 'Importing Zoobank nomenclatural acts from ' + args.zoobank + '...'
+    snapshotresolve.importZoobankActs(snapcur, args.zoobank, args.zoobankrefs)
+    snapcur.execute('SELECT count(*) FROM zb_acts')
+    print 'done;', snapcur.fetchone()[0], 'nomenclatural acts imported.'
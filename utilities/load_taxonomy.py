@@ -1,12 +1,16 @@
 #!/usr/bin/python
 
 import sys
+import os.path
 from taxolib import taxodatabase
 from taxolib.taxacomponents import Citation
 from taxolib.taxonomy import Taxonomy
 from taxolib.taxoconfig import TaxonomyConfig, ConfigError
 from taxolib.csvtaxonomy import CSVTaxonomyParser, TaxoCSVError
 import taxolib.nameresolve as nameresolve
+import taxolib.snapshotresolve as snapshotresolve
+from taxolib.responsecache import ResponseCache
+from taxolib.httptransport import HTTPTransport
 from argparse import ArgumentParser
 
 
@@ -27,10 +31,143 @@ argp.add_argument('-d', '--dbconf', help='the SQLite database file ("database.sq
 argp.add_argument('-l', '--resolvers', help=citehelpstr)
 argp.add_argument('-c', '--comptaxoid', type=int, help='the ID of a taxonomy to check for name citation \
 data (-1 [=none] by default)')
+argp.add_argument('-b', '--batchsize', type=int, help='the number of taxa to write to the database \
+in each transaction (0 [=all taxa in a single transaction] by default)')
+argp.add_argument('-s', '--stream', type=int, help='process the CSV file in streaming mode: resolve \
+name citations for and write each completed part of the taxonomy once at least STREAM new taxa have \
+been read, rather than parsing the entire CSV file first (0 [=streaming mode disabled] by default)')
+argp.add_argument('-n', '--snapshot', help='a local snapshot database of name citation data (see \
+import_snapshot.py) to use instead of the Web services for name citation resolution')
+argp.add_argument('-w', '--workers', type=int, help='the maximum number of name citation lookups to \
+run concurrently (1 [=sequential resolution] by default; ignored with -n)')
+argp.add_argument('-r', '--maxrate', type=float, help='the maximum number of name citation requests per \
+second to send to each Web service (0 [=no limit] by default; ignored with -n)')
+argp.add_argument('-p', '--plan', action='store_true', help='plan the name citation lookups for \
+the entire taxonomy so that each unique Web service query is only sent once, even if a name occurs \
+more than once in the taxonomy (ignored with -n, because snapshot resolution always matches all names \
+at once)')
+argp.add_argument('--poolsize', type=int, help='the maximum number of idle connections to keep open \
+to each name citation Web service (the number of concurrent lookups or 4, whichever is larger, by default)')
+argp.add_argument('-k', '--cache', help='a SQLite file in which to cache name citation Web service \
+responses for use in later runs (no caching by default)')
+argp.add_argument('-t', '--cachettl', type=float, help='the number of days for which cached responses \
+are used (30 by default; failed lookups are retried after 1 day)')
+argp.add_argument('--cachesize', type=int, help='the maximum number of cached responses (1,000,000 \
+by default; 0 = no limit)')
+argp.add_argument('-o', '--offline', action='store_true', help='do not send any name citation \
+requests; only use responses from the cache file')
 argp.add_argument('infile', help='the CSV taxonomy configuration file')
-argp.set_defaults(dbconf='database.sqlite', resolvers='all', comptaxoid=-1)
+argp.set_defaults(dbconf='database.sqlite', resolvers='all', comptaxoid=-1, batchsize=0, stream=0,
+        snapshot='', workers=1, maxrate=0, plan=False, poolsize=0, cache='', cachettl=30, cachesize=1000000, offline=False)
 args = argp.parse_args()
 
+# Get the name citation resolvers to use.
+if args.snapshot != '':
+    if not(os.path.exists(args.snapshot)):
+        exit('\nError: The snapshot database file ' + args.snapshot + ' could not be found.\n')
+    resolvers = snapshotresolve.getSnapshotResolversList(
+            snapshotresolve.getSnapshotCursor(args.snapshot))
+    if args.workers != 1 or args.maxrate > 0 or args.plan:
+        print '\nThe -w, -r, and -p options have no effect with a snapshot database and will be ignored.'
+
+useres = args.resolvers
+if useres == 'none':
+    resolvers = []
+elif useres != 'all':
+    try:
+        resindex = int(useres)
+        resolvers = [resolvers[resindex]]
+    except (ValueError, IndexError):
+        exit('\nError: "' + useres + '" is an invalid name citations resolver index.\n' + 
+                'To use a specific resolver, you must provide an integer from 0 to '
+                + str(len(resolvers) - 1) + '.\n')
+
+# Set up the name citation response cache, if requested.
+if args.cache != '':
+    rcache = ResponseCache(args.cache, ttl=args.cachettl * 24 * 3600,
+            maxentries=args.cachesize, offline=args.offline)
+elif args.offline:
+    exit('\nError: Offline mode requires a response cache file (see the -k option).\n')
+else:
+    rcache = None
+
+# All resolvers share a single pool of persistent HTTP connections.
+if args.poolsize > 0:
+    transport = HTTPTransport(args.poolsize)
+else:
+    transport = HTTPTransport(max(args.workers, 4))
+
+for resolver in resolvers:
+    resolver.setTransport(transport)
+    # Snapshot resolvers match all names at once, so they do not use these settings.
+    if args.snapshot == '':
+        resolver.setConcurrency(args.workers, args.maxrate)
+        resolver.setPlanning(args.plan)
+    resolver.setResponseCache(rcache)
+    if args.comptaxoid > -1:
+        resolver.setComparisonTaxonomy(args.comptaxoid)
+        resolver.setSkipIfExisting(True)
+
+def resolveNames(taxonomy):
+    """
+    Tries to retrieve citation information for the names in the taxonomy.
+    """
+    # Note that we could include the backbone taxonomy in the name resolution process,
+    # but we don't currently have a good way to get citation data for high-level taxa
+    # anyway, so we just focus on the target taxonomy.
+    for resolver in resolvers:
+        print '\nBeginning name citation resolution with ' + resolver.getSourceDescription() + '...'
+        resolver.resolve(pgcur, taxonomy.roottaxon)
+        print 'name resolution with ' + resolver.getSourceDescription() + ' finished.'
+
+def resolveSubtrees(subtrees, resolved):
+    """
+    Tries to retrieve citation information for the names in a list of subtrees of the
+    taxonomy, in streaming mode.  Each ancestor of the subtrees is resolved only the
+    first time it is needed, and its result is then used as the context for all later
+    subtrees (e.g., the species of a genus that a resolver could not find are skipped).
+    Taxa in the subtrees that were already resolved as ancestors of earlier subtrees are
+    not resolved again.  resolved contains a dictionary for each resolver that maps each
+    taxon resolved as an ancestor to True if its descendents should be resolved (see
+    NamesResolver.resolveTaxon()).
+    """
+    for resolver, resdict in zip(resolvers, resolved):
+        print '\nBeginning name citation resolution with ' + resolver.getSourceDescription() + '...'
+        toresolve = []
+        for subtree in subtrees:
+            # Resolve any ancestors that have not been resolved yet, from the top down.
+            ancestors = []
+            taxon = subtree.parent
+            while taxon not in resdict:
+                ancestors.append(taxon)
+                taxon = taxon.parent
+            allowed = resdict[taxon]
+            for ancestor in reversed(ancestors):
+                if allowed:
+                    allowed = resolver.resolveTaxon(pgcur, ancestor)
+                resdict[ancestor] = allowed
+
+            # Get the roots of the parts of the subtree that have not been resolved yet.
+            stack = [subtree]
+            while allowed and len(stack) > 0:
+                taxon = stack.pop()
+                if taxon not in resdict:
+                    toresolve.append(taxon)
+                elif resdict[taxon]:
+                    stack.extend(reversed(taxon.children))
+
+        resolver.resolveSubtrees(pgcur, toresolve)
+        print 'name resolution with ' + resolver.getSourceDescription() + ' finished.'
+
+        # The subtrees are removed from the taxa tree once they are written to the
+        # database, so their taxa will not be needed as context again.
+        stack = list(subtrees)
+        while len(stack) > 0:
+            taxon = stack.pop()
+            if taxon in resdict:
+                del resdict[taxon]
+                stack.extend(taxon.children)
+
 # Get a cursor for the taxonomy database.
 try:
     pgcur = taxodatabase.getDBCursor(args.dbconf)
@@ -42,9 +179,14 @@ taxoconfig = TaxonomyConfig()
 taxoparser = CSVTaxonomyParser()
 try:
     taxoconfig.read(args.infile)
-    print 'Parsing input CSV taxonomy file...'
-    taxonomyroot = taxoparser.parseCSV(taxoconfig, pgcur)
-    print 'done.'
+    if args.stream > 0:
+        # Only the root taxon is created now; the rest of the CSV file is parsed as the
+        # taxonomy is written to the database.
+        taxonomyroot = taxoparser.openCSV(taxoconfig, pgcur)
+    else:
+        print 'Parsing input CSV taxonomy file...'
+        taxonomyroot = taxoparser.parseCSV(taxoconfig, pgcur)
+        print 'done.'
 except (ConfigError, TaxoCSVError) as e:
     exit('\n' + str(e) + '\n')
 
@@ -64,34 +206,46 @@ if not(taxonomy.linkToBackbone(pgcur)):
 print 'done.'
 #taxonomy.getBackboneTaxonomy().printAll()
 
-useres = args.resolvers
-if useres != 'none':
-    if useres != 'all':
-        try:
-            resindex = int(useres)
-            resolvers = [resolvers[resindex]]
-        except (ValueError, IndexError):
-            exit('\nError: "' + useres + '" is an invalid name citations resolver index.\n' + 
-                    'To use a specific resolver, you must provide an integer from 0 to '
-                    + str(len(resolvers) - 1) + '.\n')
-
-    # Try to retrieve citation information for the names in the taxonomy.
-    # Note that we could include the backbone taxonomy in the name resolution process,
-    # but we don't currently have a good way to get citation data for high-level taxa
-    # anyway, so we just focus on the target taxonomy.
+if args.stream > 0:
+    # Resolve the root taxon and write it to the database along with the taxonomy
+    # metadata and the links to the backbone taxonomy, then parse, resolve, and write
+    # the taxa tree one batch of completed subtrees at a time.  Only the new taxa in
+    # each batch and their ancestors that have not been processed yet are resolved and
+    # written, so each taxon is looked up and written exactly once.
+    resolved = []
     for resolver in resolvers:
         print '\nBeginning name citation resolution with ' + resolver.getSourceDescription() + '...'
-        if args.comptaxoid > -1:
-            resolver.setComparisonTaxonomy(args.comptaxoid)
-            resolver.setSkipIfExisting(True)
-        resolver.resolve(pgcur, taxonomy.roottaxon)
+        resolved.append({taxonomyroot: resolver.resolveTaxon(pgcur, taxonomyroot)})
         print 'name resolution with ' + resolver.getSourceDescription() + ' finished.'
 
-# Make sure the taxonomy is persisted to the database.
-print '\nPersisting taxonomy to the database...'
-taxonomy.persist(pgcur, True)
-print 'finished.'
+    print '\nPersisting taxonomy to the database...'
+    if taxonomy.persist(pgcur, True, batched=True, chunksize=args.batchsize):
+        try:
+            for subtrees in taxoparser.readCSVSubtrees(args.stream):
+                print '\nParsed', taxoparser.getStats()[1], 'taxa from the input CSV taxonomy file.'
+                resolveSubtrees(subtrees, resolved)
+                print '\nPersisting', len(subtrees), 'completed subtree(s) to the database...'
+                taxonomy.persistSubtrees(pgcur, subtrees, True, chunksize=args.batchsize)
+        except TaxoCSVError as e:
+            exit('\n' + str(e) + '\n')
+    print 'finished.'
+else:
+    resolveNames(taxonomy)
+
+    # Make sure the taxonomy is persisted to the database.
+    print '\nPersisting taxonomy to the database...'
+    taxonomy.persist(pgcur, True, batched=True, chunksize=args.batchsize)
+    print 'finished.'
 
 totalrows, totaltaxa = taxoparser.getStats()
 print '\nProcessed', totalrows, 'CSV file rows containing', totaltaxa, 'unique taxa.\n'
 
+requestcnt, connectcnt, reusecnt = transport.getStats()
+if requestcnt > 0:
+    print ('Name citation requests: ' + str(requestcnt) + ' sent, ' + str(reusecnt) +
+            ' of which re-used an open connection.\n')
+
+if rcache != None:
+    hits, misses = rcache.getStats()
+    print 'Name citation lookups: ' + str(hits) + ' cached responses used, ' + str(misses) + ' not cached.\n'
+
@@ -9,11 +9,17 @@ from argparse import ArgumentParser
 
 
 argp = ArgumentParser(description='Searches for taxa in the taxonomy database by matching the taxon name \
-string.  "%" can be used as a wildcard character in the search string.')
+string.  "%" can be used as a wildcard character in the search string.  Matching is not case-sensitive.')
 argp.add_argument('-d', '--dbconf', help='the SQLite database file ("database.sqlite" by default)')
 argp.add_argument('-s', '--nosynonyms', action='store_true', help='do not search synonyms for taxa names')
+argp.add_argument('-m', '--mode', choices=Taxon.SEARCH_MODES, help='how to match names: "like" = the \
+search string must match entire names [default], "token" = the search string must match complete \
+words of names, "prefix" = the search string must match the beginning of names, "substring" = the \
+search string can match any part of names; the last three modes list the best matches first')
+argp.add_argument('-n', '--limit', type=int, help='the maximum number of taxa to list (0 [=no limit] \
+by default)')
 argp.add_argument('search_string', help='the name search string')
-argp.set_defaults(dbconf='database.sqlite', numtaxa=-1, maxdepth=-1)
+argp.set_defaults(dbconf='database.sqlite', numtaxa=-1, maxdepth=-1, mode=Taxon.SEARCH_LIKE, limit=0)
 args = argp.parse_args()
 
 # Get a cursor for the taxonomy database.
@@ -23,17 +29,20 @@ except ConfigError as e:
     exit('\n' + str(e) + '\n')
 
 # Initialize the rank table from the database.
-ranktable = RankTable()
-ranktable.loadFromDB(pgcur)
+ranktable = RankTable.getCached(pgcur)
 
-taxa = Taxon.find(pgcur, args.search_string, ranktable)
+taxa = Taxon.find(pgcur, args.search_string, ranktable, mode=args.mode, limit=args.limit)
 
 # Organize the taxa by their source taxonomies.
-# Create a dictionary mapping taxonomy IDs to lists of taxa.
+# Create a dictionary mapping taxonomy IDs to lists of taxa, and keep track of the
+# order in which the taxonomies are first found so that the best matches are printed
+# first.
 taxonomy_taxa = {}
+taxonomy_ids = []
 for taxon in taxa:
     if taxon.taxonomy_id not in taxonomy_taxa:
         taxonomy_taxa[taxon.taxonomy_id] = []
+        taxonomy_ids.append(taxon.taxonomy_id)
     taxonomy_taxa[taxon.taxonomy_id].append(taxon)
 
 # Print the results.
@@ -51,7 +60,9 @@ else:
     msg = '\nNo matching taxon concepts were found.\n'
 print msg.format(taxacnt, taxonomycnt)
 
-for taxonomy_id, taxa in taxonomy_taxa.iteritems():
+for taxonomy_id in taxonomy_ids:
+    taxa = taxonomy_taxa[taxonomy_id]
+
     # Load the taxonomy metadata from the database.
     taxonomy = Taxonomy(taxonomy_id)
     taxonomy.loadFromDB(pgcur, maxdepth=0)
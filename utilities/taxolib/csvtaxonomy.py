@@ -76,6 +76,111 @@ class CSVTaxonomyParser:
         taxon tree.  The database cursor is needed to access taxonomic rank information.
         Returns the root taxon for the taxon tree structure.
         """
+        inputcsv, charencoding, ranktoCSV, rankt, taxonomyroot = self._initParser(taxoconfig, dbcur)
+
+        # Open and parse the input CSV file.
+        with open(inputcsv, 'rU') as fin:
+            reader = UnicodeDictReader(fin, encoding=charencoding)
+            self._readCSVRows(reader, taxonomyroot, ranktoCSV, rankt)
+
+        return taxonomyroot
+
+    def openCSV(self, taxoconfig, dbcur):
+        """
+        Prepares to parse a taxonomy from a CSV file incrementally with readCSVSubtrees().
+        The arguments are the same as for parseCSV().  Returns the root taxon for the
+        taxon tree structure, which will not have any children until readCSVSubtrees()
+        is called.
+        """
+        self.incparser = self._initParser(taxoconfig, dbcur)
+
+        return self.incparser[4]
+
+    def readCSVSubtrees(self, batchsize=1000):
+        """
+        A generator that parses the CSV file that was opened with openCSV() and
+        periodically yields the parts of the taxon tree that are complete, so that
+        very large taxonomies can be processed (e.g., resolved and written to the
+        database) without ever holding the complete taxon tree in memory.
+
+        A subtree is considered complete once the parser reaches a row that is not part
+        of it.  For example, if the CSV file is sorted by family, each family is complete
+        as soon as the first row for the next family is read.  Once at least batchsize new
+        taxa have been read and some subtrees are complete, a list of the roots of all
+        complete subtrees is yielded.  The subtrees are still attached to the taxon tree
+        when they are yielded, but they are removed from the tree when the generator is
+        resumed.  After the last row is read, a list of all remaining children of the
+        root taxon is yielded, and these are not removed from the tree.
+
+        If rows for the same taxon are not contiguous in the CSV file, a taxon might be
+        removed from the tree before all of its descendents have been read.  In that case,
+        a new Taxon object is created for it when it is encountered again, and when the
+        tree is written to the database, the new Taxon will be matched to the existing
+        taxon concept.
+        """
+        inputcsv, charencoding, ranktoCSV, rankt, taxonomyroot = self.incparser
+
+        # The set of complete taxa that are still attached to the taxon tree.
+        completed = set()
+        prevpath = []
+        lastcnt = 0
+
+        with open(inputcsv, 'rU') as fin:
+            reader = UnicodeDictReader(fin, encoding=charencoding)
+            for path in self._iterCSVRows(reader, taxonomyroot, ranktoCSV, rankt):
+                # The first taxon on the previous row's path that is not on this row's path
+                # (along with all of its descendents) is complete.
+                index = 0
+                while (index < len(prevpath) and index < len(path)
+                        and prevpath[index] is path[index]):
+                    index += 1
+                if index < len(prevpath):
+                    completed.add(prevpath[index])
+                # Taxa that were complete but that appeared again are no longer complete.
+                completed.difference_update(path)
+                prevpath = path
+
+                if self.totaltaxa - lastcnt >= batchsize and len(completed) > 0:
+                    subtrees = self._getCompletedSubtrees(taxonomyroot, completed)
+                    yield [child for parent, child in subtrees]
+
+                    # Remove the complete subtrees from the taxon tree.
+                    children = {}
+                    for parent, child in subtrees:
+                        children.setdefault(parent, []).append(child)
+                    for parent in children:
+                        parent.removeChildren(children[parent])
+
+                    completed.clear()
+                    lastcnt = self.totaltaxa
+
+        if len(taxonomyroot.children) > 0:
+            yield list(taxonomyroot.children)
+
+    def _getCompletedSubtrees(self, taxonomyroot, completed):
+        """
+        Returns a list of (parent Taxon, child Taxon) tuples for the roots of the
+        largest subtrees of the taxon tree that consist only of complete taxa.
+        """
+        subtrees = []
+        stack = [taxonomyroot]
+        while len(stack) > 0:
+            taxon = stack.pop()
+            for child in taxon.children:
+                if child in completed:
+                    subtrees.append((taxon, child))
+                else:
+                    stack.append(child)
+
+        return subtrees
+
+    def _initParser(self, taxoconfig, dbcur):
+        """
+        Reads the parser settings from the taxonomy configuration and creates the root
+        Taxon of the taxonomy.  Returns the location of the input CSV file, its character
+        encoding, the mappings of rank IDs to CSV column names, the rank lookup table, and
+        the root Taxon.
+        """
         self.tc = taxoconfig
 
         # Get the top-level configuration settings.
@@ -88,8 +193,7 @@ class CSVTaxonomyParser:
         self.transforms = self.tc.getTransformations()
         
         # Initialize the rank lookup table.
-        rankt = RankTable()
-        rankt.loadFromDB(dbcur)
+        rankt = RankTable.getCached(dbcur)
 
         # Get the synonyms settings.
         self.syn_col, self.syn_sep = self.tc.getSynonymSettings()
@@ -109,12 +213,7 @@ class CSVTaxonomyParser:
         taxonomyroot = Taxon(taxonomyid, rankt.getID(rootrank, ranksys), rankt, 0, rootname, roottaxo_id, True)
         #print taxonomyroot
 
-        # Open and parse the input CSV file.
-        with open(inputcsv, 'rU') as fin:
-            reader = UnicodeDictReader(fin, encoding=charencoding)
-            self._readCSVRows(reader, taxonomyroot, ranktoCSV, rankt)
-
-        return taxonomyroot
+        return (inputcsv, charencoding, ranktoCSV, rankt, taxonomyroot)
 
     def _extractGenus(self, spstr):
         """
@@ -191,12 +290,14 @@ class CSVTaxonomyParser:
         elif fullcitestr != '':
             taxon.name.updateCitation(fullcitestr, '')
 
-    def _readCSVRows(self, reader, taxonomyroot, ranktoCSV, rankt):
+    def _getRowTaxa(self, reader, ranktoCSV, rankt):
         """
-        Reads taxonomy information from a CSV file and attaches the taxonomic unit
-        for each row as a descendent of taxonomyroot.
+        A generator that reads the rows of a taxonomy CSV file, skips any rows that are
+        rejected by the row filters, and applies the column value transformations.  For
+        each remaining row, yields the row along with a list of (rank ID, name string)
+        tuples for all taxa in the row, in hierarchical order.
         """
-        self.totalrows = self.totaltaxa = 0
+        self.totalrows = 0
 
         # Get the column accept/reject filters.
         acceptfilter = self.tc.getAcceptFilter()
@@ -215,7 +316,6 @@ class CSVTaxonomyParser:
         if ssp_rankid in ranktoCSV:
             parse_subsp = ranktoCSV[ssp_rankid] == '_ParseSubspecies'
 
-        # Process each row in the CSV file, building up the tree of Taxon objects as we go.
         rankorder = sorted(ranktoCSV.keys())
         for row in reader:
             self.totalrows += 1
@@ -234,12 +334,9 @@ class CSVTaxonomyParser:
             # Apply any column value transformations.
             self._applyTransforms(row)
 
-            # Start with the root as the parent.
-            curparent = taxonomyroot
-        
-            # Process each rank in hierarchical order.
+            # Get the name string for each rank in hierarchical order.
+            rowtaxa = []
             for rankid in rankorder:
-                # Get the name string.
                 try:
                     if ranktoCSV[rankid] == '_ParseGenus':
                         # Parse out the genus name from the species name string.
@@ -256,20 +353,48 @@ class CSVTaxonomyParser:
 
                 if namestr != '':
                     # Clean up the name string.
-                    namestr = self.resolver.cleanNameString(namestr)
+                    rowtaxa.append((rankid, self.resolver.cleanNameString(namestr)))
+
+            yield (row, rowtaxa)
+
+    def _readCSVRows(self, reader, taxonomyroot, ranktoCSV, rankt):
+        """
+        Reads taxonomy information from a CSV file and attaches the taxonomic unit
+        for each row as a descendent of taxonomyroot.
+        """
+        for path in self._iterCSVRows(reader, taxonomyroot, ranktoCSV, rankt):
+            pass
+
+    def _iterCSVRows(self, reader, taxonomyroot, ranktoCSV, rankt):
+        """
+        A generator that reads taxonomy information from a CSV file and attaches the
+        taxonomic unit for each row as a descendent of taxonomyroot.  After each row
+        is processed, yields a list of the Taxon objects for the row, from the highest
+        taxon to the lowest (not including taxonomyroot).
+        """
+        self.totaltaxa = 0
+
+        # Process each row in the CSV file, building up the tree of Taxon objects as we go.
+        for row, rowtaxa in self._getRowTaxa(reader, ranktoCSV, rankt):
+            # Start with the root as the parent.
+            curparent = taxonomyroot
+            path = []
         
-                    # See if this taxon has already been processed.  If not, create a Taxon object for it.
-                    childtaxon = curparent.findChild(rankid, namestr)
-                    if childtaxon == None:
-                        childtaxon = curparent.createChild(rankid, namestr)
-                        # If we have rank-specific citation data for this taxon, attach it.
-                        rankname = rankt.getName(rankid)
-                        if rankname in self.nameciteinfo[1]:
-                            self._addNameCitation(childtaxon, row[self.nameciteinfo[1][rankname]], '')
-                        self.totaltaxa += 1
+            # Process each taxon in hierarchical order.
+            for rankid, namestr in rowtaxa:
+                # See if this taxon has already been processed.  If not, create a Taxon object for it.
+                childtaxon = curparent.findChild(rankid, namestr)
+                if childtaxon == None:
+                    childtaxon = curparent.createChild(rankid, namestr)
+                    # If we have rank-specific citation data for this taxon, attach it.
+                    rankname = rankt.getName(rankid)
+                    if rankname in self.nameciteinfo[1]:
+                        self._addNameCitation(childtaxon, row[self.nameciteinfo[1][rankname]], '')
+                    self.totaltaxa += 1
         
-                    # Set the child Taxon as the parent for the next taxon to process in the row.
-                    curparent = childtaxon
+                # Set the child Taxon as the parent for the next taxon to process in the row.
+                curparent = childtaxon
+                path.append(childtaxon)
 
             # Attach any synonyms to the last child taxon we processed for this row.
             if self.syn_col != None:
@@ -286,6 +411,8 @@ class CSVTaxonomyParser:
             if (nameauthstr != '') or (namefullcitestr != ''):
                 self._addNameCitation(childtaxon, nameauthstr, namefullcitestr)
 
+            yield path
+
 
     def getStats(self):
         """
@@ -0,0 +1,205 @@
+"""
+Provides an HTTP transport for the name citation resolvers that keeps persistent
+(keep-alive) connections to each Web service host and re-uses them for later requests.
+"""
+
+import httplib
+import urllib
+import urllib2
+import urlparse
+import base64
+import socket
+import threading
+from StringIO import StringIO
+
+
+class HTTPTransport:
+    """
+    Sends HTTP GET requests over pooled, persistent connections.  After a request
+    finishes, its connection is returned to a pool for the request's host (unless the
+    server closed it) so that later requests to the same host do not have to open a new
+    TCP connection.  At most poolsize idle connections are kept for each host.  A single
+    HTTPTransport can be shared by multiple resolvers and worker threads.
+
+    Errors are reported in the same way as by urllib2.urlopen(): HTTP error responses
+    raise urllib2.HTTPError, timeouts raise socket.timeout, and other connection
+    problems raise socket.error or urllib2.URLError.  Redirects are followed.  Also as
+    for urllib2.urlopen(), proxies are read from the http_proxy, https_proxy, and
+    no_proxy environment variables: HTTP requests are sent to the proxy, and HTTPS
+    requests are tunneled through it.  The counters requestcnt, connectcnt, and
+    reusecnt record the number of requests, new connections, and requests that re-used
+    a pooled connection, respectively.
+    """
+    # The maximum number of redirects to follow for a single request.
+    MAX_REDIRECTS = 5
+
+    def __init__(self, poolsize=4):
+        self.poolsize = poolsize
+        self.proxies = urllib.getproxies()
+
+        # Maps (scheme, host) tuples to lists of idle connections.
+        self.pools = {}
+        self.lock = threading.Lock()
+
+        self.requestcnt = 0
+        self.connectcnt = 0
+        self.reusecnt = 0
+
+    def request(self, url, timeout):
+        """
+        Sends a GET request for url, with a timeout limit in seconds for connecting and
+        for each read from the connection.  Returns a file-like object with the body of
+        the response.
+        """
+        for redirectcnt in range(self.MAX_REDIRECTS + 1):
+            parts = urlparse.urlsplit(url)
+            if parts.scheme not in ('http', 'https'):
+                raise urllib2.URLError('unsupported URL scheme: ' + parts.scheme)
+            path = parts.path if parts.path != '' else '/'
+            if parts.query != '':
+                path += '?' + parts.query
+
+            status, reason, headers, body = self._sendRequest(parts.scheme, parts.netloc, path, timeout)
+
+            if status in (301, 302, 303, 307) and headers.getheader('location') != None:
+                url = urlparse.urljoin(url, headers.getheader('location'))
+            elif status < 200 or status >= 300:
+                # This includes redirects without a location.
+                raise urllib2.HTTPError(url, status, reason, headers, StringIO(body))
+            else:
+                return StringIO(body)
+
+        raise urllib2.HTTPError(url, status, 'too many redirects', headers, StringIO(body))
+
+    def _sendRequest(self, scheme, host, path, timeout):
+        """
+        Sends a single GET request on a pooled connection (or a new one if none is idle)
+        and returns a tuple (status, reason, headers, body).  If a pooled connection turns
+        out to have been closed by the server, the request is repeated once on a new
+        connection.
+        """
+        with self.lock:
+            self.requestcnt += 1
+
+        reqheaders = { 'Connection': 'keep-alive' }
+        proxy = self._getProxy(scheme, host)
+        if proxy != None and scheme == 'http':
+            # Plain HTTP requests are sent to the proxy with the full URL.
+            path = 'http://' + host + path
+            reqheaders.update(self._getProxyHeaders(proxy))
+
+        while True:
+            conn = self._getConnection(scheme, host, timeout)
+            reused = conn.sock != None
+            try:
+                if reused:
+                    conn.sock.settimeout(timeout)
+                conn.request('GET', path, headers=reqheaders)
+                res = conn.getresponse()
+                body = res.read()
+            except socket.timeout:
+                conn.close()
+                raise
+            except (httplib.HTTPException, socket.error) as err:
+                conn.close()
+                if reused:
+                    # The server probably closed the idle connection; try a new one.
+                    continue
+                if isinstance(err, socket.error):
+                    raise
+                raise urllib2.URLError(err)
+
+            with self.lock:
+                if reused:
+                    self.reusecnt += 1
+                else:
+                    self.connectcnt += 1
+
+            if res.will_close:
+                conn.close()
+            else:
+                self._releaseConnection(scheme, host, conn)
+
+            return (res.status, res.reason, res.msg, body)
+
+    def _getConnection(self, scheme, host, timeout):
+        """
+        Returns an idle pooled connection for the host, if there is one, or a new,
+        unconnected connection.
+        """
+        with self.lock:
+            pool = self.pools.get((scheme, host))
+            if pool:
+                return pool.pop()
+
+        proxy = self._getProxy(scheme, host)
+        if proxy == None:
+            connhost = host
+        else:
+            connhost = proxy.netloc.rpartition('@')[2]
+
+        if scheme == 'https':
+            conn = httplib.HTTPSConnection(connhost, timeout=timeout)
+            if proxy != None:
+                conn.set_tunnel(host, headers=self._getProxyHeaders(proxy))
+        else:
+            conn = httplib.HTTPConnection(connhost, timeout=timeout)
+
+        return conn
+
+    def _getProxy(self, scheme, host):
+        """
+        Returns the proxy URL to use for a request to the host, split into its parts by
+        urlparse.urlsplit(), or None if the request should not use a proxy.
+        """
+        proxyurl = self.proxies.get(scheme)
+        if proxyurl == None or urllib.proxy_bypass(host):
+            return None
+
+        if '://' not in proxyurl:
+            proxyurl = 'http://' + proxyurl
+
+        return urlparse.urlsplit(proxyurl)
+
+    def _getProxyHeaders(self, proxy):
+        """
+        Returns the headers that a request through a proxy must include, which are the
+        credentials for the proxy, if its URL has any.
+        """
+        if proxy.username == None:
+            return {}
+
+        credentials = urllib.unquote(proxy.username) + ':' + urllib.unquote(proxy.password or '')
+
+        return { 'Proxy-Authorization': 'Basic ' + base64.b64encode(credentials) }
+
+    def _releaseConnection(self, scheme, host, conn):
+        """
+        Returns a connection to the pool for its host, or closes it if the pool is full.
+        """
+        with self.lock:
+            pool = self.pools.setdefault((scheme, host), [])
+            if len(pool) < self.poolsize:
+                pool.append(conn)
+                return
+
+        conn.close()
+
+    def close(self):
+        """
+        Closes all idle connections.
+        """
+        with self.lock:
+            pools = self.pools
+            self.pools = {}
+
+        for pool in pools.values():
+            for conn in pool:
+                conn.close()
+
+    def getStats(self):
+        """
+        Returns the number of requests, new connections, and re-used connections, as a
+        tuple.
+        """
+        return (self.requestcnt, self.connectcnt, self.reusecnt)
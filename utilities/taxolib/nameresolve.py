@@ -6,9 +6,16 @@ import json
 import xml.etree.ElementTree as et
 import re
 import sys, time
+import random
 import pprint
-from taxolib.taxacomponents import Taxon, Citation
+import threading
+import Queue
+import heapq
+import urlparse
+from taxolib.taxacomponents import Taxon, Name, Citation
 from taxolib.taxonvisitor import TaxonVisitor
+from taxolib.responsecache import ResponseCache, OfflineCacheMiss
+from taxolib.httptransport import HTTPTransport
 
 
 def getResolversList():
@@ -23,7 +30,94 @@ def getResolversList():
     return resolvers
 
 
+class HostRateLimiter:
+    """
+    Limits the rate at which requests are sent to each Web service host by spacing the
+    requests to a host at least 1/maxrate seconds apart.  A single HostRateLimiter can be
+    shared by multiple threads.
+    """
+    def __init__(self, maxrate):
+        """
+        maxrate is the maximum number of requests per second to send to each host.
+        """
+        self.interval = 1.0 / maxrate
+
+        # The earliest time at which the next request can be sent to each host.
+        self.nexttimes = {}
+        self.lock = threading.Lock()
+
+    def wait(self, host):
+        """
+        Blocks the calling thread until a request can be sent to host.
+        """
+        with self.lock:
+            curtime = time.time()
+            reqtime = max(curtime, self.nexttimes.get(host, curtime))
+            self.nexttimes[host] = reqtime + self.interval
+
+        if reqtime > curtime:
+            time.sleep(reqtime - curtime)
+
+
+class RetryRequest(Exception):
+    """
+    Raised by NamesResolver._HTTPQuery() during concurrent name resolution to indicate
+    that a failed request should be retried after a delay (in seconds).  Rather than
+    sleeping, the worker thread abandons the lookup so that it can work on other names,
+    and the lookup is re-run once the delay has passed.
+    """
+    def __init__(self, delay):
+        Exception.__init__(self, 'Retry the request in ' + str(delay) + ' seconds.')
+        self.delay = delay
+
+
+class _UnplannedQuery(Exception):
+    """
+    Raised by NamesResolver._getResponse() during planned name resolution if a lookup
+    needs the response to a query that has not been sent yet.
+    """
+    def __init__(self, queryurl):
+        Exception.__init__(self, 'No response for ' + queryurl)
+        self.queryurl = queryurl
+
+
+class _LookupTask:
+    """
+    A name lookup for a single taxon during concurrent name resolution.  Also records
+    the retry state of each failed request URL so that retries and timeout limits are
+    handled exactly as for sequential resolution.
+    """
+    def __init__(self, key, taxon):
+        self.key = key
+        self.taxon = taxon
+        # Maps request URLs to (retries, timeoutfailures) tuples.
+        self.retrystate = {}
+
+    def run(self, resolver):
+        return resolver._lookupName(self.taxon)
+
+
+class _QueryTask(_LookupTask):
+    """
+    A single Web service query during planned name resolution.  The key is the query
+    URL.
+    """
+    def __init__(self, queryurl):
+        _LookupTask.__init__(self, queryurl, None)
+
+    def run(self, resolver):
+        return resolver._fetchQuery(self.key)
+
+
 class NamesResolver(TaxonVisitor):
+    """
+    Base class for the name citation resolvers.  Each taxon is processed in three steps:
+    _prepareLookup() decides whether the taxon's name should be looked up, _lookupName()
+    queries a Web service and returns the result, and _applyLookup() updates the taxon
+    with the result.  Because _lookupName() does not modify the taxon, lookups can run
+    concurrently on worker threads (see setConcurrency()), while the first and last steps
+    always run on the calling thread.
+    """
     def __init__(self, numtaxa=-1, maxdepth=-1):
         # Call the superclass initializer.
         TaxonVisitor.__init__(self, numtaxa, maxdepth)
@@ -40,8 +134,11 @@ class NamesResolver(TaxonVisitor):
         # or an HTTP error.
         self.maxretries = 2
 
-        # The delay (in seconds) between retry attempts.
+        # The delay (in seconds) before the first retry attempt.  The delay doubles for
+        # each further retry, up to a maximum of self.maxretrydelay, and each delay is
+        # randomly varied by up to 50% so that concurrent retries are spread out.
         self.retrydelay = 20
+        self.maxretrydelay = 300
 
         # By default, do not retry a request after getting an HTTP 404 error.
         self.retry404 = False
@@ -58,6 +155,31 @@ class NamesResolver(TaxonVisitor):
         self.comparison_taxonomy = None
         self.skip_if_existing = False
 
+        # The preferred names in the comparison taxonomy that have citation data, indexed
+        # by (name string, rank ID).  The index is loaded by _loadExistingCiteData().
+        self.existingcitedata = None
+
+        # Settings for concurrent name resolution.  By default, names are resolved
+        # sequentially and there is no limit on the request rate.
+        self.maxworkers = 1
+        self.hostlimiter = None
+
+        # The lookup task of the current worker thread, if any.
+        self.threadstate = threading.local()
+
+        # Settings for planned name resolution (see setPlanning()).  During planned
+        # resolution, querymemo maps each query URL that has been sent to its outcome,
+        # and queryuses collects the query URLs used by the current lookup.
+        self.planned = False
+        self.querymemo = None
+        self.queryuses = []
+
+        # An optional persistent cache of Web service responses.
+        self.cache = None
+
+        # The HTTP transport used to send requests.
+        self.transport = HTTPTransport()
+
     def getSourceDescription(self):
         """
         Return a short text string describing the data source for this NameResolver.
@@ -71,6 +193,7 @@ class NamesResolver(TaxonVisitor):
         the taxonomy database.
         """
         self.comparison_taxonomy = taxonomy_id
+        self.existingcitedata = None
 
     def setSkipIfExisting(self, skip):
         """
@@ -80,28 +203,114 @@ class NamesResolver(TaxonVisitor):
         up citation data for the name.
         """
         self.skip_if_existing = skip
+        self.existingcitedata = None
+
+    def setConcurrency(self, maxworkers, maxrate=0):
+        """
+        Sets the maximum number of name lookups that can run at the same time.  If
+        maxworkers > 1, resolve() uses a pool of maxworkers worker threads to send
+        requests to the Web service concurrently.  Results are still applied to the taxa
+        in the same order as for sequential resolution, so the outcome does not depend on
+        the order in which requests complete.  If maxrate > 0, at most maxrate requests
+        per second are sent to any single host.  Concurrent resolution is not used if
+        the traversal is limited by numtaxa.
+        """
+        self.maxworkers = maxworkers
+        if maxrate > 0:
+            self.hostlimiter = HostRateLimiter(maxrate)
+        else:
+            self.hostlimiter = None
+
+    def setPlanning(self, planned):
+        """
+        If planned is True, resolve() plans the name lookups for the whole taxon tree so
+        that each unique Web service query is only sent once, even if the same name (or
+        name variant) occurs in several places in the tree (see _resolvePlanned()).
+        Planned resolution is not used if the traversal is limited by numtaxa.
+        """
+        self.planned = planned
+
+    def setTransport(self, transport):
+        """
+        Sets the HTTP transport to use for Web service requests.  The transport must
+        provide a method request(url, timeout) that behaves like HTTPTransport.request().
+        Sharing a single transport among several resolvers allows them to share its
+        pooled connections.
+        """
+        self.transport = transport
+
+    def setResponseCache(self, cache):
+        """
+        Sets a ResponseCache to use for all Web service queries.  If cache is None, the
+        Web services are always queried directly.
+        """
+        self.cache = cache
+
+    def _loadExistingCiteData(self):
+        """
+        Loads, with a single query, all preferred names in the comparison taxonomy and
+        builds an index of the names that have citation data, keyed by (name string,
+        rank ID), for _checkExistingCiteData().  Each index entry is a tuple (Name,
+        useparens), and the Citation objects of the names are interned so that they are
+        shared by all taxa that get the same citation.  Names that are the preferred name
+        of more than one taxon concept at the same rank are ambiguous, so they are left
+        out of the index.  The index is only loaded once, on the first call to resolve()
+        after the comparison taxonomy or the skip_if_existing setting is changed.
+        """
+        if not(self.skip_if_existing) or self.comparison_taxonomy == None:
+            self.existingcitedata = {}
+            return
+        if self.existingcitedata != None:
+            return
+
+        query = """SELECT n.namestr, tc.rank_id, tc.tc_id, nttc.authordisp_prefix, n.name_id,
+                n.citation_id, c.citationstr, c.url, c.doi, c.authordisplay
+            FROM taxon_concepts tc, names_to_taxonconcepts nttc, names n
+                LEFT JOIN citations c ON c.citation_id=n.citation_id
+            WHERE tc.taxonomy_id=? AND nttc.tc_id=tc.tc_id AND nttc.validity='valid'
+                AND nttc.name_id=n.name_id"""
+        self.pgcur.execute(query, (self.comparison_taxonomy,))
+
+        # Find the first matching row for each (name string, rank ID) pair and the pairs
+        # that match more than one taxon concept.
+        rows = {}
+        ambiguous = set()
+        for res in self.pgcur.fetchall():
+            key = (res[0], res[1])
+            if key not in rows:
+                rows[key] = res
+            elif rows[key][2] != res[2]:
+                ambiguous.add(key)
+
+        self.existingcitedata = {}
+        for key, res in rows.iteritems():
+            if res[5] != None and key not in ambiguous:
+                name = Name(res[0], Citation.intern(Citation(res[6], res[9], res[8], res[7])))
+                name.idnum = res[4]
+                self.existingcitedata[key] = (name, res[3] == '(')
 
     def _checkExistingCiteData(self, taxon):
         """
         This method checks whether a name already exists in the database as part of a
-        comparison taxonomy, and if so, whether it has citation data.  A search is
-        performed only if self.skip_if_existing is True.  If a match is found, this
-        method will load the name/citation data into the target taxon concept and
+        comparison taxonomy, and if so, whether it has citation data.  A check is
+        performed only if self.skip_if_existing is True, and it uses the index built by
+        _loadExistingCiteData() rather than searching the database.  If a match is found,
+        this method will load the name/citation data into the target taxon concept and
         specify whether parentheses should be used when displaying the author display
         string.  If this is all successful, then the method returns True; otherwise,
         it returns False.
         """
         if self.skip_if_existing and self.comparison_taxonomy != None:
-            res = Taxon.find(self.pgcur, taxon.name.namestr, taxon.rankt,
-                    taxonomy_id=self.comparison_taxonomy, rank_id=taxon.rank_id, pref_names_only=True)
-            if len(res) == 1:
-                ctaxon = res[0]
-                if ctaxon.name.getCitation() != None:
-                    taxon.name.loadFromDB(self.pgcur, ctaxon.name.idnum)
-                    taxon.setUseParens(ctaxon.getUseParens())
-                    return True
-                else:
-                    return False
+            if self.existingcitedata == None:
+                self._loadExistingCiteData()
+
+            match = self.existingcitedata.get((taxon.name.namestr, taxon.rank_id))
+            if match != None:
+                cname, useparens = match
+                taxon.name.idnum = cname.idnum
+                taxon.name.citation = cname.citation
+                taxon.setUseParens(useparens)
+                return True
             else:
                 return False
         else:
@@ -111,8 +320,9 @@ class NamesResolver(TaxonVisitor):
         """
         Queries a Web service that returns results in JSON format.  If the
         query is successful, the results are parsed as JSON and returned as a
-        Python object.  See the documentation for the method _HTTPQuery() for
-        more information about how TCP and HTTP errors are handled.
+        Python object.  See the documentation for the methods _getResponse() and
+        _HTTPQuery() for more information about response caching and how TCP and
+        HTTP errors are handled.
     
         Arguments:
           url -- The base URL of the Web service.
@@ -120,8 +330,7 @@ class NamesResolver(TaxonVisitor):
     
         Returns:  A Python object that represents the JSON query result.
         """
-        res = self._HTTPQuery(queryurl)
-        jsonstr = res.read()
+        jsonstr = self._getResponse(queryurl)
 
         # Zoobank sometimes returns invalid JSON.  So far, I have seen JSON string tokens
         # with literal tab characters, which is invalid according to the standard.  Try
@@ -135,8 +344,9 @@ class NamesResolver(TaxonVisitor):
         Queries a Web service that returns results in XML format.  If the
         query is successful, the results are parsed as XML and returned as a
         Python object.  XML is parsed using the Python ElementTree API.  See
-        the documentation for the method _HTTPQuery() for more information
-        about how TCP and HTTP errors are handled.
+        the documentation for the methods _getResponse() and _HTTPQuery() for
+        more information about response caching and how TCP and HTTP errors are
+        handled.
     
         Arguments:
           url -- The base URL of the Web service.
@@ -144,15 +354,87 @@ class NamesResolver(TaxonVisitor):
     
         Returns:  An ElementTree object that represents the XML data tree.
         """
-        res = self._HTTPQuery(queryurl)
+        xmlstr = self._getResponse(queryurl)
+
+        return et.ElementTree(et.fromstring(xmlstr))
+
+    def _getResponse(self, queryurl):
+        """
+        Returns the body of the response to a Web service query.  During planned name
+        resolution, the outcome of the query is taken from self.querymemo, and
+        _UnplannedQuery is raised if the query has not been sent yet.  Otherwise, the
+        query is sent with _fetchResponse().
+        """
+        if self.querymemo == None:
+            return self._fetchResponse(queryurl)
+
+        if queryurl not in self.querymemo:
+            raise _UnplannedQuery(queryurl)
+        self.queryuses.append(queryurl)
+
+        success, value = self.querymemo[queryurl]
+        if success:
+            return value
+        else:
+            raise value
+
+    def _fetchQuery(self, queryurl):
+        """
+        Sends a Web service query for planned name resolution and returns its outcome as
+        a tuple (success, value), where value is either the body of the response or the
+        exception that the query raised.
+        """
+        try:
+            return (True, self._fetchResponse(queryurl))
+        except (urllib2.URLError, socket.error) as err:
+            return (False, err)
+
+    def _fetchResponse(self, queryurl):
+        """
+        Returns the body of the response to a Web service query.  If a response cache is
+        set, the response is served from the cache if possible.  Otherwise, the query is
+        sent with _HTTPQuery() and the response is added to the cache.  HTTP 404 errors
+        and timeout failures are cached as well, and a cached failure raises the same type
+        of exception as the original failure (urllib2.HTTPError or socket.timeout).  In
+        offline mode, a query that is not in the cache raises OfflineCacheMiss, which is
+        a subclass of socket.timeout.
+        """
+        if self.cache == None:
+            return self._HTTPQuery(queryurl).read()
+
+        cached = self.cache.get(queryurl)
+        if cached != None:
+            status, body = cached
+            if status == ResponseCache.OK:
+                return body
+            elif status == ResponseCache.NOT_FOUND:
+                raise urllib2.HTTPError(queryurl, 404, self.HTTPresponses[404][0], None, None)
+            else:
+                raise socket.timeout('timed out (cached response)')
 
-        return et.parse(res)
+        if self.cache.offline:
+            raise OfflineCacheMiss('no cached response for ' + queryurl)
+
+        try:
+            body = self._HTTPQuery(queryurl).read()
+        except urllib2.HTTPError as err:
+            if err.code == 404:
+                self.cache.put(queryurl, ResponseCache.NOT_FOUND)
+            raise
+        except socket.timeout:
+            self.cache.put(queryurl, ResponseCache.TIMEOUT)
+            raise
+
+        self.cache.put(queryurl, ResponseCache.OK, body)
+
+        return body
 
     def _HTTPQuery(self, queryurl):
         """
         Queries a Web service.  If the query is successful, a reference to the
-        results is returned.  If TCP or HTTP errors are encountered, this method
-        will retry the request after waiting self.retrydelay seconds.  If the
+        results is returned.  Requests are sent with self.transport, which re-uses
+        persistent connections.  If TCP or HTTP errors are encountered, this method
+        will retry the request after a delay (see _getRetryDelay()).  If the
         total number of retries exceeds self.maxretries and the request is still
         unsuccessful, the TCP or HTTP exception will be passed up the call chain.
         Because Python is inconsistent in how it reports timeout errors (they are
@@ -168,16 +450,23 @@ class NamesResolver(TaxonVisitor):
     
         Returns:  A reference to the request result.
         """
-        # Initialize variables for managing request retry attempts.
+        # Initialize variables for managing request retry attempts.  If this request is
+        # part of a concurrent lookup task, continue from the task's retry state.
+        task = getattr(self.threadstate, 'task', None)
         success = False
-        retries = 0
-        timeoutfailures = 0
+        if task != None:
+            retries, timeoutfailures = task.retrystate.get(queryurl, (0, 0))
+        else:
+            retries = 0
+            timeoutfailures = 0
 
         # Try the request until we get a result back or the maximum number of
         # retries has been exceeded due to TCP or HTTP errors.
         while not(success):
             try:
-                res = urllib2.urlopen(queryurl, None, self.timeout * (self.timeoutfactor**timeoutfailures))
+                if self.hostlimiter != None:
+                    self.hostlimiter.wait(urlparse.urlsplit(queryurl).netloc)
+                res = self.transport.request(queryurl, self.timeout * (self.timeoutfactor**timeoutfailures))
                 success = True
             except (socket.error, urllib2.URLError) as err:
                 # The exception handling code is complex because there are a lot of things
@@ -220,19 +509,420 @@ class NamesResolver(TaxonVisitor):
                 else:
                     print 'Connection error:', err.reason
 
-                print 'Retrying request in ' + str(self.retrydelay) + ' seconds.'
-                time.sleep(self.retrydelay)
+                retrydelay = self._getRetryDelay(retries)
+                print 'Retrying request in {0:.1f} seconds.'.format(retrydelay)
+                if task != None:
+                    # Don't block the worker thread; the lookup will be re-run later.
+                    task.retrystate[queryurl] = (retries, timeoutfailures)
+                    raise RetryRequest(retrydelay)
+                time.sleep(retrydelay)
     
         return res
 
+    def _getRetryDelay(self, retries):
+        """
+        Returns the delay, in seconds, before retry number retries (starting from 1) of a
+        failed request.  The delays grow exponentially and are randomly varied by up to
+        50% ("jittered") so that many failed requests are not all retried at once.
+        """
+        delay = min(self.retrydelay * (2 ** (retries - 1)), self.maxretrydelay)
+
+        return delay * random.uniform(0.5, 1.5)
+
     def resolve(self, pgcur, taxon):
         """
+        Resolves the names in the taxon tree rooted at taxon.
+        """
+        self.resolveSubtrees(pgcur, [taxon])
+
+    def resolveSubtrees(self, pgcur, taxa):
+        """
+        Resolves the names in several subtrees of a taxon tree, given a list of the roots
+        of the subtrees, in a single pass (e.g., with a single pool of worker threads).
         This method merely saves a database cursor object for use by other methods of the
-        class during name resolution and then calls the visit() method of TaxonVisitor.
+        class during name resolution and then calls the visit() method of TaxonVisitor
+        for each subtree, or, if planned or concurrent resolution is enabled,
+        _resolvePlanned() or _resolveConcurrently().  If numtaxa > 0, the limit applies
+        to each subtree separately.
         """
         self.pgcur = pgcur
+        self._loadExistingCiteData()
+        self._initResolution()
 
-        self.visit(taxon)
+        if self.planned and self.numtaxa <= 0:
+            self._resolvePlanned(taxa)
+        elif self.maxworkers > 1 and self.numtaxa <= 0:
+            self._resolveConcurrently(taxa)
+        else:
+            for taxon in taxa:
+                self.visit(taxon)
+
+    def resolveTaxon(self, pgcur, taxon):
+        """
+        Resolves the name of a single taxon without visiting its children.  Returns True
+        if the names of the taxon's descendents should be resolved, or False if the
+        lookup for the taxon showed that they should be skipped (see
+        _lookupGatesChildren()).  Together with resolveSubtrees(), this allows a taxon
+        tree to be resolved one part at a time, with each ancestor of the parts only
+        resolved once.
+        """
+        self.pgcur = pgcur
+        self._loadExistingCiteData()
+        self._initResolution()
+
+        return self._resolveSingleTaxon(taxon)
+
+    def _initResolution(self):
+        """
+        Initializes any state that the resolver needs for resolving a taxon tree.  This
+        method can be overridden by child classes.
+        """
+        pass
+
+    def _resolveSingleTaxon(self, taxon):
+        """
+        Looks up the name of a single taxon and applies the result, as for concurrent or
+        planned resolution.  Returns True if the children of the taxon should be visited.
+        """
+        if self._prepareLookup(taxon):
+            result = self._lookupName(taxon)
+            self._applyLookup(taxon, result)
+            if self._lookupGatesChildren(taxon):
+                return self._lookupAllowsChildren(taxon, result)
+
+        return True
+
+    def processTaxon(self, taxon, depth):
+        """
+        Resolves the name of a single taxon during sequential name resolution.
+        """
+        if self._prepareLookup(taxon):
+            self._applyLookup(taxon, self._lookupName(taxon))
+
+    def _prepareLookup(self, taxon):
+        """
+        Returns True if the name of taxon should be looked up.  This method is always
+        called on the thread that called resolve(), so it can use the database cursor.
+        This method should be overridden by child classes.
+        """
+        return False
+
+    def _lookupName(self, taxon):
+        """
+        Searches the resolver's data source for the name of taxon and returns the result,
+        or None if no match was found.  This method must not modify taxon or use the
+        database cursor, because it can be called on a worker thread.  This method should
+        be overridden by child classes.
+        """
+        return None
+
+    def _applyLookup(self, taxon, result):
+        """
+        Updates taxon with the result returned by _lookupName().  This method is always
+        called on the thread that called resolve().  This method should be overridden by
+        child classes.
+        """
+        pass
+
+    def _lookupGatesChildren(self, taxon):
+        """
+        Returns True if the children of taxon should only be visited after the lookup
+        for taxon has finished, in which case _lookupAllowsChildren() decides whether
+        they are visited at all.  Child classes can override this method to avoid
+        pointless lookups during concurrent resolution.
+        """
+        return False
+
+    def _lookupAllowsChildren(self, taxon, result):
+        """
+        For taxa for which _lookupGatesChildren() returns True, returns True if the
+        children of taxon should be visited, given the result of the lookup for taxon.
+        """
+        return True
+
+    def _resolveConcurrently(self, taxa):
+        """
+        Resolves the names in a list of taxon trees using a pool of worker threads for
+        the name lookups.  The trees are traversed in the same depth-first order as
+        visit(), which is represented by a key for each taxon that lists the index of its
+        tree and the child indexes on the path to the taxon; sorting the keys gives the
+        depth-first order.  Lookups are sent to
+        the workers as taxa are reached, with at most 2 * self.maxworkers lookups pending
+        at once.  Finished results are held until all taxa that precede them in the
+        traversal have been processed, and are then applied in traversal order.  Failed
+        requests are retried after a delay (see _getRetryDelay()) without blocking a
+        worker.
+        """
+        workqueue = Queue.Queue()
+        resqueue = Queue.Queue()
+        workers = self._startWorkers(workqueue, resqueue)
+
+        # A heap of (key, taxon, depth) tuples for the taxa that have not been reached.
+        tovisit = [((index,), taxon, 0) for index, taxon in enumerate(taxa)]
+        # The taxa with pending lookups, indexed by key, and the ones whose children
+        # cannot be visited until the lookup finishes.
+        pending = {}
+        gated = set()
+        # A heap of (key, task, result) tuples for the finished lookups.
+        finished = []
+        # A heap of (time, key, task) tuples for the lookups that are waiting for a retry.
+        retries = []
+
+        try:
+            while len(tovisit) > 0 or len(pending) > 0:
+                # Reach as many new taxa as possible.
+                while len(tovisit) > 0 and len(pending) < self.maxworkers * 2:
+                    key, curtaxon, depth = heapq.heappop(tovisit)
+                    if self._prepareLookup(curtaxon):
+                        task = _LookupTask(key, curtaxon)
+                        pending[key] = (task, depth)
+                        workqueue.put(task)
+                        if self._lookupGatesChildren(curtaxon):
+                            gated.add(key)
+                            continue
+                    self._addChildrenToVisit(tovisit, key, curtaxon, depth)
+
+                # Apply all finished results that no unfinished taxon precedes.
+                self._applyFinished(finished, tovisit, pending)
+
+                # Start any retries that are due.
+                curtime = time.time()
+                while len(retries) > 0 and retries[0][0] <= curtime:
+                    workqueue.put(heapq.heappop(retries)[2])
+
+                if len(pending) == 0:
+                    continue
+
+                # Wait for the next lookup to finish or the next retry to become due.
+                # A timeout is always used so that the program can be interrupted.
+                waittime = 1.0
+                if len(retries) > 0:
+                    waittime = min(waittime, max(retries[0][0] - curtime, 0.01))
+                try:
+                    task, status, value = resqueue.get(True, waittime)
+                except Queue.Empty:
+                    continue
+
+                if status == 'retry':
+                    heapq.heappush(retries, (time.time() + value, task.key, task))
+                elif status == 'error':
+                    raise value[0], value[1], value[2]
+                else:
+                    depth = pending[task.key][1]
+                    del pending[task.key]
+                    heapq.heappush(finished, (task.key, task, value))
+                    if task.key in gated:
+                        gated.remove(task.key)
+                        if self._lookupAllowsChildren(task.taxon, value):
+                            self._addChildrenToVisit(tovisit, task.key, task.taxon, depth)
+
+            self._applyFinished(finished, tovisit, pending)
+        finally:
+            for worker in workers:
+                workqueue.put(None)
+
+        for worker in workers:
+            worker.join()
+
+    def _startWorkers(self, workqueue, resqueue):
+        """
+        Starts self.maxworkers worker threads that run the tasks from workqueue (see
+        _lookupWorker()) and returns a list of the threads.  Each worker stops when it
+        gets None from workqueue.
+        """
+        workers = []
+        for cnt in range(self.maxworkers):
+            worker = threading.Thread(target=self._lookupWorker, args=(workqueue, resqueue))
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+
+        return workers
+
+    def _addChildrenToVisit(self, tovisit, key, taxon, depth):
+        """
+        Adds the children of taxon to the heap of taxa to visit during concurrent
+        resolution, if the maximum traversal depth allows it.
+        """
+        if self.maxdepth < 0 or depth < self.maxdepth:
+            for index, child in enumerate(taxon.children):
+                heapq.heappush(tovisit, (key + (index,), child, depth + 1))
+
+    def _applyFinished(self, finished, tovisit, pending):
+        """
+        Applies, in traversal order, the finished lookup results that precede every taxon
+        that has not yet been reached or whose lookup is still pending.  Because a taxon's
+        key is a prefix of the keys of all of its descendents, no taxon that is reached
+        later can precede these results.
+        """
+        while len(finished) > 0:
+            key = finished[0][0]
+            if len(tovisit) > 0 and tovisit[0][0] < key:
+                break
+            if len(pending) > 0 and min(pending) < key:
+                break
+
+            key, task, result = heapq.heappop(finished)
+            self._applyLookup(task.taxon, result)
+
+    def _lookupWorker(self, workqueue, resqueue):
+        """
+        The main function of the worker threads for concurrent resolution.  Runs lookup
+        (or query) tasks from workqueue and reports the outcome of each to resqueue as a
+        tuple (task, status, value), where status is 'done' (value is the task result),
+        'retry' (value is the retry delay), or 'error' (value is the exception info).
+        """
+        while True:
+            task = workqueue.get()
+            if task == None:
+                break
+
+            self.threadstate.task = task
+            try:
+                resqueue.put((task, 'done', task.run(self)))
+            except RetryRequest as e:
+                resqueue.put((task, 'retry', e.delay))
+            except:
+                resqueue.put((task, 'error', sys.exc_info()))
+            finally:
+                self.threadstate.task = None
+
+    def _resolvePlanned(self, taxa):
+        """
+        Resolves the names in a list of taxon trees so that each unique Web service query
+        is sent only once, no matter how many taxa need it.  Names that occur more than once in a
+        tree (synonyms that appear in several places, homonym genera) and species name
+        variants with or without a subgenus often lead to the same queries.  The tree is
+        processed in rounds.  Each round reaches all taxa that are not below a taxon
+        whose lookup gates its children (see _lookupGatesChildren()) and has not finished
+        yet, runs the lookups for these taxa with _runPlannedLookups(), and applies the
+        results.  Thus, a failed genus name lookup is only run once, and it prunes the
+        species of every genus with that name.  Because the lookups and the results are
+        the same as for sequential resolution, so is the outcome; only the order of the
+        progress messages differs.
+        """
+        self.querymemo = {}
+        lookupcnt = usecnt = 0
+        try:
+            tovisit = [(taxon, 0) for taxon in taxa]
+            while len(tovisit) > 0:
+                # Reach all taxa that do not depend on an unfinished lookup, in depth-first
+                # order.
+                lookups = []
+                stack = tovisit[::-1]
+                tovisit = []
+                while len(stack) > 0:
+                    curtaxon, depth = stack.pop()
+                    gated = False
+                    if self._prepareLookup(curtaxon):
+                        gated = self._lookupGatesChildren(curtaxon)
+                        lookups.append((curtaxon, depth, gated))
+                    if not(gated) and (self.maxdepth < 0 or depth < self.maxdepth):
+                        for child in reversed(curtaxon.children):
+                            stack.append((child, depth + 1))
+
+                results, uses = self._runPlannedLookups([lookup[0] for lookup in lookups])
+                lookupcnt += len(lookups)
+                usecnt += uses
+
+                for (curtaxon, depth, gated), result in zip(lookups, results):
+                    self._applyLookup(curtaxon, result)
+                    if (gated and self._lookupAllowsChildren(curtaxon, result) and
+                            (self.maxdepth < 0 or depth < self.maxdepth)):
+                        for child in curtaxon.children:
+                            tovisit.append((child, depth + 1))
+
+            print ('Planned resolution: ' + str(lookupcnt) + ' name lookups, ' + str(usecnt) +
+                    ' queries, ' + str(len(self.querymemo)) + ' unique queries sent (' +
+                    str(usecnt - len(self.querymemo)) + ' requests saved).')
+        finally:
+            self.querymemo = None
+
+    def _runPlannedLookups(self, taxa):
+        """
+        Runs the lookups for a list of taxa during planned name resolution.  Each lookup
+        is run against the query outcomes in self.querymemo.  The unique queries that the
+        unfinished lookups need next are collected and sent (see _sendPlannedQueries()),
+        and the unfinished lookups are run again, until all of them are finished.  Several
+        passes can be needed because some queries depend on the results of others (e.g.,
+        name variants are only searched for if the original name is not found).  Returns
+        a list of the lookup results, in the same order as taxa, and the total number of
+        queries that the lookups used.
+        """
+        results = [None] * len(taxa)
+        usecnt = 0
+
+        remaining = range(len(taxa))
+        while len(remaining) > 0:
+            unfinished = []
+            queryurls = []
+            for index in remaining:
+                self.queryuses = []
+                try:
+                    results[index] = self._lookupName(taxa[index])
+                    usecnt += len(self.queryuses)
+                except _UnplannedQuery as e:
+                    unfinished.append(index)
+                    if e.queryurl not in queryurls:
+                        queryurls.append(e.queryurl)
+
+            self._sendPlannedQueries(queryurls)
+            remaining = unfinished
+
+        return (results, usecnt)
+
+    def _sendPlannedQueries(self, queryurls):
+        """
+        Sends a list of unique queries during planned name resolution and adds their
+        outcomes to self.querymemo.  If self.maxworkers > 1, the queries are sent by a
+        pool of worker threads, and failed requests are retried without blocking a
+        worker, as for concurrent resolution.
+        """
+        if self.maxworkers <= 1 or len(queryurls) <= 1:
+            for queryurl in queryurls:
+                self.querymemo[queryurl] = self._fetchQuery(queryurl)
+            return
+
+        workqueue = Queue.Queue()
+        resqueue = Queue.Queue()
+        workers = self._startWorkers(workqueue, resqueue)
+
+        # A heap of (time, URL, task) tuples for the queries that are waiting for a retry.
+        retries = []
+
+        try:
+            for queryurl in queryurls:
+                workqueue.put(_QueryTask(queryurl))
+
+            pendingcnt = len(queryurls)
+            while pendingcnt > 0:
+                # Start any retries that are due.
+                curtime = time.time()
+                while len(retries) > 0 and retries[0][0] <= curtime:
+                    workqueue.put(heapq.heappop(retries)[2])
+
+                # Wait for the next query to finish or the next retry to become due.
+                waittime = 1.0
+                if len(retries) > 0:
+                    waittime = min(waittime, max(retries[0][0] - curtime, 0.01))
+                try:
+                    task, status, value = resqueue.get(True, waittime)
+                except Queue.Empty:
+                    continue
+
+                if status == 'retry':
+                    heapq.heappush(retries, (time.time() + value, task.key, task))
+                elif status == 'error':
+                    raise value[0], value[1], value[2]
+                else:
+                    self.querymemo[task.key] = value
+                    pendingcnt -= 1
+        finally:
+            for worker in workers:
+                workqueue.put(None)
+
+        for worker in workers:
+            worker.join()
 
     def processAuthorString(self, authorstr):
         """
@@ -350,7 +1040,7 @@ class ZoobankNamesResolver(NamesResolver):
     def getSourceDescription(self):
         return 'Zoobank'
 
-    def resolve(self, pgcur, taxon):
+    def _initResolution(self):
         # Initialize state-tracking variables.
         self.last_lookup_rank = ''
         self.last_lookup_succeeded = False
@@ -360,9 +1050,6 @@ class ZoobankNamesResolver(NamesResolver):
         # repeatedly attempting to retrieve them.
         self.failedrefIDs = []
 
-        # Call the superclass implementation.
-        NamesResolver.resolve(self, pgcur, taxon)
-
     def doRecursion(self):
         """
         If a genus name lookup to Zoobank fails to return any results, there is no
@@ -399,6 +1086,9 @@ class ZoobankNamesResolver(NamesResolver):
             print ('Attempt to search Zoobank for the name "' + name_searchstr
                     + '" failed because the result was not a valid JSON string.')
             rjson = []
+        except OfflineCacheMiss as e:
+            print 'The Zoobank search for the name "' + name_searchstr + '" is not cached.'
+            rjson = []
         except socket.timeout as e:
             print ('Attempt to search Zoobank for the name "' + name_searchstr
                     + '" failed due to multiple timeout errors.')
@@ -443,12 +1133,6 @@ class ZoobankNamesResolver(NamesResolver):
                     match = (res, rnamestr, authorinfo)
 
         if matchcnt == 1:
-            authorinfo = match[2]
-            authorprint = authorinfo['authorstr']
-            if authorinfo['hasparens']:
-                authorprint = '(' + authorprint + ')'
-            print '  Found match:', match[1], authorprint
-
             # See if Zoobank contains detailed publication information.
             # Frustratingly, Zoobank stores publication DOIs but does not return them as
             # part of their API results.  We can get the full citation string, though.
@@ -464,7 +1148,9 @@ class ZoobankNamesResolver(NamesResolver):
                     #pprint.pprint(rjson)
                     # Get the full citation string.
                     fullcite = self.cleanCiteString(rjson[0]['value'])
-                    print fullcite
+                except OfflineCacheMiss as e:
+                    print ('The Zoobank reference UUID ' + match[0]['OriginalReferenceUUID']
+                            + ' is not cached.')
                 except socket.timeout as e:
                     # Keep track of failed IDs so we don't waste time on them later.
                     self.failedrefIDs.append(match[0]['OriginalReferenceUUID'])
@@ -483,11 +1169,14 @@ class ZoobankNamesResolver(NamesResolver):
         # Update the rank state-tracking variable.
         self.last_lookup_rank = taxon.getRankString()
 
+        NamesResolver.processTaxon(self, taxon, depth)
+
+    def _prepareLookup(self, taxon):
         # Only operate on taxa of family-group rank or lower.  For higher taxa,
         # Zoobank only stores "Higher" as the rank name, so we cannot make rank
         # comparisons.
         if taxon.rank_id < taxon.rankt.getID('Family', taxon.ranksys):
-            return
+            return False
 
         # See if we should skip this taxon because its name already exists in the
         # database and has citation data.
@@ -496,11 +1185,14 @@ class ZoobankNamesResolver(NamesResolver):
             # even though lookup was skipped for this taxon.
             self.last_lookup_succeeded = True
             print 'Skipping "' + taxon.name.namestr + '"; citation data already in database.'
-            return
+            return False
 
         print 'Attempting to resolve:', taxon.name.namestr
         sys.stdout.flush()
 
+        return True
+
+    def _lookupName(self, taxon):
         # Search for this species' name in Zoobank, including name variants if it has a
         # subgenus designation.
         if taxon.rank_id >= taxon.rankt.getID('Species', taxon.ranksys):
@@ -512,6 +1204,9 @@ class ZoobankNamesResolver(NamesResolver):
         else:
             searchres = self.searchZoobankForTaxon(taxon, taxon.name.namestr)
 
+        return searchres
+
+    def _applyLookup(self, taxon, searchres):
         # Update the success state-tracking variable.
         if searchres != None:
             self.last_lookup_succeeded = True
@@ -521,10 +1216,27 @@ class ZoobankNamesResolver(NamesResolver):
 
         res, rname, authorinfo, fullcite = searchres
 
+        authorprint = authorinfo['authorstr']
+        if authorinfo['hasparens']:
+            authorprint = '(' + authorprint + ')'
+        print '  Found match:', rname, authorprint
+        if fullcite != '':
+            print fullcite
+
         # Update the name's citation information.
         taxon.name.updateCitation(fullcite, authorinfo['authorstr'])
         taxon.setUseParens(authorinfo['hasparens'])
 
+    def _lookupGatesChildren(self, taxon):
+        """
+        As for sequential resolution (see doRecursion()), the species in a genus are only
+        looked up if the genus name lookup succeeded.
+        """
+        return taxon.getRankString() == 'Genus'
+
+    def _lookupAllowsChildren(self, taxon, searchres):
+        return searchres != None
+
 class CoLNamesResolver(NamesResolver):
     """
     A names resolver that attempts to retrieve name citation information from the
@@ -560,6 +1272,9 @@ class CoLNamesResolver(NamesResolver):
 
         try:
             res = self.queryXML(queryurl)
+        except OfflineCacheMiss as e:
+            print 'The Catalog of Life search for the name "' + name_searchstr + '" is not cached.'
+            return None
         except socket.timeout as e:
             # Don't let occasional hard timeout errors crash long-running lookup efforts.
             # Print a message to the user and move on.
@@ -609,22 +1324,25 @@ class CoLNamesResolver(NamesResolver):
         else:
             return None
 
-    def processTaxon(self, taxon, depth):
+    def _prepareLookup(self, taxon):
         """
         Uses Catalog of Life to try to retrieve author information for taxa name strings.
         """
         # Only operate on species-group taxa.
         if taxon.rank_id < taxon.rankt.getID('Species', taxon.ranksys):
-            return
+            return False
 
         # See if we should skip this taxon because its name already exists in the
         # database and has citation data.
         if self._checkExistingCiteData(taxon):
             print 'Skipping "' + taxon.name.namestr + '"; citation data already in database.'
-            return
+            return False
 
         print 'Attempting to resolve:', taxon.name.namestr
 
+        return True
+
+    def _lookupName(self, taxon):
         # Search for this species' name in CoL, including name variants if it has a
         # subgenus designation.
         name_searchstrs = self._getSpeciesSearchStrs(taxon.name.namestr)
@@ -633,6 +1351,9 @@ class CoLNamesResolver(NamesResolver):
             if searchres != None:
                 break
 
+        return searchres
+
+    def _applyLookup(self, taxon, searchres):
         if searchres == None:
             return
 
@@ -647,4 +1368,3 @@ class CoLNamesResolver(NamesResolver):
         print '  Found match:', sname, authorprint
         taxon.name.updateCitation(None, authorinfo['authorstr'])
         taxon.setUseParens(authorinfo['hasparens'])
-
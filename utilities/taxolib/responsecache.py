@@ -0,0 +1,124 @@
+"""
+Provides a persistent cache of Web service responses for the name citation resolvers,
+so that names do not have to be looked up again every time a taxonomy is loaded.
+"""
+
+import sqlite3
+import socket
+import threading
+import time
+import urllib
+import urlparse
+
+
+class OfflineCacheMiss(socket.timeout):
+    """
+    Raised when a response is requested in offline mode but is not in the cache.  This
+    is a subclass of socket.timeout so that code that handles failed requests also
+    handles cache misses in offline mode.
+    """
+    pass
+
+
+class ResponseCache:
+    """
+    Stores Web service responses in a SQLite database file, keyed by the normalized
+    request URL.  Successful responses are kept for ttl seconds.  Failed requests (HTTP
+    404 errors and requests that time out even after retries) are also cached, for
+    negttl seconds, so that they are not repeated either.  If maxentries > 0, the oldest
+    entries are removed whenever the cache grows beyond maxentries entries.  In offline
+    mode, no requests are sent at all: responses are only served from the cache
+    (including expired entries), and a cache miss raises OfflineCacheMiss.
+
+    A single ResponseCache can be shared by multiple resolvers and worker threads.
+    """
+    # The status values of cached responses.
+    OK = 200
+    NOT_FOUND = 404
+    TIMEOUT = 0
+
+    def __init__(self, dbfile, ttl=30*24*3600, negttl=24*3600, maxentries=1000000, offline=False):
+        self.ttl = ttl
+        self.negttl = negttl
+        self.maxentries = maxentries
+        self.offline = offline
+
+        self.hits = 0
+        self.misses = 0
+
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(dbfile, check_same_thread=False)
+        self.conn.text_factory = str
+        self.conn.executescript(
+            """CREATE TABLE IF NOT EXISTS responses (
+                url     text PRIMARY KEY,
+                status  integer,
+                body    blob,
+                fetched real
+            );
+            CREATE INDEX IF NOT EXISTS responses_fetched_idx ON responses (fetched);""")
+        self.numentries = self.conn.execute('SELECT count(*) FROM responses').fetchone()[0]
+
+    def normalizeURL(self, url):
+        """
+        Returns a normalized version of a request URL, with a lowercase scheme and host
+        name, the query parameters in sorted order, and without a fragment, so that
+        equivalent requests share a single cache entry.
+        """
+        parts = urlparse.urlsplit(url)
+        query = urllib.urlencode(sorted(urlparse.parse_qsl(parts.query, keep_blank_values=True)))
+
+        return urlparse.urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, query, ''))
+
+    def get(self, url):
+        """
+        Looks up the response for url.  Returns a tuple (status, body) if the response
+        is in the cache and has not expired (or if the cache is in offline mode);
+        otherwise, returns None.  The body is None for failed requests.
+        """
+        with self.lock:
+            res = self.conn.execute('SELECT status, body, fetched FROM responses WHERE url=?',
+                    (self.normalizeURL(url),)).fetchone()
+
+            if res != None:
+                status, body, fetched = res
+                ttl = self.ttl if status == self.OK else self.negttl
+                if self.offline or (time.time() - fetched) < ttl:
+                    self.hits += 1
+                    return (status, body)
+
+            self.misses += 1
+
+            return None
+
+    def put(self, url, status, body=None):
+        """
+        Adds or replaces the response for url.
+        """
+        url = self.normalizeURL(url)
+        with self.lock:
+            if self.conn.execute('SELECT 1 FROM responses WHERE url=?', (url,)).fetchone() == None:
+                self.numentries += 1
+            self.conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)',
+                    (url, status, body, time.time()))
+
+            if self.maxentries > 0 and self.numentries > self.maxentries:
+                self._evict()
+
+            self.conn.commit()
+
+    def _evict(self):
+        """
+        Removes the oldest entries from the cache so that it is at 90% of its maximum
+        size, so that eviction does not have to run for every new entry.
+        """
+        numremove = self.numentries - (self.maxentries * 9 // 10)
+        self.conn.execute("""DELETE FROM responses WHERE url IN (
+            SELECT url FROM responses ORDER BY fetched LIMIT ?)""", (numremove,))
+        self.numentries = self.conn.execute('SELECT count(*) FROM responses').fetchone()[0]
+
+    def getStats(self):
+        """
+        Returns the number of cache hits and misses, as a tuple.
+        """
+        return (self.hits, self.misses)
@@ -0,0 +1,326 @@
+"""
+Provides name citation resolvers that match names against a local snapshot of the
+Catalog of Life and Zoobank data, stored in a SQLite database file, instead of querying
+the Web services one name at a time.  Also provides functions for importing the
+snapshot data.
+"""
+
+import sqlite3
+import csv
+from taxolib.nameresolve import NamesResolver, CoLNamesResolver, ZoobankNamesResolver
+from taxolib.namematch import registerFunctions
+
+
+# The snapshot database tables.  Name strings and author strings are stored after the
+# same cleanup that the Web service resolvers apply to search results, so that they can
+# be compared directly to the search strings.
+SNAPSHOT_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS col_names (
+        name    text,
+        rank    text,
+        kingdom text,
+        author  text
+    );
+    CREATE INDEX IF NOT EXISTS col_names_name_rank_idx ON col_names (name, rank);
+    CREATE TABLE IF NOT EXISTS zb_acts (
+        namestr   text,
+        rankgroup text,
+        authorstr text,
+        hasparens integer,
+        refuuid   text
+    );
+    CREATE INDEX IF NOT EXISTS zb_acts_namestr_rankgroup_idx ON zb_acts (namestr, rankgroup);
+    CREATE TABLE IF NOT EXISTS zb_refs (
+        refuuid  text PRIMARY KEY,
+        citation text
+    );"""
+
+def getSnapshotCursor(dbfile):
+    """
+    Opens (or creates) a snapshot database file and returns a cursor for it.
+    """
+    conn = sqlite3.connect(dbfile)
+    registerFunctions(conn)
+    conn.executescript(SNAPSHOT_SCHEMA)
+
+    return conn.cursor()
+
+def getSnapshotResolversList(snapcur):
+    """
+    Instantiates each concrete snapshot resolver class and returns the resolver objects
+    in a list, in the same order as nameresolve.getResolversList().
+    """
+    resolvers = []
+    resolvers.append(CoLSnapshotResolver(snapcur))
+    resolvers.append(ZoobankSnapshotResolver(snapcur))
+
+    return resolvers
+
+def _readDelimited(filename, delimiter):
+    """
+    A generator that reads a UTF-8 encoded delimited text file with a header row and
+    yields each row as a dictionary of unicode strings.
+    """
+    with open(filename, 'rb') as fin:
+        if delimiter == '\t':
+            reader = csv.DictReader(fin, delimiter=delimiter, quoting=csv.QUOTE_NONE)
+        else:
+            reader = csv.DictReader(fin, delimiter=delimiter)
+        for row in reader:
+            yield dict((key, unicode(value, 'utf-8')) for key, value in row.iteritems()
+                    if key != None and value != None)
+
+def importCoLTaxa(snapcur, taxafile):
+    """
+    Imports the names from the taxa file ("taxa.txt") of a Catalog of Life Darwin Core
+    archive, replacing any previously imported Catalog of Life names.  Synonyms are
+    assigned the kingdom of their accepted name if they do not have one.
+    """
+    cleaner = NamesResolver()
+    snapcur.execute('DELETE FROM col_names')
+    snapcur.execute("""CREATE TEMP TABLE col_import (
+        taxon_id text PRIMARY KEY, accepted_id text, name text, rank text, kingdom text, author text)""")
+
+    def getRows():
+        for row in _readDelimited(taxafile, '\t'):
+            name = row.get('scientificName', u'').strip()
+            author = row.get('scientificNameAuthorship', u'').strip()
+            # The scientific name usually includes the authorship, but the Web service
+            # reports the name without it.
+            if author != '' and name.endswith(author):
+                name = name[:-len(author)]
+            if name.strip() == '':
+                continue
+            rank = row.get('taxonRank', u'').strip()
+            yield (row.get('taxonID'), row.get('acceptedNameUsageID', u''),
+                    cleaner.cleanNameString(name), rank[:1].upper() + rank[1:].lower(),
+                    row.get('kingdom', u'').strip(), author if author != '' else None)
+
+    snapcur.executemany('INSERT OR REPLACE INTO col_import VALUES (?, ?, ?, ?, ?, ?)', getRows())
+    snapcur.execute("""INSERT INTO col_names (name, rank, kingdom, author)
+        SELECT ci.name, ci.rank,
+            CASE WHEN ci.kingdom != '' THEN ci.kingdom ELSE COALESCE(acc.kingdom, '') END,
+            ci.author
+        FROM col_import ci LEFT JOIN col_import acc ON acc.taxon_id=ci.accepted_id""")
+    snapcur.execute('DROP TABLE col_import')
+    snapcur.connection.commit()
+
+def importZoobankActs(snapcur, actsfile, refsfile=None):
+    """
+    Imports Zoobank nomenclatural acts from a CSV file with the columns "cleanprotonym",
+    "namestring", "rankgroup", and "OriginalReferenceUUID" (the same fields that the
+    Zoobank API returns), replacing any previously imported acts.  If refsfile is given,
+    references are imported from a CSV file with the columns "ReferenceUUID" and
+    "value" (the full citation string).  As for Web service results, acts for which the
+    name string is not part of the protonym are ignored.
+    """
+    cleaner = NamesResolver()
+    snapcur.execute('DELETE FROM zb_acts')
+
+    def getActs():
+        for row in _readDelimited(actsfile, ','):
+            parts = row['cleanprotonym'].rsplit(row['namestring'], 1)
+            if len(parts) == 2:
+                authorinfo = cleaner.processAuthorString(parts[1])
+                yield (cleaner.cleanNameString(parts[0] + row['namestring']), row['rankgroup'],
+                        authorinfo['authorstr'], int(authorinfo['hasparens']),
+                        row.get('OriginalReferenceUUID', u''))
+
+    snapcur.executemany('INSERT INTO zb_acts VALUES (?, ?, ?, ?, ?)', getActs())
+
+    if refsfile != None:
+        snapcur.execute('DELETE FROM zb_refs')
+        snapcur.executemany('INSERT OR REPLACE INTO zb_refs VALUES (?, ?)',
+                ((row['ReferenceUUID'], row['value']) for row in _readDelimited(refsfile, ',')))
+
+    snapcur.connection.commit()
+
+
+class LocalSnapshotResolver:
+    """
+    A mix-in class for resolvers that match names against a local snapshot database.
+    It is combined with one of the Web service resolver classes, which provides the
+    matching rules and the code that applies the results to the taxa.  When resolve()
+    or resolveSubtrees() is called, the names of all candidate taxa in the tree(s)
+    (including subgenus variants of species names) are matched against the snapshot with
+    a single set-based query.
+    The tree is then traversed exactly as for Web service resolution, except that the
+    lookup for each taxon simply returns the precomputed match.  Thus, the results,
+    including skipped names and pruned subtrees, are the same as for the Web services.
+    """
+    def __init__(self, snapcur):
+        self.snapcur = snapcur
+        self.matches = {}
+
+    def resolve(self, pgcur, taxon):
+        self.resolveSubtrees(pgcur, [taxon])
+
+    def resolveSubtrees(self, pgcur, taxa):
+        self.pgcur = pgcur
+        self._loadExistingCiteData()
+        self._initResolution()
+
+        candidates = []
+        for taxon in taxa:
+            candidates.extend(self._getCandidates(taxon))
+        self.matches = self._matchNames(candidates)
+        try:
+            for taxon in taxa:
+                self.visit(taxon)
+        finally:
+            self.matches = {}
+
+    def resolveTaxon(self, pgcur, taxon):
+        self.pgcur = pgcur
+        self._loadExistingCiteData()
+        self._initResolution()
+
+        if self._isCandidate(taxon):
+            self.matches = self._matchNames([taxon])
+        try:
+            return self._resolveSingleTaxon(taxon)
+        finally:
+            self.matches = {}
+
+    def _getCandidates(self, taxon):
+        """
+        Returns a list of all taxa in the tree, up to self.maxdepth, with names that the
+        resolver can look up.
+        """
+        candidates = []
+        stack = [(taxon, 0)]
+        while len(stack) > 0:
+            curtaxon, depth = stack.pop()
+            if self._isCandidate(curtaxon):
+                candidates.append(curtaxon)
+            if self.maxdepth < 0 or depth < self.maxdepth:
+                stack.extend((child, depth + 1) for child in curtaxon.children)
+
+        return candidates
+
+    def _isCandidate(self, taxon):
+        """
+        Returns True if the name of taxon has a rank that the resolver can look up.
+        """
+        return False
+
+    def _lookupName(self, taxon):
+        return self.matches.get(id(taxon))
+
+    def _loadLookups(self, lookups):
+        """
+        Loads a list of lookup tuples into the temporary table "snap_lookups".  The first
+        three values of each tuple are the lookup ID, the index of the name variant, and
+        the search string.
+        """
+        self.snapcur.execute("""CREATE TEMP TABLE IF NOT EXISTS snap_lookups (
+            lookup_id integer, variant integer, searchstr text, rank text, hascite integer,
+            authordisp text)""")
+        self.snapcur.execute('DELETE FROM snap_lookups')
+        self.snapcur.executemany('INSERT INTO snap_lookups VALUES (?, ?, ?, ?, ?, ?)', lookups)
+
+    def _getBestMatches(self, rows):
+        """
+        Given result rows that start with the lookup ID and name variant index, returns a
+        dictionary that maps each lookup ID to the row with the lowest variant index.
+        This corresponds to trying the name variants in order and using the first match.
+        """
+        best = {}
+        for row in rows:
+            if row[0] not in best or row[1] < best[row[0]][1]:
+                best[row[0]] = row
+
+        return best
+
+
+class CoLSnapshotResolver(LocalSnapshotResolver, CoLNamesResolver):
+    """
+    Matches species-group names against the Catalog of Life names in a snapshot
+    database, using the same rules as CoLNamesResolver: the name and rank must be
+    identical, the kingdom must be self.search_kingdom, the match must be unique, and
+    it must have author information.  Subgenus variants are tried in the same order.
+    """
+    def __init__(self, snapcur, numtaxa=-1, maxdepth=-1):
+        CoLNamesResolver.__init__(self, numtaxa, maxdepth)
+        LocalSnapshotResolver.__init__(self, snapcur)
+
+    def getSourceDescription(self):
+        return 'Catalog of Life (local snapshot)'
+
+    def _isCandidate(self, taxon):
+        return taxon.rank_id >= taxon.rankt.getID('Species', taxon.ranksys)
+
+    def _matchNames(self, taxa):
+        lookups = []
+        for index, taxon in enumerate(taxa):
+            searchstrs = self._getSpeciesSearchStrs(taxon.name.namestr)
+            for variant, searchstr in enumerate(searchstrs):
+                lookups.append((index, variant, searchstr, taxon.getRankString(), 0, None))
+        self._loadLookups(lookups)
+
+        self.snapcur.execute("""SELECT lk.lookup_id, lk.variant, c.name, c.rank, c.author
+            FROM snap_lookups lk JOIN col_names c ON c.name=lk.searchstr AND c.rank=lk.rank
+            WHERE c.kingdom=?
+            GROUP BY lk.lookup_id, lk.variant
+            HAVING count(*)=1 AND c.author IS NOT NULL""", (self.search_kingdom,))
+
+        matches = {}
+        for lookup_id, variant, sname, srank, sauthor in self._getBestMatches(self.snapcur).values():
+            matches[id(taxa[lookup_id])] = (None, sname, srank, self.processAuthorString(sauthor))
+
+        return matches
+
+
+class ZoobankSnapshotResolver(LocalSnapshotResolver, ZoobankNamesResolver):
+    """
+    Matches names of family-group rank or lower against the Zoobank nomenclatural acts
+    in a snapshot database, using the same rules as ZoobankNamesResolver: the name and
+    rank group must be identical, the author must match the name's existing author
+    information (if any), and the match must be unique.  As for Zoobank, species in a
+    genus whose name does not match are not resolved.
+    """
+    def __init__(self, snapcur, numtaxa=-1, maxdepth=-1):
+        ZoobankNamesResolver.__init__(self, numtaxa, maxdepth)
+        LocalSnapshotResolver.__init__(self, snapcur)
+
+    def getSourceDescription(self):
+        return 'Zoobank (local snapshot)'
+
+    def _isCandidate(self, taxon):
+        return taxon.rank_id >= taxon.rankt.getID('Family', taxon.ranksys)
+
+    def _matchNames(self, taxa):
+        lookups = []
+        for index, taxon in enumerate(taxa):
+            if taxon.rank_id >= taxon.rankt.getID('Species', taxon.ranksys):
+                searchstrs = self._getSpeciesSearchStrs(taxon.name.namestr)
+            else:
+                searchstrs = [taxon.name.namestr]
+
+            citation = taxon.name.getCitation()
+            for variant, searchstr in enumerate(searchstrs):
+                if citation != None:
+                    lookups.append((index, variant, searchstr, taxon.getRankString(), 1,
+                        citation.authordisp))
+                else:
+                    lookups.append((index, variant, searchstr, taxon.getRankString(), 0, None))
+        self._loadLookups(lookups)
+
+        self.snapcur.execute("""SELECT lk.lookup_id, lk.variant, a.namestr, a.authorstr,
+                a.hasparens, a.refuuid, r.citation
+            FROM snap_lookups lk JOIN zb_acts a ON a.namestr=lk.searchstr AND a.rankgroup=lk.rank
+                LEFT JOIN zb_refs r ON r.refuuid=a.refuuid
+            WHERE lk.hascite=0 OR a.authorstr=lk.authordisp
+            GROUP BY lk.lookup_id, lk.variant
+            HAVING count(*)=1""")
+
+        matches = {}
+        for row in self._getBestMatches(self.snapcur).values():
+            lookup_id, variant, rnamestr, authorstr, hasparens, refuuid, refcite = row
+            authorinfo = { 'authorstr': authorstr, 'hasparens': bool(hasparens) }
+            fullcite = ''
+            if refuuid != '' and refcite != None:
+                fullcite = self.cleanCiteString(refcite)
+            matches[id(taxa[lookup_id])] = (None, rnamestr, authorinfo, fullcite)
+
+        return matches
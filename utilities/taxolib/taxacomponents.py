@@ -3,6 +3,10 @@ Provides classes that model the basic pieces of a taxonomy: rank information, ta
 names, citations, and algorithms to operate on trees of taxon concepts.
 """
 
+import weakref
+from taxolib.taxodatabase import hasNameSearchIndex
+from taxolib.namematch import getPhoneticKeys
+
 
 class RankTable:
     """
@@ -10,11 +14,45 @@ class RankTable:
     ID lookups are always unambiguous, but rank name lookups require a rank system ID.
     RankTable keeps track of a default rank system to use for name lookups.
     """
+    # Loaded rank tables, keyed by database file name.  Used by getCached().
+    _cache = {}
+
+    @staticmethod
+    def getCached(pgcur):
+        """
+        A static method that returns a RankTable loaded from the database for pgcur.  Each
+        database's rank information is only loaded once per process; subsequent calls for
+        the same database file return the same RankTable object.  Rank tables for
+        in-memory databases are not cached.
+        """
+        # Get the file name of the main database.
+        pgcur.execute('PRAGMA database_list')
+        dbfile = ''
+        for rec in pgcur.fetchall():
+            if rec[1] == 'main':
+                dbfile = rec[2]
+
+        if dbfile in RankTable._cache:
+            return RankTable._cache[dbfile]
+
+        rankt = RankTable()
+        rankt.loadFromDB(pgcur)
+        if dbfile != '':
+            RankTable._cache[dbfile] = rankt
+
+        return rankt
+
     def __init__(self):
         # Define two dictionaries so we can efficiently search in both directions.
         self.IDstonames = {}
         self.namestoIDs = {}
 
+        # Precomputed lookup tables for the rank system of each rank ID and the minimum
+        # and maximum rank IDs of each rank system.
+        self.IDstoranksys = {}
+        self.minIDs = {}
+        self.maxIDs = {}
+
     def loadFromDB(self, pgcur):
         """
         Loads the rank ID and name information from the MOL taxonomy database.
@@ -24,42 +62,42 @@ class RankTable:
         for rec in pgcur:
             self.namestoIDs[rec[0]] = {}
 
-        # Now get the ranks for each rank system.
-        for rsid in self.namestoIDs.keys():
-            pgcur.execute('SELECT rank_id, namestr FROM ranks WHERE ranksys_id=? ORDER BY rank_id',
-                    (rsid,))
-            for rec in pgcur:
-                self.namestoIDs[rsid][rec[1]] = rec[0]
-                self.IDstonames[rec[0]] = rec[1]
+        # Now get the ranks for all rank systems.
+        pgcur.execute('SELECT ranksys_id, rank_id, namestr FROM ranks ORDER BY rank_id')
+        for rec in pgcur:
+            self.namestoIDs.setdefault(rec[0], {})[rec[2]] = rec[1]
+            self.IDstonames[rec[1]] = rec[2]
+            self.IDstoranksys[rec[1]] = rec[0]
+
+        for rsid in self.namestoIDs:
+            if len(self.namestoIDs[rsid]) > 0:
+                self.minIDs[rsid] = min(self.namestoIDs[rsid].itervalues())
+                self.maxIDs[rsid] = max(self.namestoIDs[rsid].itervalues())
 
     def getMinRankID(self, ranksys):
         """
         Returns the minimum ID within a given rank system.
         """
-        return min(self.namestoIDs[ranksys].itervalues())
+        return self.minIDs[ranksys]
 
     def getMaxRankID(self, ranksys):
         """
-        Returns the minimum ID within a given rank system.
+        Returns the maximum ID within a given rank system.
         """
-        return max(self.namestoIDs[ranksys].itervalues())
+        return self.maxIDs[ranksys]
 
     def isIDInRanksys(self, ranksys, rankid):
         """
         Checks if a given rank ID is within a given rank system.
         """
-        return rankid in self.namestoIDs[ranksys].itervalues()
+        return self.IDstoranksys.get(rankid) == ranksys
 
     def getRanksysByRankID(self, rankid):
         """
         Gets the rank system to which the given rankid belongs.  Returns None if the
         lookup failed.
         """
-        for ranksys in self.namestoIDs.keys():
-            if rankid in self.namestoIDs[ranksys].itervalues():
-                return ranksys
-
-        return None
+        return self.IDstoranksys.get(rankid)
 
     def getName(self, rankid):
         """
@@ -75,10 +113,12 @@ class RankTable:
         return self.namestoIDs[ranksys][namestr]
 
 
-class NameList:
+class NameList(object):
     """
     Represents a set of names that are associated with a particular taxon concept.
     """
+    __slots__ = ('names', 'useparenslist', 'preferred', 'taxon')
+
     def __init__(self):
         # The list of Name objects.
         self.names = []
@@ -115,16 +155,33 @@ class NameList:
         """
         self.taxon = taxon
 
+    def _getPreferredNameStr(self):
+        if self.preferred != None:
+            return self.names[self.preferred].namestr
+        else:
+            return None
+
+    def preferredNameChanged(self, oldnamestr):
+        """
+        Tells the associated Taxon, if any, that the preferred name string might have
+        changed from oldnamestr, so that the taxon can be re-indexed by its parent.
+        """
+        if self.taxon != None:
+            self.taxon.keyChanged((self.taxon.rank_id, oldnamestr))
+
     def addName(self, name, preferred, useparens):
         """
         Adds a Name object to the list of names.  The value of preferred indicates whether
         the new name is the preferred name for the taxon.
         """
+        name.namelist = self
         self.names.append(name)
         self.useparenslist.append(useparens)
 
         if preferred:
+            oldnamestr = self._getPreferredNameStr()
             self.preferred = len(self.names) - 1
+            self.preferredNameChanged(oldnamestr)
 
     def getPreferredUseParens(self):
         """
@@ -148,12 +205,15 @@ class NameList:
         """
         Loads the name list for a given taxon ID from the database.
         """
+        oldnamestr = self._getPreferredNameStr()
         self.names = []
         self.useparenslist = []
+        self.preferred = None
 
         query = """SELECT nttc.name_id, nttc.validity, nttc.authordisp_prefix
             FROM names_to_taxonconcepts nttc
-            WHERE nttc.tc_id=?"""
+            WHERE nttc.tc_id=?
+            ORDER BY nttc.name_id"""
         pgcur.execute(query, (tc_id,))
         results = pgcur.fetchall()
 
@@ -168,6 +228,32 @@ class NameList:
 
                 self.addName(name, preferred, use_parens)
 
+        self.preferredNameChanged(oldnamestr)
+
+    def loadFromRows(self, rows):
+        """
+        Builds the name list from rows that were already retrieved from the database.
+        Each row must contain, in order: validity, authordisp_prefix, name_id, namestr,
+        citation_id, citationstr, url, doi, and authordisplay.  This is used by the bulk
+        taxa tree loader to avoid querying the database for each name and citation.
+        """
+        oldnamestr = self._getPreferredNameStr()
+        self.names = []
+        self.useparenslist = []
+        self.preferred = None
+
+        for res in rows:
+            name = Name(res[3])
+            name.idnum = res[2]
+            if res[4] != None:
+                name.citation = Citation.intern(Citation(res[5], res[8], res[7], res[6]))
+            preferred = (res[0] == 'valid')
+            use_parens = (res[1] == '(')
+
+            self.addName(name, preferred, use_parens)
+
+        self.preferredNameChanged(oldnamestr)
+
     def persist(self, pgcur, tc_id, do_commit=True):
         """
         Ensures that all names in the list are associated with the taxon concept in the
@@ -202,36 +288,152 @@ class NameList:
             pgcur.connection.commit()
 
 
-class Taxon:
+class Taxon(object):
     """
     Represents a single taxon concept that approximately models a taxon concept in the MOL
     taxonomies database.  The key difference is that each Taxon keeps a list of references
-    to all of its children (rather than a reference to its parent, as in the database).
+    to all of its children (rather than only a reference to its parent, as in the
+    database).  The reference to the parent is used to keep the parent's child index up
+    to date (see findChild()) and to find the ancestors of a subtree that is written to the
+    database on its own (see BatchTaxaPersister.persistSubtrees()).
     """
+    __slots__ = ('taxonomy_id', 'tc_id', 'rankt', 'depth', 'isroot', 'roottaxo_id', 'namelist',
+            'children', 'childindex', 'parent', 'rank_id', 'ranksys')
+
+    # The query used to add the tc_ancestry rows for a new taxon concept.  The parameters
+    # are, in order: the new tc_id, the new tc_id, the new tc_id, and the parent tc_id.
+    ANCESTRY_INSERT_QUERY = """INSERT INTO tc_ancestry
+        (ancestor_id, descendant_id, distance)
+        SELECT ?, ?, 0
+        UNION ALL
+        SELECT anc.ancestor_id, ?, anc.distance + 1
+        FROM tc_ancestry anc
+        WHERE anc.descendant_id=?"""
+
     @staticmethod
-    def find(pgcur, searchstr, ranktable, taxonomy_id=None, rank_id=None, pref_names_only=False):
+    def getAncestorIDs(pgcur, tc_id):
+        """
+        A static method that returns the IDs of all ancestors of a taxon concept, ordered
+        from the parent to the most distant ancestor (the root of the full tree).  Uses a
+        single query of the tc_ancestry closure table.
+        """
+        query = """SELECT anc.ancestor_id
+            FROM tc_ancestry anc
+            WHERE anc.descendant_id=? AND anc.distance>0
+            ORDER BY anc.distance"""
+        pgcur.execute(query, (tc_id,))
+
+        return [res[0] for res in pgcur.fetchall()]
+
+    @staticmethod
+    def getDescendantIDs(pgcur, tc_id, maxdistance=-1, taxonomy_id=None):
+        """
+        A static method that returns the IDs of all descendents of a taxon concept, ordered
+        by ID.  If maxdistance > -1, only descendents that are at most maxdistance levels
+        below the taxon concept are returned.  If taxonomy_id is provided, only descendents
+        that belong to the given taxonomy are returned.  Uses a single query of the
+        tc_ancestry closure table.
+        """
+        query = """SELECT anc.descendant_id
+            FROM tc_ancestry anc, taxon_concepts tc
+            WHERE anc.ancestor_id=? AND anc.distance>0 AND tc.tc_id=anc.descendant_id"""
+        params = [tc_id]
+        if maxdistance > -1:
+            query += ' AND anc.distance<=?'
+            params.append(maxdistance)
+        if taxonomy_id != None:
+            query += ' AND tc.taxonomy_id=?'
+            params.append(taxonomy_id)
+        query += ' ORDER BY anc.descendant_id'
+        pgcur.execute(query, params)
+
+        return [res[0] for res in pgcur.fetchall()]
+
+    # The name search modes supported by find().
+    SEARCH_LIKE = 'like'
+    SEARCH_TOKEN = 'token'
+    SEARCH_PREFIX = 'prefix'
+    SEARCH_SUBSTRING = 'substring'
+    SEARCH_MODES = (SEARCH_LIKE, SEARCH_TOKEN, SEARCH_PREFIX, SEARCH_SUBSTRING)
+
+    @staticmethod
+    def find(pgcur, searchstr, ranktable, taxonomy_id=None, rank_id=None, pref_names_only=False,
+            mode='like', limit=0):
         """
         A static method to search for taxa in the taxonomy database that have a name matching
         the value of searchstr.  Matching taxa are returned as a list of Taxon objects.  Taxa
         searches can be further limited by providing a taxonomy ID or a rank ID.  If
-        pref_names_only == True, only preferred names are searched.
-        """
-        taxalist = []
+        pref_names_only == True, only preferred names are searched.  If limit > 0, at most
+        limit taxa are returned.
+
+        The value of mode determines how names are matched (all matching is
+        case-insensitive, and "%" can be used as a wildcard character in all modes):
+          'like' -- searchstr is a LIKE pattern that must match the entire name.
+          'token' -- searchstr must match one or more complete words of a name, e.g.,
+              "sapiens" matches "Homo sapiens".
+          'prefix' -- searchstr must match the beginning of a name.
+          'substring' -- searchstr must match any part of a name.
+        All modes use the names_fts full-text index, if the database has one.  The last
+        three modes also rank the results: taxa with a name that matches searchstr exactly
+        come first, followed by prefix matches, complete word matches, and all other
+        matches, and taxa with shorter names come first within each group.
+        """
+        if mode not in Taxon.SEARCH_MODES:
+            raise ValueError('Invalid name search mode: ' + str(mode) + '.')
+
+        # A LIKE pattern that matches the complete words of a name.  Parentheses, such
+        # as those around subgenus names, separate words.
+        tokenexpr = "(' ' || replace(replace(n.namestr, '(', ' '), ')', ' ') || ' ')"
+
+        # Use the full-text index to find the matching names, if possible.  The trigram
+        # index is used by SQLite to evaluate LIKE patterns.
+        if hasNameSearchIndex(pgcur):
+            namesrc = 'names_fts, names n'
+            namematch = 'names_fts.namestr LIKE ? AND n.name_id=names_fts.rowid'
+        else:
+            namesrc = 'names n'
+            namematch = 'n.namestr LIKE ?'
+
+        if mode == Taxon.SEARCH_LIKE:
+            query = """SELECT DISTINCT tc.tc_id, tc.taxonomy_id, tc.rank_id
+                FROM {0}, names_to_taxonconcepts nttc, taxon_concepts tc
+                WHERE {1} AND n.name_id=nttc.name_id AND nttc.tc_id=tc.tc_id""".format(
+                        namesrc, namematch)
+            params = [searchstr]
+        else:
+            if mode == Taxon.SEARCH_PREFIX:
+                pattern = searchstr + '%'
+            else:
+                pattern = '%' + searchstr + '%'
+
+            query = """SELECT tc.tc_id, tc.taxonomy_id, tc.rank_id,
+                    min(CASE WHEN n.namestr LIKE ? THEN 0 WHEN n.namestr LIKE ? THEN 1
+                        WHEN {0} LIKE ? THEN 2 ELSE 3 END) AS matchrank,
+                    min(length(n.namestr)) AS namelen, min(n.namestr) AS sortname
+                FROM {1}, names_to_taxonconcepts nttc, taxon_concepts tc
+                WHERE {2} AND n.name_id=nttc.name_id AND nttc.tc_id=tc.tc_id""".format(
+                        tokenexpr, namesrc, namematch)
+            params = [searchstr, searchstr + '%', '% ' + searchstr + ' %', pattern]
+            if mode == Taxon.SEARCH_TOKEN:
+                query += ' AND ' + tokenexpr + ' LIKE ?'
+                params.append('% ' + searchstr + ' %')
 
-        query = """SELECT DISTINCT tc.tc_id, tc.taxonomy_id, tc.rank_id
-            FROM names n, names_to_taxonconcepts nttc, taxon_concepts tc
-            WHERE n.namestr LIKE ? AND n.name_id=nttc.name_id AND nttc.tc_id=tc.tc_id"""
-        params = [searchstr]
         if pref_names_only:
-            query += ' AND nttc.preferred=TRUE'
+            query += " AND nttc.validity='valid'"
         if taxonomy_id != None:
             query += ' AND tc.taxonomy_id=?'
             params.append(taxonomy_id)
         if rank_id != None:
             query += ' AND tc.rank_id=?'
             params.append(rank_id)
+        if mode != Taxon.SEARCH_LIKE:
+            query += ' GROUP BY tc.tc_id ORDER BY matchrank, namelen, sortname, tc.tc_id'
+        if limit > 0:
+            query += ' LIMIT ?'
+            params.append(limit)
         pgcur.execute(query, params)
 
+        taxalist = []
         for res in pgcur.fetchall():
             taxon = Taxon(res[1], res[2], ranktable)
             taxon.loadFromDB(pgcur, res[0], maxdepth=0)
@@ -257,24 +459,33 @@ class Taxon:
         else:
             self.roottaxo_id = roottaxo_id
 
+        # The Taxon that this Taxon was most recently added to as a child, which must be
+        # told when this Taxon's rank or name changes.
+        self.parent = None
+
+        self.rank_id = None
+        self.setRankID(rank_id)
+
         self.namelist = NameList()
+        self.namelist.associateWith(self)
         if namestr != '':
             name = Name(namestr)
             self.namelist.addName(name, True, False)
 
         self.children = []
 
-        self.setRankID(rank_id)
+        # An index of the child taxa by (rank ID, preferred name string).  The index is
+        # created by the first call to findChild() and is then kept up to date as
+        # children are added and as their ranks and names change.
+        self.childindex = None
 
-    def __getattr__(self, attrname):
+    @property
+    def name(self):
         """
-        Implements a dynamic, computed attribute called "name" that points directly to the
-        preferred name for this Taxon.  This is merely a convenience for client code.
+        A computed attribute that points directly to the preferred name for this Taxon.
+        This is merely a convenience for client code.
         """
-        if attrname == 'name':
-            return self.namelist.getPreferred()
-        else:
-            raise AttributeError("Taxon instance has no attribute '" + attrname + "'")
+        return self.namelist.getPreferred()
 
     def equals(self, taxon):
         """
@@ -288,7 +499,10 @@ class Taxon:
         """
         Sets the rank ID for this Taxon and uses the rank ID to set the correct rank system.
         """
+        oldrank_id = self.rank_id
         self.rank_id = rank_id
+        if oldrank_id != rank_id and self.parent != None:
+            self.keyChanged((oldrank_id, self.namelist._getPreferredNameStr()))
 
         # Set which rank system to use.
         #print self.rankt.ranksys, self.rank_id
@@ -345,15 +559,21 @@ class Taxon:
         """
         self.namelist.setPreferredUseParens(useparens)
 
-    def loadFromDB(self, pgcur, tc_id, taxanum=-1, maxdepth=-1):
+    def loadFromDB(self, pgcur, tc_id, taxanum=-1, maxdepth=-1, bulk=False):
         """
         Attempts to load this taxon from the database using the specified tc_id.  All
         children and descendents of this taxon will also be recursively loaded.  Use
         taxanum to limit the number of taxa that are loaded.  If taxanum < 1, all taxa
         will be loaded.  If maxdepth > -1, the tree will only be traversed to a depth
-        of maxdepth.
+        of maxdepth.  If bulk == True, the entire subtree, along with all names and
+        citations, is retrieved with a few set-based queries and the taxa tree is then
+        built in memory.  This is much faster for large trees and produces exactly the
+        same result as the default, taxon-by-taxon loading.
         """
-        self._loadFromDB(pgcur, tc_id, taxanum, 0, maxdepth, 0)
+        if bulk:
+            self._loadFromDBBulk(pgcur, tc_id, taxanum, maxdepth)
+        else:
+            self._loadFromDB(pgcur, tc_id, taxanum, 0, maxdepth, 0)
 
     def _loadFromDB(self, pgcur, tc_id, taxanum, taxacnt, maxdepth, curdepth):
         """
@@ -385,7 +605,8 @@ class Taxon:
         # Now process all children of this taxon that are part of the same taxonomy.
         query = """SELECT tc_id
             FROM taxon_concepts
-            WHERE parent_id=? AND taxonomy_id=?"""
+            WHERE parent_id=? AND taxonomy_id=?
+            ORDER BY tc_id"""
         pgcur.execute(query, (tc_id, self.taxonomy_id))
         results = pgcur.fetchall()
         
@@ -394,33 +615,187 @@ class Taxon:
                 if taxanum > 0 and taxacnt >= taxanum:
                     break
                 childtaxon = Taxon(self.taxonomy_id, self.rank_id, self.rankt)
-                self.children.append(childtaxon)
                 taxacnt = childtaxon._loadFromDB(pgcur, res[0], taxanum, taxacnt, maxdepth, curdepth + 1)
+                self.addChild(childtaxon)
+
+        return taxacnt
+
+    def _loadFromDBBulk(self, pgcur, tc_id, taxanum, maxdepth):
+        """
+        An internal method that loads a taxa tree from the taxonomy database using the
+        tc_ancestry closure table to retrieve the complete subtree rooted at tc_id
+        (limited to maxdepth, if maxdepth > -1) and a single join to retrieve all of the
+        names and citations for the subtree.  The tree of Taxon objects is then built in
+        memory.
+        """
+        # Get the taxonomy ID of the root taxon concept.  Only descendents that are part
+        # of the same taxonomy as the root's children are loaded, which means that for
+        # the root of a tree, we need to use the taxonomy ID of its children.
+        query = """SELECT tc.taxonomy_id
+            FROM taxon_concepts tc
+            WHERE tc.tc_id=?"""
+        pgcur.execute(query, (tc_id,))
+        res = pgcur.fetchone()
+        if self.isroot:
+            child_taxo_id = self.taxonomy_id
+        else:
+            child_taxo_id = res[0]
+
+        # A common table expression that defines all taxon concepts in the subtree.
+        # Descendents from other taxonomies are excluded, as are any descendents that are
+        # only connected to the root through taxa of another taxonomy (these cannot be
+        # reached when the tree is built, below).
+        subtree_cte = """WITH subtree(tc_id) AS (
+                SELECT anc.descendant_id
+                FROM tc_ancestry anc, taxon_concepts tc
+                WHERE anc.ancestor_id=? AND tc.tc_id=anc.descendant_id
+                    AND (anc.distance=0 OR tc.taxonomy_id=?)"""
+        params = [tc_id, child_taxo_id]
+        if maxdepth > -1:
+            subtree_cte += ' AND anc.distance<=?'
+            params.append(maxdepth)
+        subtree_cte += '\n            )'
+
+        # Get the taxon concept information for the full subtree.  The results are
+        # ordered so that the children of each taxon are in the same order as they
+        # would be when they are loaded one at a time.
+        query = subtree_cte + """
+            SELECT tc.tc_id, tc.parent_id, tc.rank_id, tc.depth, tc.taxonomy_id
+            FROM subtree, taxon_concepts tc
+            WHERE tc.tc_id=subtree.tc_id
+            ORDER BY tc.tc_id"""
+        pgcur.execute(query, params)
+
+        tcrows = {}
+        childrenmap = {}
+        for res in pgcur.fetchall():
+            tcrows[res[0]] = res[2:]
+            if res[0] != tc_id:
+                childrenmap.setdefault(res[1], []).append(res[0])
+
+        # Get all names and citations for the subtree.
+        query = subtree_cte + """
+            SELECT nttc.tc_id, nttc.validity, nttc.authordisp_prefix, n.name_id, n.namestr,
+                n.citation_id, c.citationstr, c.url, c.doi, c.authordisplay
+            FROM subtree, names_to_taxonconcepts nttc, names n
+                LEFT JOIN citations c ON c.citation_id=n.citation_id
+            WHERE nttc.tc_id=subtree.tc_id AND nttc.name_id=n.name_id
+            ORDER BY nttc.tc_id, nttc.name_id"""
+        pgcur.execute(query, params)
+
+        namerows = {}
+        for res in pgcur.fetchall():
+            namerows.setdefault(res[0], []).append(res[1:])
+
+        self._buildFromRows(tc_id, tcrows, childrenmap, namerows, taxanum, 0, maxdepth, 0)
+
+    def _buildFromRows(self, tc_id, tcrows, childrenmap, namerows, taxanum, taxacnt, maxdepth, curdepth):
+        """
+        An internal method to recursively build a taxa tree from rows retrieved by
+        _loadFromDBBulk().  Keeps track of how many taxa have been loaded and the depth
+        of the recursion exactly as _loadFromDB() does.
+        """
+        rank_id, depth, taxonomy_id = tcrows[tc_id]
+
+        self.setRankID(rank_id)
+
+        self.tc_id = tc_id
+        self.depth = depth
+
+        if self.isroot:
+            self.roottaxo_id = taxonomy_id
+        else:
+            self.taxonomy_id = taxonomy_id
+
+        self.namelist.loadFromRows(namerows.get(tc_id, []))
+
+        taxacnt += 1
+
+        if maxdepth < 0 or curdepth < maxdepth:
+            for child_id in childrenmap.get(tc_id, []):
+                if taxanum > 0 and taxacnt >= taxanum:
+                    break
+                childtaxon = Taxon(self.taxonomy_id, self.rank_id, self.rankt)
+                taxacnt = childtaxon._buildFromRows(child_id, tcrows, childrenmap, namerows,
+                        taxanum, taxacnt, maxdepth, curdepth + 1)
+                self.addChild(childtaxon)
 
         return taxacnt
 
     def findChild(self, rank_id, namestr):
         """
         Search for a child taxon by rank ID and preferred name string.  If a match is
-        found, the child Taxon object is returned.  Otherwise, None is returned.
-        """
-        found = False
-        index = 0
-        while not(found) and index < len(self.children):
-            if self.children[index].rank_id == rank_id and self.children[index].name.namestr == namestr:
-                found = True
-            index += 1
-        
-        if found:
-            return self.children[index - 1]
-        else:
-            return None
+        found, the child Taxon object is returned.  Otherwise, None is returned.  If more
+        than one child matches, the first matching child is returned.  Searches use a hash
+        index of the child taxa, so they run in constant time regardless of the number of
+        children.
+        """
+        if self.childindex == None:
+            self.childindex = {}
+            for child in self.children:
+                self.childindex.setdefault(child._getChildKey(), child)
+
+        return self.childindex.get((rank_id, namestr))
+
+    def _getChildKey(self):
+        """
+        Returns the key of this Taxon in its parent's child index.
+        """
+        return (self.rank_id, self.namelist._getPreferredNameStr())
+
+    def keyChanged(self, oldkey):
+        """
+        Called when the rank ID or preferred name string of this Taxon might have
+        changed from those in oldkey, a (rank ID, name string) tuple.  The parent's child
+        index entry for this Taxon, if there is one, is updated.
+        """
+        if self.parent != None:
+            self.parent._reindexChild(self, oldkey)
+
+    def _reindexChild(self, child, oldkey):
+        """
+        Moves a child taxon from its old key to its current key in the child index.
+        """
+        newkey = child._getChildKey()
+        if self.childindex == None or newkey == oldkey:
+            return
+
+        # If the child was the indexed match for its old key, the next child with that
+        # key, if any, becomes the match.
+        if self.childindex.get(oldkey) is child:
+            del self.childindex[oldkey]
+            for other in self.children:
+                if other is not child and other._getChildKey() == oldkey:
+                    self.childindex[oldkey] = other
+                    break
+
+        # The index always refers to the first matching child.
+        current = self.childindex.get(newkey)
+        if current == None or self.children.index(child) < self.children.index(current):
+            self.childindex[newkey] = child
 
     def addChild(self, taxon):
         """
         Adds a Taxon object as a child of this Taxon object.
         """
         self.children.append(taxon)
+        taxon.parent = self
+
+        if self.childindex != None:
+            self.childindex.setdefault(taxon._getChildKey(), taxon)
+
+    def removeChildren(self, taxa):
+        """
+        Removes all Taxon objects in the list taxa from the children of this Taxon.
+        """
+        removeids = set(id(taxon) for taxon in taxa)
+        self.children = [child for child in self.children if id(child) not in removeids]
+        for taxon in taxa:
+            if taxon.parent is self:
+                taxon.parent = None
+
+        # The child index must be rebuilt.
+        self.childindex = None
 
     def createChild(self, rank_id, namestr):
         """
@@ -431,7 +806,7 @@ class Taxon:
         Taxon object is the return value.
         """
         newchild = Taxon(self.taxonomy_id, rank_id, self.rankt, self.depth + 1, namestr)
-        self.children.append(newchild)
+        self.addChild(newchild)
 
         return newchild
 
@@ -508,9 +883,13 @@ class Taxon:
                 VALUES (?, ?, ?, ?)"""
             pgcur.execute(query, (parent_id, taxo_id, self.rank_id, self.depth))
             tc_id = pgcur.lastrowid
+
+            # Add the new taxon concept to the closure table.
+            pgcur.execute(self.ANCESTRY_INSERT_QUERY, (tc_id, tc_id, tc_id, parent_id))
         else:
             print ('The taxon concept "' + self._getRankNameString() + '" for taxonomy ID '
                 + str(taxo_id) + ' already exists in the database.')
+        self.tc_id = tc_id
 
         # Make sure the names are linked to the taxon concept.
         self.namelist.persist(pgcur, tc_id, False)
@@ -525,12 +904,32 @@ class Taxon:
         return tc_id
 
 
-class Name:
+class Name(object):
+    __slots__ = ('_namestr', 'citation', 'idnum', 'namelist')
+
     def __init__(self, namestr='', citation=None):
-        self.namestr = namestr
+        self._namestr = namestr
         self.citation = citation
         self.idnum = None
 
+        # The NameList that this name belongs to, if any (see NameList.addName()).
+        self.namelist = None
+
+    @property
+    def namestr(self):
+        return self._namestr
+
+    @namestr.setter
+    def namestr(self, namestr):
+        """
+        Sets the name string.  If this is the preferred name of a taxon, the taxon's
+        parent is told about the change so that its child index stays up to date.
+        """
+        oldnamestr = self._namestr
+        self._namestr = namestr
+        if self.namelist != None and namestr != oldnamestr and self.namelist.getPreferred() is self:
+            self.namelist.preferredNameChanged(oldnamestr)
+
     def setCitation(self, citation):
         self.citation = citation
 
@@ -552,7 +951,10 @@ class Name:
         Augments the existing citation information for a name or creates a new
         Citation object and adds it to the name.  This method currently only
         handles the two text citation fields.  This method will not overrite
-        the values of fields that already contain citation data.
+        the values of fields that already contain citation data.  Citation objects
+        can be shared by multiple names, so the existing Citation object is never
+        modified; instead, a new Citation object with the combined information is
+        attached to the name.
         """
         if citestr == None:
             citestr = ''
@@ -562,14 +964,18 @@ class Name:
         cite = self.getCitation()
         if cite != None:
             # Do not erase existing citation data.
+            newcitestr = cite.citestr
+            newauthordisp = cite.authordisp
             if (cite.citestr == None or cite.citestr == '') and citestr != '':
-                cite.citestr = citestr
+                newcitestr = citestr
             if (cite.authordisp == None or cite.authordisp == '') and authordisp != '':
-                cite.authordisp = authordisp
+                newauthordisp = authordisp
+            if newcitestr != cite.citestr or newauthordisp != cite.authordisp:
+                self.setCitation(Citation.intern(
+                    Citation(newcitestr, newauthordisp, cite.doi, cite.url)))
         elif citestr != '' or authordisp != '':
             # Only create a new citation if we have at least some citation data.
-            newcite = Citation(citestr, authordisp)
-            self.setCitation(newcite)
+            self.setCitation(Citation.intern(Citation(citestr, authordisp)))
 
     def loadFromDB(self, pgcur, name_id):
         """
@@ -586,8 +992,9 @@ class Name:
         self.namestr = res[1]
         citeid = res[2]
         if citeid != None:
-            self.citation = Citation()
-            self.citation.loadFromDB(pgcur, citeid)
+            cite = Citation()
+            cite.loadFromDB(pgcur, citeid)
+            self.citation = Citation.intern(cite)
 
     def loadFromDBbyName(self, pgcur, taxonomy_id, rank_id, namestr=''):
         """
@@ -623,8 +1030,9 @@ class Name:
             self.idnum = res[0]
             citeid = res[1]
             if citeid != None:
-                self.citation = Citation()
-                self.citation.loadFromDB(pgcur, citeid)
+                cite = Citation()
+                cite.loadFromDB(pgcur, citeid)
+                self.citation = Citation.intern(cite)
 
     def persist(self, pgcur, do_commit=True):
         """
@@ -655,9 +1063,10 @@ class Name:
         if res == None:
             # Add the name to the database.
             query = """INSERT INTO names
-                (namestr, citation_id)
-                VALUES (?, ?)"""
-            pgcur.execute(query, (self.namestr, cite_id))
+                (namestr, citation_id, namestr_soundex, namestr_dmetaphone,
+                namestr_dmetaphone_alt)
+                VALUES (?, ?, ?, ?, ?)"""
+            pgcur.execute(query, (self.namestr, cite_id) + getPhoneticKeys(self.namestr))
 
             name_id = pgcur.lastrowid
         else:
@@ -671,7 +1080,30 @@ class Name:
         return name_id
 
 
-class Citation:
+class Citation(object):
+    __slots__ = ('citestr', 'authordisp', 'doi', 'url', '__weakref__')
+
+    # The shared Citation objects returned by intern(), keyed by the values of all
+    # citation fields.
+    _interned = weakref.WeakValueDictionary()
+
+    @staticmethod
+    def intern(citation):
+        """
+        A static method that returns a shared Citation object with the same field values
+        as citation.  If no such shared object exists yet, citation itself becomes the
+        shared object.  Many names typically have the same citation, so interning
+        Citation objects can greatly reduce the memory used by large taxa trees.  Shared
+        Citation objects must not be modified.
+        """
+        key = (citation.citestr, citation.authordisp, citation.doi, citation.url)
+        shared = Citation._interned.get(key)
+        if shared == None:
+            Citation._interned[key] = citation
+            shared = citation
+
+        return shared
+
     def __init__(self, citestr='', authordisp='', doi=None, url=None):
         self.citestr = citestr
         self.authordisp = authordisp
@@ -0,0 +1,401 @@
+"""
+Provides a class for writing complete trees of Taxon objects to the taxonomy
+database using batched, set-based database operations.
+"""
+
+from taxacomponents import Taxon
+from namematch import getPhoneticKeys
+
+
+class BatchTaxaPersister:
+    """
+    Persists a tree of Taxon objects, including all names and citations, to the taxonomy
+    database.  The results are exactly the same as those of Taxon.persist(): existing
+    taxon concepts, names, citations, and name/taxon concept links are detected using
+    the same matching rules, and new rows receive the same IDs they would get if they
+    were written one at a time.  However, instead of several SELECT/INSERT round trips
+    and a commit for every taxon, all existing rows are looked up with a handful of
+    set-based queries, new rows are written with executemany(), and changes are
+    committed either once at the end or after every chunk of taxa.
+
+    Because IDs for new rows are assigned in advance, this class assumes that no other
+    connection writes to the database while a tree is being persisted.
+    """
+    # The maximum number of values to use for a single "IN (...)" query.
+    MAX_QUERY_VALS = 500
+
+    def __init__(self, pgcur, chunksize=0):
+        """
+        If chunksize > 0, changes are committed after every chunksize taxa.  Otherwise,
+        all changes are written in a single transaction.
+        """
+        self.pgcur = pgcur
+        self.chunksize = chunksize
+
+    def persist(self, taxon, parent_id, printprogress=False, rootdepth=0):
+        """
+        Writes the tree rooted at taxon to the database.  The arguments have the same
+        meaning as for Taxon.persist().  Returns the tc_id of the root taxon concept.
+        """
+        taxa = []
+        parentindexes = []
+        parent_ids = {}
+        self._addTree(taxon, -1, parent_id, False, taxa, parentindexes, parent_ids)
+
+        return self._persistTaxa(taxa, parentindexes, parent_ids, printprogress, rootdepth)[0]
+
+    def persistSubtrees(self, subtrees, printprogress=False, rootdepth=0):
+        """
+        Writes a list of subtrees of a larger Taxon tree to the database, for trees that
+        are written one part at a time.  Taxa that have already been written (that is,
+        that have a tc_id because they were written by an earlier call or loaded from the
+        database) are not written again, but their descendents are.  Any ancestors of the
+        subtrees that have not been written yet are written first, without their other
+        children.  The root of the larger tree must already have been written.
+        """
+        taxa = []
+        parentindexes = []
+        parent_ids = {}
+
+        # The indexes of the ancestors that are written along with the subtrees.
+        ancestorindexes = {}
+
+        for subtree in subtrees:
+            ancestors = []
+            parent = subtree.parent
+            while parent.tc_id == 0 and parent not in ancestorindexes:
+                ancestors.append(parent)
+                parent = parent.parent
+
+            parentindex = ancestorindexes.get(parent, -1)
+            parent_id = parent.tc_id
+            for ancestor in reversed(ancestors):
+                taxa.append(ancestor)
+                parentindexes.append(parentindex)
+                if parentindex < 0:
+                    parent_ids[len(taxa) - 1] = parent_id
+                parentindex = len(taxa) - 1
+                ancestorindexes[ancestor] = parentindex
+
+            self._addTree(subtree, parentindex, parent_id, True, taxa, parentindexes, parent_ids)
+
+        if len(taxa) > 0:
+            self._persistTaxa(taxa, parentindexes, parent_ids, printprogress, rootdepth)
+
+    def _addTree(self, taxon, parentindex, parent_id, skipwritten, taxa, parentindexes, parent_ids):
+        """
+        Adds all taxa in the tree rooted at taxon to the list of taxa to write, in the
+        same order in which Taxon.persist() would process them, along with the index of
+        each taxon's parent in the list.  For taxa whose parent is not in the list, the
+        parent index is -1 and parent_ids maps the taxon's index to the parent's tc_id.
+        If skipwritten is True, taxa that have already been written are left out.
+        """
+        stack = [(taxon, parentindex, parent_id)]
+        while len(stack) > 0:
+            curtaxon, parentindex, parent_id = stack.pop()
+            if skipwritten and curtaxon.tc_id != 0:
+                curindex = -1
+                cur_id = curtaxon.tc_id
+            else:
+                taxa.append(curtaxon)
+                parentindexes.append(parentindex)
+                if parentindex < 0:
+                    parent_ids[len(taxa) - 1] = parent_id
+                curindex = len(taxa) - 1
+                cur_id = None
+            for child in reversed(curtaxon.children):
+                stack.append((child, curindex, cur_id))
+
+    def _persistTaxa(self, taxa, parentindexes, parent_ids, printprogress, rootdepth):
+        """
+        Writes a list of taxa, in which each parent precedes its children, to the
+        database.  The parents are given as for _addTree().  Returns a list of the
+        tc_ids of the taxa.
+        """
+        self._prefetch(taxa)
+
+        if self.chunksize > 0:
+            chunksize = self.chunksize
+        else:
+            chunksize = len(taxa)
+
+        tc_ids = []
+        for start in range(0, len(taxa), chunksize):
+            self._initNextIDs()
+
+            for index in range(start, min(start + chunksize, len(taxa))):
+                if parentindexes[index] < 0:
+                    curparent_id = parent_ids[index]
+                else:
+                    curparent_id = tc_ids[parentindexes[index]]
+                tc_ids.append(self._processTaxon(taxa[index], curparent_id, printprogress, rootdepth))
+
+            self._flush()
+            self.pgcur.connection.commit()
+
+        return tc_ids
+
+    def _getTaxonomyID(self, taxon):
+        """
+        Returns the taxonomy ID that is used when persisting a taxon.  Taxonomy IDs
+        read from configuration files are strings, which the database silently converts
+        to integers, so the ID is converted here to make in-memory lookups behave the
+        same way.
+        """
+        if taxon.isroot:
+            return int(taxon.roottaxo_id)
+        else:
+            return int(taxon.taxonomy_id)
+
+    def _selectIn(self, query, values):
+        """
+        Runs a query that contains a single "IN ({0})" placeholder for a list of values,
+        splitting the list of values so that no query gets too many parameters.  All
+        result rows are returned as a single list.
+        """
+        values = list(values)
+        results = []
+        for start in range(0, len(values), self.MAX_QUERY_VALS):
+            chunk = values[start:start + self.MAX_QUERY_VALS]
+            self.pgcur.execute(query.format(', '.join(['?'] * len(chunk))), chunk)
+            results.extend(self.pgcur.fetchall())
+
+        return results
+
+    def _prefetch(self, taxa):
+        """
+        Retrieves all existing database rows that could match any of the taxon
+        concepts, names, or citations in the list of taxa.
+        """
+        tckeys = set()
+        namestrs = set()
+        dois = set()
+        urls = set()
+        citestrs = set()
+        authordisps = set()
+        for taxon in taxa:
+            tckeys.add((self._getTaxonomyID(taxon), taxon.rank_id, taxon.name.namestr))
+            for name in taxon.namelist.names:
+                namestrs.add(name.namestr)
+                cite = name.citation
+                if cite != None:
+                    if cite.doi != None and cite.doi != '':
+                        dois.add(cite.doi)
+                    elif cite.url != None and cite.url != '':
+                        urls.add(cite.url)
+                    elif cite.citestr != None and cite.citestr != '':
+                        citestrs.add(cite.citestr)
+                    elif cite.authordisp != None:
+                        authordisps.add(cite.authordisp)
+
+        # Existing taxon concepts, keyed by (taxonomy ID, rank ID, preferred name string).
+        # For all lookups, if there are multiple matches, the row with the lowest ID is
+        # used.
+        self.tcmap = {}
+        query = """SELECT tc.taxonomy_id, tc.rank_id, n.namestr, tc.tc_id
+            FROM taxon_concepts tc, names_to_taxonconcepts nttc, names n
+            WHERE tc.tc_id=nttc.tc_id AND nttc.name_id=n.name_id AND nttc.validity='valid'
+                AND n.namestr IN ({0})
+            ORDER BY tc.tc_id"""
+        tcnames = set([tckey[2] for tckey in tckeys])
+        for res in self._selectIn(query, tcnames):
+            if res[:3] in tckeys:
+                self.tcmap.setdefault(res[:3], res[3])
+
+        # Existing links between names and the matching taxon concepts.
+        self.nttcset = set()
+        query = """SELECT nttc.tc_id, nttc.name_id
+            FROM names_to_taxonconcepts nttc
+            WHERE nttc.tc_id IN ({0})"""
+        for res in self._selectIn(query, set(self.tcmap.values())):
+            self.nttcset.add(res)
+
+        # Existing names, keyed by (name string, citation ID).
+        self.namemap = {}
+        query = """SELECT n.namestr, n.citation_id, n.name_id
+            FROM names n
+            WHERE n.namestr IN ({0})
+            ORDER BY n.name_id"""
+        for res in self._selectIn(query, namestrs):
+            self.namemap.setdefault(res[:2], res[2])
+
+        # Existing citations, keyed by each of the fields that can be used for matching.
+        self.doimap = self._prefetchCitations('doi', dois)
+        self.urlmap = self._prefetchCitations('url', urls)
+        self.citestrmap = self._prefetchCitations('citationstr', citestrs)
+        self.authordispmap = {}
+        query = """SELECT c.authordisplay, c.citation_id
+            FROM citations c
+            WHERE (c.citationstr IS NULL OR c.citationstr='') AND
+                (c.url IS NULL OR c.url='') AND
+                (c.doi IS NULL OR c.doi='') AND c.authordisplay IN ({0})
+            ORDER BY c.citation_id"""
+        for res in self._selectIn(query, authordisps):
+            self.authordispmap.setdefault(res[0], res[1])
+
+    def _prefetchCitations(self, colname, values):
+        """
+        Returns a dictionary that maps values of a citations table column to the IDs of
+        the citations that contain them.
+        """
+        citemap = {}
+        query = """SELECT c.{0}, c.citation_id
+            FROM citations c
+            WHERE c.{0} IN ({{0}})
+            ORDER BY c.citation_id""".format(colname)
+        for res in self._selectIn(query, values):
+            citemap.setdefault(res[0], res[1])
+
+        return citemap
+
+    def _initNextIDs(self):
+        """
+        Gets the IDs that the database would assign to the next new rows of each table
+        and initializes the lists of pending INSERTs.
+        """
+        self.next_ids = {}
+        for tablename, colname in (
+                ('taxon_concepts', 'tc_id'), ('names', 'name_id'), ('citations', 'citation_id')):
+            self.pgcur.execute('SELECT max({0}) FROM {1}'.format(colname, tablename))
+            res = self.pgcur.fetchone()
+            if res[0] == None:
+                self.next_ids[tablename] = 1
+            else:
+                self.next_ids[tablename] = res[0] + 1
+
+        self.new_tcs = []
+        self.new_names = []
+        self.new_citations = []
+        self.new_nttcs = []
+
+    def _getNextID(self, tablename):
+        next_id = self.next_ids[tablename]
+        self.next_ids[tablename] += 1
+
+        return next_id
+
+    def _flush(self):
+        """
+        Writes all pending INSERTs to the database.
+        """
+        if len(self.new_citations) > 0:
+            query = """INSERT INTO citations
+                (citation_id, citationstr, url, doi, authordisplay)
+                VALUES (?, ?, ?, ?, ?)"""
+            self.pgcur.executemany(query, self.new_citations)
+        if len(self.new_names) > 0:
+            query = """INSERT INTO names
+                (name_id, namestr, citation_id, namestr_soundex, namestr_dmetaphone,
+                namestr_dmetaphone_alt)
+                VALUES (?, ?, ?, ?, ?, ?)"""
+            self.pgcur.executemany(query, self.new_names)
+        if len(self.new_tcs) > 0:
+            query = """INSERT INTO taxon_concepts
+                (tc_id, parent_id, taxonomy_id, rank_id, depth)
+                VALUES (?, ?, ?, ?, ?)"""
+            self.pgcur.executemany(query, self.new_tcs)
+
+            # Add the new taxon concepts to the closure table.  Parents always precede
+            # their children, so the ancestors of each parent are already in the table.
+            self.pgcur.executemany(Taxon.ANCESTRY_INSERT_QUERY,
+                    [(row[0], row[0], row[0], row[1]) for row in self.new_tcs])
+        if len(self.new_nttcs) > 0:
+            query = """INSERT INTO names_to_taxonconcepts
+                (tc_id, name_id, validity, authordisp_prefix, authordisp_postfix)
+                VALUES (?, ?, ?, ?, ?)"""
+            self.pgcur.executemany(query, self.new_nttcs)
+
+    def _processTaxon(self, taxon, parent_id, printprogress, rootdepth):
+        """
+        Finds or creates the taxon concept for a single taxon and links its names to the
+        taxon concept.  Returns the tc_id.
+        """
+        taxo_id = self._getTaxonomyID(taxon)
+
+        if printprogress and (taxon.depth - rootdepth) == 1:
+            print 'Processing ' + taxon._getRankNameString() + ' and its descendents...'
+
+        tckey = (taxo_id, taxon.rank_id, taxon.name.namestr)
+        if tckey not in self.tcmap:
+            tc_id = self._getNextID('taxon_concepts')
+            self.new_tcs.append((tc_id, parent_id, taxo_id, taxon.rank_id, taxon.depth))
+        else:
+            tc_id = self.tcmap[tckey]
+            print ('The taxon concept "' + taxon._getRankNameString() + '" for taxonomy ID '
+                + str(taxo_id) + ' already exists in the database.')
+        taxon.tc_id = tc_id
+
+        # Make sure the names are linked to the taxon concept.
+        namelist = taxon.namelist
+        for index in range(len(namelist.names)):
+            name = namelist.names[index]
+            name_id = self._processName(name)
+
+            if (tc_id, name_id) not in self.nttcset:
+                self.nttcset.add((tc_id, name_id))
+                if index == namelist.preferred:
+                    validity = 'valid'
+                    # The taxon concept can now be found by this name.
+                    self.tcmap.setdefault((taxo_id, taxon.rank_id, name.namestr), tc_id)
+                else:
+                    validity = 'synonym'
+                if namelist.useparenslist[index]:
+                    self.new_nttcs.append((tc_id, name_id, validity, '(', ')'))
+                else:
+                    self.new_nttcs.append((tc_id, name_id, validity, '', ''))
+
+        return tc_id
+
+    def _processName(self, name):
+        """
+        Finds or creates the database entry for a Name object, following the same rules
+        as Name.persist().  Returns the name_id.
+        """
+        if name.citation != None:
+            cite_id = self._processCitation(name.citation)
+        else:
+            cite_id = None
+
+        if name.idnum != None:
+            return name.idnum
+
+        namekey = (name.namestr, cite_id)
+        if namekey not in self.namemap:
+            name_id = self._getNextID('names')
+            self.new_names.append((name_id, name.namestr, cite_id) + getPhoneticKeys(name.namestr))
+            self.namemap[namekey] = name_id
+
+        return self.namemap[namekey]
+
+    def _processCitation(self, cite):
+        """
+        Finds or creates the database entry for a Citation object, following the same
+        rules as Citation.persist().  Returns the citation_id.
+        """
+        citation_id = None
+        if cite.doi != None and cite.doi != '':
+            citation_id = self.doimap.get(cite.doi)
+        elif cite.url != None and cite.url != '':
+            citation_id = self.urlmap.get(cite.url)
+        elif cite.citestr != None and cite.citestr != '':
+            citation_id = self.citestrmap.get(cite.citestr)
+        else:
+            citation_id = self.authordispmap.get(cite.authordisp)
+
+        if citation_id == None:
+            citation_id = self._getNextID('citations')
+            self.new_citations.append(
+                    (citation_id, cite.citestr, cite.url, cite.doi, cite.authordisp))
+
+            # Make sure the new citation can be found by later lookups.
+            if cite.doi != None:
+                self.doimap.setdefault(cite.doi, citation_id)
+            if cite.url != None:
+                self.urlmap.setdefault(cite.url, citation_id)
+            if cite.citestr != None:
+                self.citestrmap.setdefault(cite.citestr, citation_id)
+            if ((cite.citestr == None or cite.citestr == '') and (cite.url == None or cite.url == '')
+                    and (cite.doi == None or cite.doi == '') and cite.authordisp != None):
+                self.authordispmap.setdefault(cite.authordisp, citation_id)
+
+        return citation_id
@@ -1,8 +1,10 @@
 
 #import psycopg2 as ppg2
 import sqlite3
+import hashlib
 from ConfigParser import RawConfigParser
 from taxoconfig import ConfigError
+from namematch import registerFunctions, getPhoneticKeys
 
 
 def _getPostgresDBCursor(conffile):
@@ -26,10 +28,187 @@ def _getPostgresDBCursor(conffile):
 
     return pgcur
 
+# The full-text index of name strings and the triggers that keep it in sync with the
+# names table.  The index uses FTS5's trigram tokenizer, so it can find name strings by
+# substring as well as by prefix, and it is used by SQLite for LIKE patterns that
+# contain at least 3 consecutive characters besides wildcards.  The index does not
+# store the name strings (it is an "external content" table), so it adds little to the
+# size of the database.
+NAME_SEARCH_INDEX = """CREATE VIRTUAL TABLE IF NOT EXISTS names_fts
+        USING fts5(namestr, content='names', content_rowid='name_id', tokenize='trigram');
+    CREATE TRIGGER IF NOT EXISTS names_fts_insert AFTER INSERT ON names BEGIN
+        INSERT INTO names_fts (rowid, namestr) VALUES (new.name_id, new.namestr);
+    END;
+    CREATE TRIGGER IF NOT EXISTS names_fts_delete AFTER DELETE ON names BEGIN
+        INSERT INTO names_fts (names_fts, rowid, namestr) VALUES ('delete', old.name_id, old.namestr);
+    END;
+    CREATE TRIGGER IF NOT EXISTS names_fts_update AFTER UPDATE OF name_id, namestr ON names BEGIN
+        INSERT INTO names_fts (names_fts, rowid, namestr) VALUES ('delete', old.name_id, old.namestr);
+        INSERT INTO names_fts (rowid, namestr) VALUES (new.name_id, new.namestr);
+    END;"""
+
+def _addNameSearchIndex(dbcur):
+    """
+    Creates the names_fts full-text index and its triggers and indexes all existing
+    name strings.  The trigram tokenizer requires SQLite 3.34 or later, compiled with
+    FTS5.  If it is not available, the index is not created, and name searches use the
+    names table directly (see hasNameSearchIndex()).  In that case, upgradeSchema()
+    tries again to create the index every time the database is opened.
+    """
+    try:
+        dbcur.execute("CREATE VIRTUAL TABLE temp.fts_test USING fts5(x, tokenize='trigram')")
+        dbcur.execute('DROP TABLE temp.fts_test')
+    except sqlite3.OperationalError:
+        return
+
+    dbcur.executescript(NAME_SEARCH_INDEX)
+    dbcur.execute("INSERT INTO names_fts (names_fts) VALUES ('rebuild')")
+
+# The indexes of the phonetic key columns of the names table.  The keys are not
+# calculated by the database: the taxonomy library calculates them (see
+# namematch.getPhoneticKeys()) whenever it adds a name to the names table.
+NAME_PHONETIC_KEYS = """CREATE INDEX IF NOT EXISTS names_soundex_idx ON names (namestr_soundex);
+    CREATE INDEX IF NOT EXISTS names_dmetaphone_idx ON names (namestr_dmetaphone);
+    CREATE INDEX IF NOT EXISTS names_dmetaphone_alt_idx ON names (namestr_dmetaphone_alt);"""
+
+def _addPhoneticKeys(dbcur):
+    """
+    Adds the Soundex and Double Metaphone key columns to the names table, calculates
+    the keys of all existing name strings, and creates the key indexes.
+    """
+    dbcur.execute('PRAGMA table_info(names)')
+    colnames = [row[1] for row in dbcur.fetchall()]
+    for colname in ('namestr_soundex', 'namestr_dmetaphone', 'namestr_dmetaphone_alt'):
+        if colname not in colnames:
+            dbcur.execute('ALTER TABLE names ADD COLUMN {0} text'.format(colname))
+
+    dbcur.execute('SELECT name_id, namestr FROM names')
+    keyvals = [getPhoneticKeys(namestr) + (name_id,) for name_id, namestr in dbcur.fetchall()]
+    dbcur.executemany("""UPDATE names SET namestr_soundex=?, namestr_dmetaphone=?,
+        namestr_dmetaphone_alt=? WHERE name_id=?""", keyvals)
+    dbcur.executescript(NAME_PHONETIC_KEYS)
+
+# Updates to the SQLite database schema.  Each entry upgrades the schema from the
+# previous version, so the current schema version is the length of this list.  The
+# schema version of a database file is stored in SQLite's "user_version" pragma (a
+# database created from an unversioned schema file has version 0).  New entries must
+# only be appended to the end of the list, and the schema creation script
+# (schema/create_tables-sqlite.sql) should be kept in sync.  An entry is either a SQL
+# script or a function that takes a database cursor and applies the update.
+SCHEMA_UPDATES = [
+    # Version 1: Add indexes for parent/child lookups, taxon concept identity lookups,
+    # and citation matching.  Also gather table statistics so that the query planner
+    # does not use the (very unselective) name validity index for taxon concept lookups.
+    """CREATE INDEX IF NOT EXISTS taxon_concepts_parentid_taxoid_idx
+        ON taxon_concepts (parent_id, taxonomy_id);
+    CREATE INDEX IF NOT EXISTS taxon_concepts_taxoid_rankid_idx
+        ON taxon_concepts (taxonomy_id, rank_id);
+    CREATE INDEX IF NOT EXISTS citations_doi_idx ON citations (doi);
+    CREATE INDEX IF NOT EXISTS citations_url_idx ON citations (url);
+    CREATE INDEX IF NOT EXISTS citations_citationstr_idx ON citations (citationstr);
+    ANALYZE;""",
+
+    # Version 2: Add the tc_ancestry closure table, which contains one row for every
+    # (ancestor, descendant) pair of taxon concepts (including each taxon concept paired
+    # with itself at distance 0), and populate it from the existing parent links.
+    """CREATE TABLE IF NOT EXISTS tc_ancestry (
+        ancestor_id   integer REFERENCES taxon_concepts (tc_id) ON DELETE CASCADE,
+        descendant_id integer REFERENCES taxon_concepts (tc_id) ON DELETE CASCADE,
+        distance      integer
+    );
+    DELETE FROM tc_ancestry;
+    INSERT INTO tc_ancestry (ancestor_id, descendant_id, distance)
+        WITH RECURSIVE ancestry(ancestor_id, descendant_id, distance) AS (
+            SELECT tc_id, tc_id, 0 FROM taxon_concepts
+            UNION ALL
+            SELECT parent.tc_id, ancestry.descendant_id, ancestry.distance + 1
+            FROM ancestry, taxon_concepts tc, taxon_concepts parent
+            WHERE tc.tc_id=ancestry.ancestor_id AND parent.tc_id=tc.parent_id
+        )
+        SELECT ancestor_id, descendant_id, distance FROM ancestry;
+    CREATE INDEX IF NOT EXISTS tc_ancestry_ancestor_idx ON tc_ancestry (ancestor_id, distance);
+    CREATE INDEX IF NOT EXISTS tc_ancestry_descendant_idx ON tc_ancestry (descendant_id, distance);
+    ANALYZE;""",
+
+    # Version 3: Add the names_fts full-text index of all name strings (see
+    # _addNameSearchIndex()).
+    _addNameSearchIndex,
+
+    # Version 4: Add the Soundex and Double Metaphone key columns to the names table
+    # (see _addPhoneticKeys()).
+    _addPhoneticKeys
+]
+
+def hasNameSearchIndex(dbcur):
+    """
+    Returns True if the database has the names_fts full-text index of name strings.
+    """
+    dbcur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='names_fts'")
+
+    return dbcur.fetchone() != None
+
+def getColumnFingerprint(dbcur, tablename, colname):
+    """
+    Returns a fingerprint of the contents of a column of a database table, as a string.
+    The fingerprint is an MD5 digest of the number of rows, the largest row ID, and
+    the column's values in row ID order, so it changes whenever rows are added or
+    deleted or a value in the column is changed.  This is used to tell whether indexes
+    that are built from the column, and saved for re-use, are out of date.
+    """
+    dbcur.execute('SELECT count(*), max(rowid) FROM {0}'.format(tablename))
+    digest = hashlib.md5(repr(tuple(dbcur.fetchone())))
+
+    dbcur.execute('SELECT {0} FROM {1} ORDER BY rowid'.format(colname, tablename))
+    for row in dbcur:
+        digest.update(repr(row[0]))
+
+    return digest.hexdigest()
+
+def getSchemaVersion(dbcur):
+    """
+    Returns the schema version of the database.
+    """
+    dbcur.execute('PRAGMA user_version')
+
+    return dbcur.fetchone()[0]
+
+def upgradeSchema(dbcur):
+    """
+    Applies, in order, all schema updates that have not yet been applied to the
+    database.  Databases that do not contain the taxonomy tables are not modified.
+    Returns the number of updates that were applied.
+    """
+    dbcur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='taxon_concepts'")
+    if dbcur.fetchone() == None:
+        return 0
+
+    version = getSchemaVersion(dbcur)
+    for newversion in range(version + 1, len(SCHEMA_UPDATES) + 1):
+        update = SCHEMA_UPDATES[newversion - 1]
+        if callable(update):
+            update(dbcur)
+        else:
+            dbcur.executescript(update)
+        dbcur.execute('PRAGMA user_version = {0}'.format(newversion))
+        dbcur.connection.commit()
+
+    # The names_fts index (version 3) is only created if SQLite supports the trigram
+    # tokenizer, so a database that was created or upgraded with an older version of
+    # SQLite might not have it.  Create the index as soon as it is supported.
+    if not(hasNameSearchIndex(dbcur)):
+        _addNameSearchIndex(dbcur)
+        dbcur.connection.commit()
+
+    return max(len(SCHEMA_UPDATES) - version, 0)
+
 def _getSQLiteDBCursor(dbfile):
     conn = sqlite3.connect(dbfile)
+    registerFunctions(conn)
     slcur = conn.cursor()
 
+    # Make sure the database schema is up to date.
+    upgradeSchema(slcur)
+
     return slcur
 
 def getDBCursor(filein):
@@ -5,6 +5,7 @@ the taxacomponents module.
 
 
 from taxacomponents import Citation, RankTable, Taxon
+from taxapersist import BatchTaxaPersister
 from taxonvisitor import TaxonVisitor
 from taxonvisitors_concrete import PrintTaxonVisitor, CSVTaxonVisitor
 from nameresolve import CoLNamesResolver
@@ -32,11 +33,13 @@ class TaxonomyBase:
         self.citation = citation
         self.roottaxon = roottaxon
 
-    def loadFromDB(self, pgcur, taxanum=-1, maxdepth=-1):
+    def loadFromDB(self, pgcur, taxanum=-1, maxdepth=-1, bulk=False):
         """
         Attempts to load the taxonomy from a taxonomy database, including the full tree
         of taxa.  If taxanum > 0, then only taxanum taxa will be loaded.  If maxdepth > -1,
-        the taxa tree will only be traversed to a depth of maxdepth.
+        the taxa tree will only be traversed to a depth of maxdepth.  If bulk == True,
+        the taxa tree is loaded with a few set-based queries rather than several queries
+        per taxon (see Taxon.loadFromDB()).
         """
         query = """SELECT name, citation_id, ismaster, root_tc_id
             FROM taxonomies
@@ -65,12 +68,11 @@ class TaxonomyBase:
         root_taxonomy_id = res[1]
 
         # Initialize the rank lookup table.
-        rankt = RankTable()
-        rankt.loadFromDB(pgcur)
+        rankt = RankTable.getCached(pgcur)
 
         # Load the taxa tree.
         self.roottaxon = Taxon(self.taxonomy_id, rankid, rankt, roottaxo_id = root_taxonomy_id, isroot=True)
-        self.roottaxon.loadFromDB(pgcur, roottc_id, taxanum, maxdepth)
+        self.roottaxon.loadFromDB(pgcur, roottc_id, taxanum, maxdepth, bulk)
 
     def persist(self):
         """
@@ -174,11 +176,15 @@ class Taxonomy(TaxonomyBase):
         """
         return self.bb_taxonomy
 
-    def persist(self, pgcur, printprogress=False):
+    def persist(self, pgcur, printprogress=False, batched=False, chunksize=0):
         """
         Writes the taxonomy information to the database, if it does not already
         exist.  This includes calling the persist() methods on the Citation and
-        Taxon tree associated with this Taxonomy object.
+        Taxon tree associated with this Taxonomy object.  If batched == True, the
+        Taxon tree is written with a BatchTaxaPersister, which uses set-based lookups
+        and batched INSERTs and writes everything in a single transaction (or, if
+        chunksize > 0, in one transaction for every chunksize taxa).  Returns True if
+        the taxonomy was written to the database or False if it already existed.
         """
         # First, check if this taxonomy already exists in the database.
         query = """SELECT taxonomy_id
@@ -189,7 +195,7 @@ class Taxonomy(TaxonomyBase):
 
         if res == None:
             # Write the citation information to the database, if needed.
-            citation_id = self.citation.persist(pgcur)
+            citation_id = self.citation.persist(pgcur, not(batched))
         
             # Create the initial database entry for the taxonomy metadata so that the
             # foreign key constraint for the child taxon concepts can be satisfied.
@@ -198,14 +204,7 @@ class Taxonomy(TaxonomyBase):
                 VALUES (?, ?, ?, ?, ?)"""
             pgcur.execute(query, (self.taxonomy_id, self.name, citation_id, self.ismaster, None))
 
-            # Make sure all taxon concepts, including those from the backbone taxonomy,
-            # are persisted to the database.  Use the "nil" UUID as the parent_id for
-            # the root of the taxonomy if there is not an existing root entry.
-            if self.bb_taxonomy != None:
-                self.bb_taxonomy.roottaxon.persist(pgcur, self.NIL_UUID, printprogress,
-                        self.roottaxon.depth)
-            else:
-                self.roottaxon.persist(pgcur, self.NIL_UUID, printprogress, self.roottaxon.depth)
+            self.persistTaxa(pgcur, printprogress, batched, chunksize)
 
             # Get the ID of the root taxon.
             root_tcid = self.roottaxon.existsInDB(pgcur)
@@ -216,9 +215,49 @@ class Taxonomy(TaxonomyBase):
                 WHERE taxonomy_id=?"""
             pgcur.execute(query, (root_tcid, self.taxonomy_id))
             pgcur.connection.commit()
-        elif printprogress:
-            print ('The metadata for taxonomy "' + self.name + '" (ID ' + str(self.taxonomy_id) +
-                    ') already exist in the database; no changes were made.')
+
+            return True
+        else:
+            if printprogress:
+                print ('The metadata for taxonomy "' + self.name + '" (ID ' + str(self.taxonomy_id) +
+                        ') already exist in the database; no changes were made.')
+
+            return False
+
+    def persistTaxa(self, pgcur, printprogress=False, batched=False, chunksize=0):
+        """
+        Writes the Taxon tree associated with this Taxonomy object, including any taxa
+        that link it to the backbone taxonomy, to the database.  Unlike persist(), this
+        does not check or write the taxonomy metadata.  Existing taxon concepts, names,
+        and citations are re-used, so this method can be called repeatedly as taxa are
+        added to the tree.  The arguments have the same meaning as for persist().
+        """
+        # Make sure all taxon concepts, including those from the backbone taxonomy,
+        # are persisted to the database.  Use the "nil" UUID as the parent_id for
+        # the root of the taxonomy if there is not an existing root entry.
+        if self.bb_taxonomy != None:
+            treeroot = self.bb_taxonomy.roottaxon
+        else:
+            treeroot = self.roottaxon
+
+        if batched:
+            persister = BatchTaxaPersister(pgcur, chunksize)
+            persister.persist(treeroot, self.NIL_UUID, printprogress, self.roottaxon.depth)
+        else:
+            treeroot.persist(pgcur, self.NIL_UUID, printprogress, self.roottaxon.depth)
+
+    def persistSubtrees(self, pgcur, subtrees, printprogress=False, chunksize=0):
+        """
+        Writes a list of subtrees of the Taxon tree associated with this Taxonomy object
+        to the database, for taxonomies that are written one part at a time (see
+        CSVTaxonomyParser.readCSVSubtrees()).  The taxonomy must already have been
+        written with persist().  Any ancestors of the subtrees that have not been written
+        yet are written along with them, and taxa that have already been written are
+        not written again (see BatchTaxaPersister.persistSubtrees()), so each taxon is
+        only written once.  The other arguments have the same meaning as for persist().
+        """
+        persister = BatchTaxaPersister(pgcur, chunksize)
+        persister.persistSubtrees(subtrees, printprogress, self.roottaxon.depth)
 
     def printAll(self, numtaxa=-1, maxdepth=-1):
         """
@@ -272,12 +311,12 @@ class BackboneTaxonomy(TaxonomyBase):
         TaxonomyBase.__init__(self, 1)
         self.loadFromDB(pgcur)
 
-    def loadFromDB(self, pgcur, taxanum=-1, maxdepth=0):
+    def loadFromDB(self, pgcur, taxanum=-1, maxdepth=0, bulk=False):
         """
         Exactly the same as loadFromDB() from the superclass, except loads only the root
         taxonomy node (i.e., Eukaryota) by default.
         """
-        TaxonomyBase.loadFromDB(self, pgcur, taxanum, maxdepth)
+        TaxonomyBase.loadFromDB(self, pgcur, taxanum, maxdepth, bulk)
 
     def linkTaxonomy(self, taxonomy):
         """
@@ -349,23 +388,25 @@ class BackboneTaxonomy(TaxonomyBase):
         Starting from the root node of the provided taxonomy, follows parent
         links upward, building a chain of taxon objects until the top-most
         parent is reached.  Returns the top-most node that could be reached by
-        following the links upward.
+        following the links upward.  All ancestors of the root node are
+        retrieved at once from the tc_ancestry closure table.
         """
-        # See if the root taxon_concept already has a parent.
         curnode = taxonomy.roottaxon
-        parent_id = taxonomy.roottaxon.getParentIDFromDB(self.pgcur)
 
-        # Follow parent links upwards until we reach the root or any other node
-        # that has no parent or does not yet exist in the database.
-        while parent_id != None and parent_id != self.NIL_UUID:
+        # See if the root taxon_concept already exists in the database.
+        tc_id = taxonomy.roottaxon.existsInDB(self.pgcur)
+        if tc_id == None:
+            return curnode
+
+        # Build the chain of ancestors, from the parent upward.
+        for ancestor_id in Taxon.getAncestorIDs(self.pgcur, tc_id):
             # Create the parent node and load it from the database.
             parent = Taxon(curnode.taxonomy_id, curnode.rank_id, curnode.rankt)
-            parent.loadFromDB(self.pgcur, parent_id, maxdepth=0)
+            parent.loadFromDB(self.pgcur, ancestor_id, maxdepth=0)
 
             parent.addChild(curnode)
 
             curnode = parent
-            parent_id = curnode.getParentIDFromDB(self.pgcur)
 
         return curnode
     
@@ -1,6 +1,6 @@
 """
 Provides a base class that implements operations on a taxonomic tree that
-require recursively visiting each taxon within the tree.
+require visiting each taxon within the tree.
 """
 
 
@@ -22,29 +22,109 @@ class TaxonVisitor:
         self.numtaxa = numtaxa
         self.maxdepth = maxdepth
 
+    # The traversal events generated by iterTree().
+    ENTER = 'enter'
+    EXIT = 'exit'
+
     def visit(self, taxon):
         """
-        Initiates the taxon tree traversal.
+        Initiates the taxon tree traversal.  The traversal uses an explicit stack rather
+        than recursion, so it is not limited by the maximum Python recursion depth.
         """
+        processTaxon = self.processTaxon
+        postTaxonProcessing = self.postTaxonProcessing
+        enterTaxon = self._enterTaxon
+        numtaxa = self.numtaxa
+
         self.taxacnt = 0
 
-        self._traverseTree(taxon, 0)
+        processTaxon(taxon, 0)
+        stack = [self._getRootFrame(taxon)]
+        while stack:
+            top = stack[-1]
+            taxon, depth, children, index = top
+            depth += 1
+
+            # Visit the remaining children of the taxon at the top of the stack.  Taxa
+            # without children are finished immediately, so only taxa that have children
+            # to visit are pushed onto the stack.
+            while index < len(children) and not(numtaxa > 0 and self.taxacnt >= numtaxa):
+                child = children[index]
+                index += 1
+                processTaxon(child, depth)
+                if enterTaxon(depth) and len(child.children) > 0:
+                    top[3] = index
+                    stack.append([child, depth, child.children, 0])
+                    break
+                postTaxonProcessing(child, depth)
+            else:
+                stack.pop()
+                postTaxonProcessing(taxon, depth - 1)
 
-    def _traverseTree(self, taxon, depth):
+    def iterTree(self, taxon):
         """
-        Internal method for traversing a taxon tree that tracks the recursion depth.
+        A generator that traverses a taxon tree in depth-first order and yields a tuple
+        (taxon, depth, event) when the traversal enters a taxon, with event =
+        TaxonVisitor.ENTER, and again when it leaves the taxon after visiting all of its
+        descendents, with event = TaxonVisitor.EXIT.  The taxa are visited in the same
+        order as by visit(), and the numtaxa, maxdepth, and doRecursion() limits are
+        applied in the same way: ENTER events correspond to calls to processTaxon(), and
+        EXIT events to calls to postTaxonProcessing().  This allows client code to
+        process a taxon tree as a stream, e.g.:
+
+          for taxon, depth, event in TaxonVisitor().iterTree(root):
+              if event == TaxonVisitor.ENTER:
+                  print '   ' * depth + str(taxon)
+
+        The traversal uses an explicit stack rather than recursion, so it is not limited
+        by the maximum Python recursion depth.
         """
-        self.processTaxon(taxon, depth)
+        ENTER = self.ENTER
+        EXIT = self.EXIT
+        enterTaxon = self._enterTaxon
+        numtaxa = self.numtaxa
 
-        self.taxacnt += 1
+        self.taxacnt = 0
 
-        if (self.maxdepth < 0 or depth < self.maxdepth) and self.doRecursion():
-            for child in taxon.children:
-                if self.numtaxa > 0 and self.taxacnt >= self.numtaxa:
+        yield (taxon, 0, ENTER)
+        stack = [self._getRootFrame(taxon)]
+        while stack:
+            top = stack[-1]
+            taxon, depth, children, index = top
+            depth += 1
+
+            while index < len(children) and not(numtaxa > 0 and self.taxacnt >= numtaxa):
+                child = children[index]
+                index += 1
+                yield (child, depth, ENTER)
+                if enterTaxon(depth) and len(child.children) > 0:
+                    top[3] = index
+                    stack.append([child, depth, child.children, 0])
                     break
-                self._traverseTree(child, depth + 1)
+                yield (child, depth, EXIT)
+            else:
+                stack.pop()
+                yield (taxon, depth - 1, EXIT)
+
+    def _enterTaxon(self, depth):
+        """
+        Counts a taxon that has just been processed and returns True if the traversal
+        should descend into the taxon's children.  This is shared by visit() and
+        iterTree(), which maintain a stack of [taxon, depth, children, next child index]
+        frames for the taxa whose children are being visited.
+        """
+        self.taxacnt += 1
+
+        return (self.maxdepth < 0 or depth < self.maxdepth) and self.doRecursion()
 
-        self.postTaxonProcessing(taxon, depth)
+    def _getRootFrame(self, taxon):
+        """
+        Counts the root taxon of a traversal and returns its stack frame.
+        """
+        if self._enterTaxon(0):
+            return [taxon, 0, taxon.children, 0]
+        else:
+            return [taxon, 0, (), 0]
 
     def doRecursion(self):
         """
@@ -66,9 +146,9 @@ class TaxonVisitor:
 
     def postTaxonProcessing(self, taxon, depth):
         """
-        This method is called after tree traversal has returned from recursively
-        traversing taxon's descendents.  It can be overridden by child classes to
-        implement "clean up" code that should be run before leaving a taxon.
+        This method is called after tree traversal has returned from traversing
+        taxon's descendents.  It can be overridden by child classes to implement
+        "clean up" code that should be run before leaving a taxon.
         """
         pass
 